@@ -0,0 +1,141 @@
+"""Renders every arc of many StoryLined project files to images, without a display.
+
+Usage:
+    python batch_render.py stories/ more/story.json -o renders --format png svg --workers 8
+
+Inputs can be project files or directories, which are searched for *.json
+and SQLite (*.sqlite, *.db) project files recursively. Each arc is written to <output>/<project name>/<arc title>.<format>;
+projects with the same name (story.json in two directories) are numbered
+"story (2)" and so on, in the order they were found.
+Edits in a project's journal that were not compacted into it yet are
+included, so renders match what the GUI shows.
+Files are rendered in parallel worker processes, and a summary of per-file
+timings is printed at the end.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from story_cache import CACHE_SUFFIX
+from story_core import render_arc
+from story_export import arc_file_names, safe_file_name
+from story_journal import replay_project
+from story_store import ProjectStore, is_store_path
+
+
+def find_project_files(paths):
+    """Expands directories into the project files they contain."""
+    project_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, dir_names, file_names in os.walk(path):
+                # Render caches next to projects hold JSON files that are not projects
+                dir_names[:] = sorted(name for name in dir_names if not name.endswith(CACHE_SUFFIX))
+                project_files.extend(os.path.join(dir_path, name) for name in sorted(file_names)
+                                     if name.lower().endswith('.json') or is_store_path(name))
+        else:
+            project_files.append(path)
+    # A file given twice, directly or through a directory, is rendered once
+    seen = set()
+    return [path for path in project_files
+            if not (os.path.abspath(path) in seen or seen.add(os.path.abspath(path)))]
+
+
+def project_dir_names(project_files):
+    """Returns the output directory name of each project file: its name
+    without extension, numbered as arc_file_names does when it is taken."""
+    names = []
+    used = set()
+    for project_path in project_files:
+        name = base = safe_file_name(os.path.splitext(os.path.basename(project_path))[0])
+        number = 2
+        while name.lower() in used:
+            name = f"{base} ({number})"
+            number += 1
+        used.add(name.lower())
+        names.append(name)
+    return names
+
+
+def load_project(project_path):
+    """Returns the arcs of a project file: a SQLite project, or a JSON project
+    with the edits in its journal that are not folded into the file yet, as
+    the GUI shows it."""
+    if not is_store_path(project_path):
+        arcs, _, _ = replay_project(project_path)
+        return arcs
+    if not os.path.isfile(project_path):
+        # Opening a missing database would create an empty one
+        raise FileNotFoundError(f"No such file: '{project_path}'")
+    store = ProjectStore(project_path)
+    try:
+        return store.load_all()
+    finally:
+        store.close()
+
+
+def render_project(project_path, project_dir, formats, side_plot_render_mode, dpi):
+    """Renders all arcs of one project file into project_dir. Runs in a worker process.
+
+    Returns (project_path, arc_count, seconds, error), with error None on success.
+    """
+    start = time.perf_counter()
+    try:
+        arcs = load_project(project_path)
+        os.makedirs(project_dir, exist_ok=True)
+        file_names = arc_file_names(arcs)
+        for arc_title, arc_data in arcs.items():
+            for file_format in formats:
+                render_arc(arc_data, os.path.join(project_dir, f"{file_names[arc_title]}.{file_format}"),
+                           side_plot_render_mode=side_plot_render_mode, dpi=dpi)
+        return project_path, len(arcs), time.perf_counter() - start, None
+    except Exception as e:
+        return project_path, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render every arc of StoryLined project files to images.")
+    parser.add_argument('inputs', nargs='+', help="Project files, or directories to search for project files")
+    parser.add_argument('-o', '--output', default='renders', help="Output directory (default: renders)")
+    parser.add_argument('-f', '--format', nargs='+', default=['png'], choices=['png', 'svg', 'pdf'],
+                        help="Image formats to write (default: png)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument('--dpi', type=int, default=100, help="Resolution of raster images (default: 100)")
+    parser.add_argument('--side-plot-render-mode', default='collections', choices=['lines', 'collections'],
+                        help="How side plots are drawn (default: collections)")
+    args = parser.parse_args(argv)
+
+    project_files = find_project_files(args.inputs)
+    if not project_files:
+        print("No project files found.", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = [executor.submit(render_project, path, os.path.join(args.output, dir_name), args.format,
+                                   args.side_plot_render_mode, args.dpi)
+                   for path, dir_name in zip(project_files, project_dir_names(project_files))]
+        for future in as_completed(futures):
+            project_path, arc_count, seconds, error = future.result()
+            results.append((project_path, arc_count, seconds, error))
+            status = f"FAILED ({error})" if error else f"{arc_count} arcs"
+            print(f"{seconds:8.2f}s  {project_path}: {status}")
+
+    failures = [result for result in results if result[3]]
+    total_seconds = time.perf_counter() - start
+    render_seconds = sum(result[2] for result in results)
+    print(f"\nRendered {len(results) - len(failures)} of {len(results)} files "
+          f"({sum(result[1] for result in results)} arcs) in {total_seconds:.2f}s "
+          f"with {args.workers} workers; {render_seconds:.2f}s of rendering in total.")
+    if results:
+        slowest = max(results, key=lambda result: result[2])
+        print(f"Average {render_seconds / len(results):.2f}s per file, slowest {slowest[2]:.2f}s ({slowest[0]}).")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
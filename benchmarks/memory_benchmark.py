@@ -0,0 +1,142 @@
+"""Compares the memory use and scan speed of the in-memory arc forms.
+
+Usage:
+    python benchmarks/memory_benchmark.py --main-points 100000 --side-plots 2
+    python benchmarks/memory_benchmark.py --main-points 100000 -o memory.json
+
+For a synthetic project from story_generator.py, every arc is parsed from JSON
+and converted to the usual in-memory form (story_core.normalize_arc_data) and
+to the compact form (story_compact.CompactArc). For each, the memory the arcs
+hold once parsing is done is measured with tracemalloc, along with the time to
+build them, to read every point's title and description, and to find the
+points containing a word. The compact arcs are also checked to find the same
+points and to convert back to exactly the saved data.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from story_compact import CompactArc
+from story_core import normalize_arc_data
+from story_generator import add_generator_arguments, generate_story, generator_options
+
+
+def scan_arc_data(arc_data):
+    """Reads every point of an arc in the usual form; returns the number of characters seen."""
+    characters = 0
+    side_plots = arc_data['side_plots']
+    for main_id, (title, description, _) in arc_data['main_plot'].items():
+        characters += len(title) + len(description)
+        for points in side_plots.get(main_id, {}).values():
+            for title, description in points:
+                characters += len(title) + len(description)
+    return characters
+
+
+def scan_compact(arc):
+    """Reads every point of a CompactArc; returns the number of characters seen."""
+    return sum(len(title) + len(description) for _, _, _, title, description in arc.points())
+
+
+def find_arc_data(arc_data, word):
+    """Returns the positions of the points of an arc in the usual form containing word, as CompactArc.find."""
+    found = []
+    side_plots = arc_data['side_plots']
+    for main_index, (main_id, point) in enumerate(arc_data['main_plot'].items()):
+        if any(word in field for field in point):
+            found.append((main_index, None, None))
+        for side_plot_index, points in sorted(side_plots.get(main_id, {}).items()):
+            found.extend((main_index, side_plot_index, side_x_index) for side_x_index, side_point in enumerate(points)
+                         if any(word in field for field in side_point))
+    return found
+
+
+FORMS = {
+    'dict': (normalize_arc_data, scan_arc_data, find_arc_data),
+    'compact': (CompactArc.from_saved, scan_compact, CompactArc.find),
+}
+
+# Looked for by the find benchmark: the title of one main plot point, as a search for a particular point would
+FIND_WORD = "Event 4242:"
+
+
+def measure(run, repeats):
+    """Returns the median time of repeats calls of run, and its last result."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def measure_form(text, build, scan, find, repeats):
+    """Returns the arcs built from the project JSON text, and the memory they
+    hold and the median times to build, scan and search them."""
+    gc.collect()
+    tracemalloc.start()
+    arcs = {arc_title: build(data) for arc_title, data in json.loads(text).items()}
+    gc.collect()
+    held_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    parsed = [json.loads(text) for _ in range(repeats)]
+    build_s, _ = measure(lambda: [build(data) for data in parsed.pop().values()], repeats)
+    scan_s, characters = measure(lambda: sum(scan(arc) for arc in arcs.values()), repeats)
+    find_s, found = measure(lambda: {arc_title: find(arc, FIND_WORD) for arc_title, arc in arcs.items()}, repeats)
+    return arcs, {'held_bytes': held_bytes, 'build_s': build_s, 'scan_s': scan_s, 'find_s': find_s,
+                  'characters': characters, 'found': sum(len(positions) for positions in found.values())}, found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the memory use of the in-memory arc forms.")
+    add_generator_arguments(parser)
+    parser.set_defaults(main_points=100000)
+    parser.add_argument('-r', '--repeats', type=int, default=3, help="Runs of each timing (default: 3)")
+    parser.add_argument('-o', '--output', help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    options = generator_options(args)
+    story = generate_story(**options)
+    text = json.dumps(story)
+    point_count = sum(len(arc['main_plot']) + sum(len(points) for side_plot_data in arc['side_plots'].values()
+                                                  for points in side_plot_data.values())
+                      for arc in story.values())
+    del story
+
+    results = {}
+    found = {}
+    for name, (build, scan, find) in FORMS.items():
+        arcs, results[name], found[name] = measure_form(text, build, scan, find, max(1, args.repeats))
+        if name == 'compact':
+            saved = json.loads(text)
+            results[name]['lossless'] = (found['compact'] == found['dict'] and all(
+                json.loads(json.dumps(arc.to_saved())) == saved[arc_title] for arc_title, arc in arcs.items()))
+        del arcs
+
+    print(f"{point_count} points in {options['arcs']} arcs, {len(text) / 1e6:.1f} MB of JSON")
+    print(f"{'form':10} {'memory':>10} {'per point':>10} {'build':>9} {'scan':>9} {'find':>9}")
+    for name, result in results.items():
+        print(f"{name:10} {result['held_bytes'] / 1e6:8.1f}MB {result['held_bytes'] / point_count:8.0f} B "
+              f"{result['build_s'] * 1000:7.0f}ms {result['scan_s'] * 1000:7.0f}ms {result['find_s'] * 1000:7.0f}ms")
+    if not results['compact']['lossless']:
+        print("Compact arcs did not find the same points or convert back to the saved data.", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                                'story': options, 'points': point_count},
+                       'results': results}, f, indent=2)
+    return 0 if results['compact']['lossless'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,363 @@
+"""Times the hot code paths of StoryLined on synthetic projects, without a display.
+
+Usage:
+    python benchmarks/run_benchmarks.py --main-points 2000 -o results.json
+    python benchmarks/run_benchmarks.py --main-points 2000 --compare results.json
+
+Every benchmark drives a StoryPlotter without a window through its own code:
+edits go through StoryPlotter.apply_op (undo history, search index and
+journal or SQLite writes), redraws through StoryPlotter._redraw and saves
+through StoryPlotter.write_plot_data. Only the Tk parts are replaced: plots are
+drawn on an Agg canvas, the content tree is an in-memory stand-in that counts
+row operations, and idle callbacks are run by the benchmarks themselves. Results are written as JSON (median and
+minimum seconds per benchmark), and --compare reports the ratio to an earlier
+results file, exiting with status 1 if any benchmark got slower than --threshold.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matplotlib.backend_bases import MouseButton, MouseEvent
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from main import StoryPlotter
+from story_core import create_arc_figure, normalize_arc_data
+from story_history import EditHistory
+from story_journal import replay_project
+from story_search import SearchIndex
+from story_store import ProjectStore
+from story_generator import add_generator_arguments, generate_story, generator_options
+
+CLICKS = 1000
+OFFSET_LOOKUPS = 10000
+INSERTS = 100
+
+
+class IdleMaster:
+    """Stands in for the Tk root. Callbacks are never run: the benchmarks call
+    StoryPlotter._redraw themselves, as the next idle turn would."""
+
+    def __init__(self):
+        self.ids = itertools.count()
+
+    def after(self, ms, callback, *args):
+        return f"after#{next(self.ids)}"
+
+    def after_idle(self, callback, *args):
+        return f"after#{next(self.ids)}"
+
+    def after_cancel(self, after_id):
+        pass
+
+
+class EmptyVar:
+    """Stands in for the search box, which is left empty."""
+
+    def get(self):
+        return ""
+
+
+class RecordingTree:
+    """Stands in for the ttk.Treeview, keeping the rows in memory."""
+
+    def __init__(self):
+        self.children = {"": []}
+        self.parents = {}
+        self.operations = 0
+
+    def insert(self, parent, index, iid, text=""):
+        self.operations += 1
+        self.children[parent].insert(index, iid)
+        self.children[iid] = []
+        self.parents[iid] = parent
+        return iid
+
+    def delete(self, *iids):
+        for iid in iids:
+            self.operations += 1
+            self.children[self.parents[iid]].remove(iid)
+            self._forget(iid)
+
+    def _forget(self, iid):
+        for child in self.children.pop(iid):
+            self._forget(child)
+        del self.parents[iid]
+
+    def item(self, iid, **options):
+        self.operations += 1
+
+    def get_children(self, iid=""):
+        return tuple(self.children[iid])
+
+
+def copy_arc(serialized_arc):
+    return normalize_arc_data(json.loads(json.dumps(serialized_arc)))
+
+
+def make_plotter(arcs, side_plot_render_mode='collections'):
+    """A StoryPlotter without a window, with the state its editing, drawing,
+    tree and saving code reads. Every arc is in the search index."""
+    plotter = StoryPlotter.__new__(StoryPlotter)
+    plotter.master = IdleMaster()
+    plotter.arcs = arcs
+    plotter.current_arc = next(iter(arcs))
+    plotter.side_plot_render_mode = side_plot_render_mode
+    plotter.background_image_path = None
+    plotter.history = EditHistory()
+    plotter.search_index = SearchIndex()
+    for arc_title, arc_data in arcs.items():
+        plotter.search_index.add_arc(arc_title, arc_data)
+    plotter.search_var = EmptyVar()
+    plotter.store = None
+    plotter.journal = None
+    plotter.watcher = None
+    plotter.watch_project = False
+    plotter.foreign_arcs = set()
+    plotter.hidden_arcs = {}
+    plotter.render_worker = None
+    plotter.render_cache = None
+    plotter.render_cache_mb = 0
+    plotter.cache_writes = {}
+    plotter.previews = {}
+    plotter.dirty = set()
+    plotter.redraw_callback = None
+    plotter.redraw_requests = 0
+    plotter.redraws = 0
+    plotter.treeview = RecordingTree()
+    plotter.tree_arc = None
+    plotter.tree_texts = {}
+    plotter.tree_children = {}
+    # ensure_figure builds a Tk canvas, which needs a display
+    plotter.ensure_figure = lambda arc_title: add_agg_canvas(arcs[arc_title])
+    return plotter
+
+
+def add_agg_canvas(arc_data):
+    """What StoryPlotter.ensure_figure does for an arc, with an Agg canvas."""
+    if 'fig' not in arc_data:
+        arc_data['canvas'] = FigureCanvasAgg(create_arc_figure(arc_data))
+
+
+def update_plot(plotter):
+    """StoryPlotter.update_plot, and the redraw it schedules for the next idle turn."""
+    plotter.update_plot()
+    plotter._redraw()
+
+
+def measure(run, repeats, setup=lambda: None):
+    """Times run(state) repeats times, each with a fresh state from setup()."""
+    times = []
+    for _ in range(repeats):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    return {'median_s': statistics.median(times), 'min_s': min(times), 'repeats': repeats}
+
+
+def run_benchmarks(story, repeats, only=None):
+    first_arc = next(iter(story.values()))
+    results = {}
+
+    def bench(name, run, setup=lambda: None, repeat_count=repeats):
+        if only and only not in name:
+            return
+        results[name] = measure(run, repeat_count, setup)
+        print(f"{results[name]['median_s'] * 1000:10.2f} ms  {name}", file=sys.stderr)
+
+    # --- Plot ---
+    for mode in ('lines', 'collections'):
+        bench(f"update_plot/first_draw/{mode}", update_plot,
+              lambda mode=mode: make_plotter({'Arc': copy_arc(first_arc)}, mode))
+
+        drawn = make_plotter({'Arc': copy_arc(first_arc)}, mode)
+        update_plot(drawn)
+        edits = iter(range(10 ** 9))
+
+        def edit_and_draw(_, plotter=drawn, edits=edits):
+            arc_data = plotter.arcs['Arc']
+            plotter.apply_op({'op': 'edit_main', 'arc': 'Arc', 'index': len(arc_data['main_plot']) // 2,
+                              'point': [f"Edited {next(edits)}", "", ""]})
+            update_plot(plotter)
+
+        bench(f"update_plot/after_edit/{mode}", edit_and_draw)
+
+    # --- Content Tree ---
+    def fresh_tree_plotter():
+        return make_plotter({'Arc': copy_arc(first_arc)})
+
+    def open_all(plotter):
+        arc_data = plotter.arcs['Arc']
+        arc_data['tree_open_rows'] = {f"main:{i}" for i in arc_data['side_plots']}
+        return plotter
+
+    bench("update_treeview/initial", lambda plotter: plotter._sync_treeview(), fresh_tree_plotter)
+    bench("update_treeview/initial_expanded", lambda plotter: plotter._sync_treeview(),
+          lambda: open_all(fresh_tree_plotter()))
+
+    def edited_tree_plotter():
+        plotter = open_all(fresh_tree_plotter())
+        plotter._sync_treeview()
+        plotter.apply_op({'op': 'insert_main', 'arc': 'Arc', 'index': 0, 'point': ["New", "", ""]})
+        return plotter
+
+    bench("update_treeview/after_insert_expanded", lambda plotter: plotter._sync_treeview(), edited_tree_plotter)
+
+    # --- Layout ---
+    offset_plotter = make_plotter({'Arc': copy_arc(first_arc)})
+    main_count = len(offset_plotter.arcs['Arc']['main_plot'])
+    rng = random.Random(0)
+    lookups = [rng.randrange(main_count) for _ in range(OFFSET_LOOKUPS)] if main_count else []
+
+    def offsets(_):
+        for main_index in lookups:
+            offset_plotter.get_offset(main_index, 1)
+
+    bench(f"get_offset/x{OFFSET_LOOKUPS}", offsets)
+
+    # --- Hit Testing ---
+    click_plotter = make_plotter({'Arc': copy_arc(first_arc)})
+    update_plot(click_plotter)
+    click_arc = click_plotter.arcs['Arc']
+    opened = []
+    click_plotter.open_plot_point_editor = lambda *args, **kwargs: opened.append(args)
+    canvas = click_arc['canvas']
+    bbox = click_arc['ax'].bbox
+    clicks = [MouseEvent('button_press_event', canvas, rng.uniform(bbox.x0, bbox.x1), rng.uniform(bbox.y0, bbox.y1),
+                         button=MouseButton.LEFT) for _ in range(CLICKS)]
+
+    def click_all(_):
+        for event in clicks:
+            click_plotter.on_plot_click(event, 'Arc')
+
+    bench(f"on_plot_click/x{CLICKS}", click_all)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # --- Edits ---
+        journaled = []
+
+        def journaled_plotter():
+            # Saved first, so the edits are journaled as in the application
+            while journaled:
+                journaled.pop().journal.close()
+            plotter = make_plotter({'Arc': copy_arc(first_arc)})
+            plotter.write_plot_data(os.path.join(directory, "edits.json"))
+            journaled.append(plotter)
+            return plotter
+
+        def insert_mains(plotter):
+            # What insert_main_plot_point does once its editor is closed, but the redraw that update_plot times
+            arc_data = plotter.arcs['Arc']
+            for _ in range(INSERTS):
+                plotter.apply_op({'op': 'insert_main', 'arc': 'Arc', 'index': len(arc_data['main_plot']) // 2,
+                                  'point': ["Inserted", "", ""]})
+
+        bench(f"insert_main_plot_point/x{INSERTS}", insert_mains, journaled_plotter)
+        while journaled:
+            journaled.pop().journal.close()
+
+        # --- Serialization ---
+        json_path = os.path.join(directory, "story.json")
+        sqlite_path = os.path.join(directory, "story.sqlite")
+        save_plotter = make_plotter({arc_title: copy_arc(arc) for arc_title, arc in story.items()})
+
+        bench("save_plot_data/json", lambda _: save_plotter.write_plot_data(json_path))
+        bench("load_plot_data/json", lambda _: replay_project(json_path))
+
+        # Saving to the SQLite project that is already open writes nothing, so each run starts with none open
+        bench("save_plot_data/sqlite", lambda _: save_plotter.write_plot_data(sqlite_path), save_plotter.close_store)
+        save_plotter.close_store()
+        if save_plotter.journal:
+            save_plotter.journal.close()
+
+        def open_sqlite(_):
+            store = ProjectStore(sqlite_path)
+            store.load_arc(next(iter(story)))
+            store.close()
+
+        bench("load_plot_data/sqlite_first_arc", open_sqlite)
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, threshold):
+    """Prints the change of every benchmark in both result files and returns
+    the names of the ones that got slower than threshold."""
+    regressions = []
+    print(f"{'benchmark':45} {'before':>10} {'after':>10} {'ratio':>7}")
+    for name, result in new['results'].items():
+        if name not in old['results']:
+            continue
+        before = old['results'][name]['median_s']
+        after = result['median_s']
+        ratio = after / before if before else float('inf')
+        flag = "  SLOWER" if ratio > threshold else ""
+        print(f"{name:45} {before * 1000:8.2f}ms {after * 1000:8.2f}ms {ratio:6.2f}x{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark StoryLined on a synthetic project.")
+    add_generator_arguments(parser)
+    parser.add_argument('-r', '--repeats', type=int, default=5, help="Runs per benchmark (default: 5)")
+    parser.add_argument('-k', '--only', help="Only run benchmarks whose name contains this text")
+    parser.add_argument('-o', '--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Compare with the results in this JSON file")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="Slowdown ratio reported as a regression by --compare (default: 1.25)")
+    args = parser.parse_args(argv)
+
+    options = generator_options(args)
+    story = generate_story(**options)
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'matplotlib': matplotlib.__version__,
+            'platform': platform.platform(),
+            'story': options,
+        },
+        'results': run_benchmarks(story, max(1, args.repeats), args.only),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            old = json.load(f)
+        if old['meta'].get('story') != options:
+            print("Warning: the compared results were measured on a different story.", file=sys.stderr)
+        return 1 if compare(old, results, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Times the cold start of StoryLined: importing main.py, and showing the window.
+
+Usage:
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py -r 10 -o startup.json
+
+Each run starts a fresh interpreter with -X importtime and imports main, so
+nothing is cached in the process. The report gives the median total import
+time and the modules that take longest, by cumulative time like -X importtime
+itself (every module is charged with the modules it imports first). With a
+display, each run also creates the StoryPlotter window and times it until
+the window has been drawn once; the presets' auto-load only starts then.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in the child: imports main, then (given a display) shows the window and prints the seconds taken
+WINDOW_SCRIPT = """
+import time
+start = time.perf_counter()
+import tkinter as tk
+import main
+imported = time.perf_counter()
+try:
+    root = tk.Tk()
+except tk.TclError:
+    print('null')
+else:
+    plotter = main.StoryPlotter(root)
+    root.update_idletasks()
+    print(time.perf_counter() - imported)
+"""
+
+
+def parse_importtime(stderr):
+    """Returns {module: (self seconds, cumulative seconds, depth)} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue  # The header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6, depth)
+    return modules
+
+
+def run_once():
+    """Returns the -X importtime modules of one cold start, and the seconds to show the window (or None)."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', WINDOW_SCRIPT], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr), json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the cold start of StoryLined.")
+    parser.add_argument('-r', '--repeats', type=int, default=5, help="Cold starts to time (default: 5)")
+    parser.add_argument('-n', '--top', type=int, default=15, help="Slowest modules to list (default: 15)")
+    parser.add_argument('-o', '--output', help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    runs = [run_once() for _ in range(max(1, args.repeats))]
+    cumulative = {}
+    for modules, _ in runs:
+        for name, (_, seconds, depth) in modules.items():
+            cumulative.setdefault((name, depth), []).append(seconds)
+    medians = {key: statistics.median(times) for key, times in cumulative.items()}
+    import_s = medians.get(('main', 0), 0.0)
+    window_times = [window_s for _, window_s in runs if window_s is not None]
+    window_s = statistics.median(window_times) if window_times else None
+
+    print(f"import main: {import_s * 1000:.0f}ms (median of {len(runs)} cold starts)")
+    if window_s is None:
+        print("window: not timed, no display")
+    else:
+        print(f"window: {window_s * 1000:.0f}ms after the import")
+    print(f"{'cumulative':>11}  module")
+    slowest = sorted(((seconds, name, depth) for (name, depth), seconds in medians.items() if name != 'main'),
+                     reverse=True)[:args.top]
+    for seconds, name, depth in slowest:
+        print(f"{seconds * 1000:9.0f}ms  {'  ' * (depth - 1)}{name}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                                'platform': platform.platform()},
+                       'results': {'import_s': import_s, 'window_s': window_s,
+                                   'modules': {name: seconds for seconds, name, _ in slowest}}}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Generates synthetic StoryLined projects for benchmarking.
+
+Usage:
+    python benchmarks/story_generator.py big_story.json --arcs 5 --main-points 2000 --side-plots 2
+
+The generated file has the same layout as the projects saved by the application,
+so it can be loaded in the GUI or rendered with batch_render.py.
+"""
+import argparse
+import json
+import random
+import sys
+
+WORDS = ("the of a and to in hero village storm river king queen letter secret night journey betrayal "
+         "castle sword ghost promise dream war forest bridge mother brother stranger fire winter").split()
+
+
+def generate_text(rng, word_count):
+    return " ".join(rng.choice(WORDS) for _ in range(word_count)).capitalize()
+
+
+def generate_arc(rng, main_points=1000, side_plots=1, side_plot_length=5, description_words=20,
+                 side_plot_every=4):
+    """Returns the serialized data of one arc: main_points main plot points, where
+    every side_plot_every-th point has side_plots side plots of side_plot_length points."""
+    arc = {
+        'main_plot': [],
+        'side_plots': {},
+        'side_plot_counts': {},
+        'subplot_colors': {},
+        'marker_style': 'o',
+        'background_image_path': None,
+        'x_axis_labels': {}
+    }
+    for i in range(main_points):
+        arc['main_plot'].append([f"Event {i}: {generate_text(rng, 3)}",
+                                 generate_text(rng, description_words),
+                                 f"Ch {i // 10 + 1}" if i % 10 == 0 else ""])
+        if side_plots and side_plot_every and i % side_plot_every == 0:
+            # Keys are strings, as in a project file
+            arc['side_plots'][str(i)] = {
+                str(s): [[f"Side {i}.{s}.{j}", generate_text(rng, description_words)]
+                         for j in range(side_plot_length)]
+                for s in range(1, side_plots + 1)
+            }
+            arc['side_plot_counts'][str(i)] = side_plots
+            arc['subplot_colors'][str(i)] = "#%06x" % rng.randrange(0x1000000)
+    return arc
+
+
+def generate_story(arcs=1, seed=0, **arc_options):
+    """Returns a serialized project ({arc_title: arc data}) of synthetic arcs.
+    arc_options are passed on to generate_arc."""
+    rng = random.Random(seed)
+    return {f"Arc {n + 1}": generate_arc(rng, **arc_options) for n in range(arcs)}
+
+
+def add_generator_arguments(parser):
+    parser.add_argument('--arcs', type=int, default=1, help="Number of arcs (default: 1)")
+    parser.add_argument('--main-points', type=int, default=1000, help="Main plot points per arc (default: 1000)")
+    parser.add_argument('--side-plots', type=int, default=1,
+                        help="Side plots per main plot point that has any (default: 1)")
+    parser.add_argument('--side-plot-every', type=int, default=4,
+                        help="Every n-th main plot point has side plots (default: 4)")
+    parser.add_argument('--side-plot-length', type=int, default=5, help="Points per side plot (default: 5)")
+    parser.add_argument('--description-words', type=int, default=20, help="Words per description (default: 20)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+
+
+def generator_options(args):
+    return dict(arcs=args.arcs, seed=args.seed, main_points=args.main_points, side_plots=args.side_plots,
+                side_plot_every=args.side_plot_every, side_plot_length=args.side_plot_length,
+                description_words=args.description_words)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic StoryLined project file.")
+    parser.add_argument('output', help="Project file to write")
+    add_generator_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with open(args.output, 'w') as f:
+        json.dump(generate_story(**generator_options(args)), f)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
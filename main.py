@@ -1,19 +1,111 @@
-import matplotlib
 import tkinter as tk
 from tkinter import ttk, simpledialog, messagebox, scrolledtext, filedialog
-import matplotlib.pyplot as plt
-import matplotlib.lines as mlines
 from matplotlib.backend_bases import MouseButton
 import random
 import json
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-import matplotlib.patches as mpatches
-import matplotlib.image as mpimg
-import numpy as np
-import matplotlib.image as mpimg
-import numpy as np
 from PIL import Image, ImageTk
 import os
+from collections import OrderedDict
+import hashlib
+import queue
+import threading
+from story_core import (FIGURE_KEYS, new_arc_data, serialize_arc_data, get_layout, side_plots_of, apply_op,
+                        inverse_ops, diff_arc_ops, snapshot_arc_data, RenderWorker,
+                        create_arc_figure, draw_arc, draw_background, draw_x_labels, draw_highlight)
+from story_journal import ProjectJournal, replay_project
+from story_store import ProjectStore, is_store_path
+from story_search import SearchIndex
+from story_export import EXPORT_FORMATS, export_arcs
+from story_watch import ProjectWatcher
+from story_cache import DEFAULT_CACHE_MB, RenderCache, cache_dir_for
+from story_background import BackgroundResizer
+from story_history import EditHistory
+from story_trace import TRACE_ENV, tracer, traced
+
+# How far (in pixels) from a plot point a left-click still selects it
+PICK_RADIUS_PIXELS = 10
+
+# The journal is folded into the project file this often, or after this many edits
+COMPACT_INTERVAL_MS = 60 * 1000
+COMPACT_AFTER_OPS = 500
+
+# Loading adds this many arc tabs per Tk event-loop turn, checking for the parsed file this often
+LOAD_CHUNK_ARCS = 5
+LOAD_POLL_MS = 50
+
+# The search box lists at most this many hits
+MAX_SEARCH_RESULTS = 100
+
+# The tracing overlay is refreshed this often
+TRACE_OVERLAY_MS = 500
+
+# With background rendering, finished renders are picked up this often
+RENDER_POLL_MS = 15
+
+# While exporting all arcs, progress is picked up this often
+EXPORT_POLL_MS = 100
+
+# With the "watch_project" preset, changes found by the project watcher are picked up this often
+WATCH_POLL_MS = 250
+
+# A tab showing a cached raster builds its live figure after this long, unless it is used first
+PREVIEW_LIVE_MS = 500
+
+# An arc's raster is cached once it has been left unchanged this long
+CACHE_WRITE_DELAY_MS = 2000
+
+# The window background is resized once the window has kept its size this long,
+# and finished resizes are picked up this often
+BACKGROUND_DEBOUNCE_MS = 150
+BACKGROUND_POLL_MS = 30
+
+
+class TracedCanvas(FigureCanvasTkAgg):
+    """Tk canvas that times its draws, which draw_idle defers to an idle callback.
+
+    If render_elsewhere is set, a draw calls it instead of rendering on the Tk
+    thread, and the pixels are shown later with show_pixels, in a photo image
+    of this canvas's own drawn over matplotlib's. prepare_print is called
+    before the figure is saved, to put the artists on it first."""
+
+    render_elsewhere = None
+    prepare_print = None
+    shown_photo = None  # tk.PhotoImage of the pixels passed to show_pixels
+    shown_item = None  # Canvas item showing it
+
+    def draw(self):
+        if self.render_elsewhere:
+            self.render_elsewhere()
+            return
+        with tracer.span("canvas.draw"):
+            super().draw()
+        tracer.count('draws')
+
+    def show_pixels(self, pixels):
+        """Shows an RGBA array of the canvas size."""
+        # Handed to the photo as binary PPM, which Tk's photo image reads itself.
+        # PPM has no alpha, so the pixels are blended over the canvas background first.
+        widget = self.get_tk_widget()
+        background = tuple(value >> 8 for value in widget.winfo_rgb(widget.cget('background')))
+        image = Image.fromarray(pixels)
+        shown = Image.new('RGB', image.size, background)
+        shown.paste(image, mask=image)
+        width, height = image.size
+        if self.shown_photo is None:
+            self.shown_photo = tk.PhotoImage(master=widget, width=width, height=height)
+            self.shown_item = widget.create_image(0, 0, anchor='nw', image=self.shown_photo)
+        elif (self.shown_photo.width(), self.shown_photo.height()) != (width, height):
+            self.shown_photo.configure(width=width, height=height)
+        self.shown_photo.put(b'P6 %d %d 255\n' % (width, height) + shown.tobytes())
+        widget.tag_raise(self.shown_item)  # Above matplotlib's image, which a resize creates again
+        tracer.count('draws')
+
+    def print_figure(self, *args, **kwargs):
+        if self.prepare_print:
+            self.prepare_print()
+        return super().print_figure(*args, **kwargs)
+
 
 class StoryPlotter:
     def __init__(self, master):
@@ -34,40 +126,384 @@ class StoryPlotter:
             "Diamond": "D"
         }
         self.background_image_path = None
+        # The background of the current arc is also shown behind the window, resized
+        # to it by a BackgroundResizer thread (see story_background)
+        self.window_background_path = None
+        self.background_image = None  # PhotoImage shown
+        self.background_resizer = None
+        self.background_resize = None  # Pending after id of a debounced resize
+        self.background_poll = None  # Pending after id while a resize is outstanding
+        self.background_error = None  # Path whose error was shown, so switching arcs does not repeat it
+        # 'lines' draws one Line2D per side plot element, 'collections' batches
+        # all side plot segments and markers of an arc into two collections
+        self.side_plot_render_mode = 'lines'
+
+        # --- Live Canvases ---
+        # Figures are created when an arc is first shown; only the most recently
+        # shown arcs keep one, the others fall back to plain data.
+        self.live_canvases = OrderedDict()  # {arc_title: None}, least recently shown first
+        self.max_live_canvases = 5
+
+        # --- Journal / Store ---
+        # Edits to a loaded or saved JSON project are journaled next to its file
+        # (see story_journal); edits to a SQLite project are written to it directly
+        # (see story_store). At most one of the two is open.
+        self.journal = None
+        self.store = None
+        self.loading = False  # A project is being added tab by tab, so it must not be compacted yet
+        # Arcs that were open when a project was loaded are not part of it: they
+        # are not journaled or written to it until it is saved explicitly. The
+        # project's own arcs whose titles they hold are kept aside as saved, so
+        # compactions write them back unchanged.
+        self.foreign_arcs = set()
+        self.hidden_arcs = {}  # {arc_title: saved arc data}
+        # With the "watch_project" preset, a JSON project changed on disk by another
+        # program is reloaded, applying only the arcs and points that differ (see story_watch)
+        self.watch_project = False
+        self.watcher = None
+
+        # --- Search ---
+        # Kept up to date by apply_op; arcs that were loaded are indexed on the first search
+        self.search_index = SearchIndex()
+        self.search_hits = []  # [(arc_title, main_index, side_plot_index, side_x_index, title)] as listed
+
+        # --- Redraw Scheduling ---
+        # update_plot, update_treeview and update_xlabels only mark what is out of
+        # date; one idle callback per event-loop turn then redraws it once.
+        self.dirty = set()  # Of 'plot', 'labels', 'tree' and 'canvas'
+        self.redraw_callback = None  # Pending after_idle id
+        self.redraw_requests = 0  # Canvas redraws asked for
+        self.redraws = 0  # Canvas redraws actually done
+
+        # --- Background Rendering ---
+        # With the "render_in_background" preset, the Tk thread only keeps the
+        # axis limits and hit-testing index of a figure; its pixels are rendered
+        # by a RenderWorker thread from a snapshot of the arc and shown when done.
+        self.render_in_background = False
+        self.render_worker = None
+        self.render_poll = None  # Pending after id while renders are outstanding
+        self.render_error = None  # Last render error shown, so it is not repeated for every frame
+
+        # --- Export ---
+        # "Export All" renders every arc on a thread (see story_export); setting
+        # export_cancel stops it after the files being rendered.
+        self.export_cancel = None  # threading.Event while an export runs
+
+        # --- Render Cache ---
+        # Rasters of the arcs of a saved project are cached next to its file (see
+        # story_cache), so a tab showing an unchanged arc shows the raster at once
+        # and builds its live figure when idle or first used. "render_cache_mb"
+        # caps the cache; 0 turns it off.
+        self.render_cache_mb = DEFAULT_CACHE_MB
+        self.render_cache = None
+        self.previews = {}  # {arc_title: tk.Label showing the cached raster}
+        self.cache_writes = {}  # {arc_title: pending after id}
+
+        # --- Undo ---
+        # The history keeps the inverse of each edit, up to undo_depth edits or undo_memory_mb in total
+        self.undo_depth = 100
+        self.undo_memory_mb = 50
+
+        # --- Tracing ---
+        # Timing spans and counters (see story_trace), off unless enabled by
+        # STORYLINED_TRACE or the "trace" preset. trace_path gets the trace on quit.
+        self.trace_enabled = False
+        self.trace_path = None
 
         self.load_presets()
+        trace_env = os.environ.get(TRACE_ENV, "")
+        if trace_env not in ("", "0"):
+            self.trace_enabled = True
+            if trace_env != "1":
+                self.trace_path = trace_env
+        tracer.enabled = self.trace_enabled
+        self.history = EditHistory(self.undo_depth, self.undo_memory_mb * 1024 * 1024)
+        if self.render_in_background:
+            self.render_worker = RenderWorker(self.max_live_canvases)
 
         # --- GUI and Plot Setup ---
         self.setup_gui()
+        master.protocol("WM_DELETE_WINDOW", self.quit)
         if self.auto_load_preset:
-            self.load_plot_data(self.load_data_path_preset, startup=True)
+            # Loaded once the event loop runs, so the window shows (with the loading progress) right away
+            self.master.after_idle(self.load_plot_data, self.load_data_path_preset, True)
+        self.master.after(COMPACT_INTERVAL_MS, self.autosave)
+
+    def apply_op(self, op, record=True):
+        """Performs an edit operation (see story_core.apply_op) and journals it.
+        Unless record is false, the edit can be undone."""
+        if op['arc'] in self.previews:
+            self.build_live_figure(op['arc'])  # The cached raster no longer matches
+        if record:
+            self.history.record([op], inverse_ops(self.arcs, op))
+        apply_op(self.arcs, op)
+        self.search_index.apply_op(op)
+        if self.search_var.get():
+            self.master.after_idle(self.on_search)  # Hits may have moved or changed
+        if op['arc'] in self.foreign_arcs:
+            return  # Written once the project is saved
+        if self.store:
+            self.store.apply_op(op)
+        if self.journal:
+            self.journal.record(op)
+            if self.journal.ops_since_compaction >= COMPACT_AFTER_OPS:
+                self.compact_journal()
+
+    def undo(self):
+        """Reverts the last edit."""
+        ops = self.history.undo()
+        if ops:
+            self._apply_history_ops(ops)
+
+    def redo(self):
+        """Performs the last undone edit again."""
+        ops = self.history.redo()
+        if ops:
+            self._apply_history_ops(ops)
+
+    def _apply_history_ops(self, ops):
+        """Applies the operations of an undo or redo and shows the arc they changed.
+        Only the artists and tree rows that differ are redrawn."""
+        for op in ops:
+            if op['op'] == 'delete_arc':
+                self._remove_arc_tab(op['arc'])
+            self.apply_op(op, record=False)
+            if op['op'] == 'add_arc':
+                self._add_arc_tab(op['arc'])
+
+        arc_title = ops[-1]['arc']
+        if arc_title not in self.arcs:
+            self._arc_removed(arc_title)
+        elif arc_title != self.current_arc:
+            self.select_arc(arc_title)
+        else:
+            self.on_tab_changed(None)
+
+    def open_journal(self, project_path, base, restart=False):
+        """Starts journaling edits to project_path, whose file has SHA-1 base."""
+        self.close_store()
+        if self.journal:
+            self.journal.close()
+        self.journal = ProjectJournal(project_path, base, restart=restart)
+        self.open_render_cache(project_path)
+        if self.watch_project and not (self.watcher and self.watcher.project_path == project_path):
+            self.stop_watching()
+            self.watcher = ProjectWatcher(project_path, base)
+            self.master.after(WATCH_POLL_MS, self._poll_watch, self.watcher)
+
+    def stop_watching(self):
+        if self.watcher:
+            self.watcher.close()
+            self.watcher = None
+
+    def _poll_watch(self, watcher):
+        if watcher is not self.watcher:
+            return  # Replaced by a watcher of another project
+        if not self.loading:
+            try:
+                while True:
+                    digest, changed = watcher.changes.get_nowait()
+                    # The application's own saves and compactions are not changes
+                    if self.journal and not self.journal.wrote(digest):
+                        self.reload_changed_arcs(changed, digest)
+            except queue.Empty:
+                pass
+        self.master.after(WATCH_POLL_MS, self._poll_watch, watcher)
+
+    @traced("reload_changed_arcs")
+    def reload_changed_arcs(self, changed, digest):
+        """Takes over the arcs another program changed in the project file
+        ({arc_title: new arc data, or None if it was removed}; digest is the
+        SHA-1 of the file). Each arc is diffed against the one in memory, so
+        only the points that differ are updated, drawn and journaled, and the
+        reload of each arc is undone as one edit."""
+        unsaved_edits = self.journal.ops_since_compaction
+        for arc_title, data in changed.items():
+            if arc_title in self.foreign_arcs:
+                # The open arc of that title is from elsewhere, so the project's is only kept aside
+                if data is None:
+                    self.hidden_arcs.pop(arc_title, None)
+                else:
+                    self.hidden_arcs[arc_title] = serialize_arc_data(data)
+                continue
+            if data is None:
+                self.delete_arc(arc_title)
+            elif arc_title not in self.arcs:
+                self.apply_op({'op': 'add_arc', 'arc': arc_title, 'data': serialize_arc_data(data)})
+                self._add_arc_tab(arc_title)
+            else:
+                ops = diff_arc_ops(arc_title, self.ensure_arc_loaded(arc_title), data)
+                if ops is None:
+                    # Changed in a way point operations cannot express, so the arc is replaced
+                    ops = [{'op': 'delete_arc', 'arc': arc_title},
+                           {'op': 'add_arc', 'arc': arc_title, 'data': serialize_arc_data(data)}]
+                if ops:
+                    self._apply_reload_ops(arc_title, ops)
+
+        if unsaved_edits:
+            # The file lacks the edits made here since it was last written, so it is rewritten with both
+            self.compact_journal()
+        else:
+            # The arcs now match the file, so further edits are journaled against it
+            self.open_journal(self.journal.project_path, digest, restart=True)
+
+    def _apply_reload_ops(self, arc_title, ops):
+        was_current = arc_title == self.current_arc
+        inverse = []
+        for op in ops:
+            inverse[:0] = inverse_ops(self.arcs, op)
+            if op['op'] == 'delete_arc':
+                self._remove_arc_tab(arc_title)
+            self.apply_op(op, record=False)
+            if op['op'] == 'add_arc':
+                self._add_arc_tab(arc_title)
+        self.history.record(ops, inverse)
+        if was_current:
+            # A replaced arc gets a new tab, which is shown in place of the old one
+            self.notebook.select(self.arcs[arc_title]['frame'])
+            self.on_tab_changed(None)
+
+    def open_store(self, store):
+        """Starts writing edits to a SQLite project instead of a journal."""
+        self.stop_watching()
+        if self.journal:
+            if self.journal.ops_since_compaction:
+                self.compact_journal()
+            self.journal.close()
+            self.journal = None
+        self.close_store()
+        self.store = store
+        self.open_render_cache(store.path)
+
+    def open_render_cache(self, project_path):
+        """Starts caching rasters of the arcs in the cache directory of project_path."""
+        if self.render_cache and self.render_cache.cache_dir == cache_dir_for(project_path):
+            return
+        self.close_render_cache()
+        if self.render_cache_mb > 0:
+            try:
+                self.render_cache = RenderCache(cache_dir_for(project_path), self.render_cache_mb * 1024 * 1024)
+            except OSError as e:
+                print(f"Render cache disabled: {e}")
+
+    def close_render_cache(self):
+        """Closes the render cache. Arcs still waiting to be cached are not, so
+        closing does not wait for them to render."""
+        for after_id in self.cache_writes.values():
+            self.master.after_cancel(after_id)
+        self.cache_writes.clear()
+        if self.render_cache:
+            self.render_cache.close()
+            self.render_cache = None
+
+    def close_store(self):
+        """Reads the arcs not loaded yet from the open SQLite project and closes it."""
+        if self.store:
+            self.load_all_arcs()
+            self.store.close()
+            self.store = None
+
+    def ensure_arc_loaded(self, arc_title):
+        """Reads an arc of a SQLite project the first time it is needed."""
+        arc_data = self.arcs[arc_title]
+        if arc_data.get('lazy'):
+            loaded = self.store.load_arc(arc_title)
+            loaded['frame'] = arc_data['frame']
+            self.arcs[arc_title] = arc_data = loaded
+            self.search_index.defer_arc(arc_title, loaded)
+        return arc_data
+
+    def load_all_arcs(self):
+        for arc_title in list(self.arcs):
+            self.ensure_arc_loaded(arc_title)
+
+    def compact_journal(self):
+        """Folds the journal into the project file, off the Tk thread."""
+        if self.journal and not self.loading:
+            self.journal.compact(self.project_data())
+
+    def project_data(self):
+        """Returns the serializable arcs of the open project ({arc_title: saved
+        arc data}), leaving out the arcs that are not part of it."""
+        data = {arc_title: serialize_arc_data(arc_data) for arc_title, arc_data in self.arcs.items()
+                if arc_title not in self.foreign_arcs}
+        data.update(self.hidden_arcs)
+        return data
+
+    def autosave(self):
+        self.report_journal_errors()
+        if self.journal and self.journal.ops_since_compaction:
+            self.compact_journal()
+        self.master.after(COMPACT_INTERVAL_MS, self.autosave)
+
+    def report_journal_errors(self):
+        """Shows the writes of the journal that failed since the last call."""
+        errors = []
+        while self.journal:
+            try:
+                errors.append(self.journal.errors.get_nowait())
+            except queue.Empty:
+                break
+        if errors:
+            messagebox.showerror("Save Failed",
+                                 f"Edits could not be written to {self.journal.project_path}: {errors[-1]}\n\n"
+                                 f"They are written again with the next edit; to be safe, save the project elsewhere.")
+
+    def quit(self):
+        """Writes out pending edits and closes the application."""
+        if tracer.enabled:
+            print(self.redraw_report())
+            print(tracer.summary())
+            if self.trace_path:
+                tracer.export_chrome_trace(self.trace_path)
+        if self.journal:
+            if self.journal.ops_since_compaction:
+                self.compact_journal()
+            self.journal.close()
+            self.report_journal_errors()
+        if self.store:
+            self.store.close()
+        if self.render_worker:
+            self.render_worker.close()
+        self.cancel_export()
+        self.stop_watching()
+        self.close_render_cache()
+        if self.background_resizer:
+            self.background_resizer.close()
+        self.master.destroy()
 
     def delete_arc(self, arc_title):
         """Deletes an arc and its associated data and tab."""
         if arc_title in self.arcs:
-            # Remove the tab from the notebook
-            for i, tab_id in enumerate(self.notebook.tabs()):
-                if self.notebook.tab(tab_id, "text") == arc_title:
-                    self.notebook.forget(tab_id)
-                    break
+            self.ensure_arc_loaded(arc_title)  # Undoing the deletion needs its data
+            self._remove_arc_tab(arc_title)
 
             # Delete the arc data
-            del self.arcs[arc_title]
-
-            # Update current_arc if the deleted arc was the current one
-            if self.current_arc == arc_title:
-                self.current_arc = None
-                if self.notebook.tabs():  # If there are still tabs left
-                    new_current_tab_id = self.notebook.select()
-                    self.current_arc = self.notebook.tab(new_current_tab_id, "text")
-                    self.on_tab_changed(None) # Update visuals
-                else:
-                    # Handle the case where no tabs are left (optional)
-                    # You could create a new empty arc, or just clear the display
-                    pass
+            self.apply_op({'op': 'delete_arc', 'arc': arc_title})
+            self._arc_removed(arc_title)
+
+    def _remove_arc_tab(self, arc_title):
+        # Release the figure and remove the tab from the notebook
+        self.release_figure(arc_title)
+        frame = self.arcs[arc_title]['frame']
+        self.notebook.forget(frame)
+        frame.destroy()
+
+    def _arc_removed(self, arc_title):
+        # Update current_arc if the deleted arc was the current one
+        if self.current_arc == arc_title:
+            self.current_arc = None
+            if self.notebook.tabs():  # If there are still tabs left
+                new_current_tab_id = self.notebook.select()
+                self.current_arc = self.notebook.tab(new_current_tab_id, "text")
+                self.on_tab_changed(None) # Update visuals
+            else:
+                # Handle the case where no tabs are left (optional)
+                # You could create a new empty arc, or just clear the display
+                pass
 
-            # Update treeview
-            self.update_treeview()
+        # Update treeview
+        self.update_treeview()
 
     def setup_gui(self):
         # --- Main Frame ---
@@ -91,11 +527,30 @@ class StoryPlotter:
         title_label = tk.Label(self.left_frame, text="Content", font=("Arial", 14, "bold"), bg="#f0f0f0")
         title_label.pack(side="top", fill="x", padx=5, pady=5)
 
+        # --- Search (hits are listed above the tree while there is a query) ---
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(self.left_frame, textvariable=self.search_var, font=("Arial", 12))
+        self.search_entry.pack(side="top", fill="x", padx=5, pady=(0, 5))
+        self.search_var.trace_add("write", lambda *args: self.on_search())
+        self.search_results = tk.Listbox(self.left_frame, font=("Arial", 11), height=8, exportselection=False)
+        self.search_results.bind("<<ListboxSelect>>", self.on_search_result_select)
+
         # --- Treeview ---
         self.treeview = ttk.Treeview(self.left_frame, style="Treeview")  # Use a custom style
         style.configure("Treeview", font=("Arial", 12), rowheight=25)  # Increase font size and row height
         self.treeview.pack(fill="both", expand=True)
         self.treeview.bind("<<TreeviewSelect>>", self.on_treeview_select)
+        self.treeview.bind("<<TreeviewOpen>>", self.on_treeview_open)
+        self.treeview.bind("<<TreeviewClose>>", self.on_treeview_close)
+
+        # Mirror of the tree contents, so updates only touch rows that changed.
+        # Item IIDs are derived from the data model: "main:<id>", "side:<id>:<s>",
+        # "point:<id>:<s>:<j>", plus "pending:<id>" for children not filled in yet,
+        # with <id> the id of the main plot point (see story_core.MainPlot), so a
+        # row keeps its IID when points are inserted or deleted before it.
+        self.tree_arc = None  # Arc the tree currently shows
+        self.tree_texts = {}  # {iid: text}
+        self.tree_children = {}  # {parent iid: [child iids]}
 
         # --- Right Frame (Tabs and Controls) ---
         self.right_frame = tk.Frame(self.frame, bg="#f0f0f0")
@@ -132,6 +587,15 @@ class StoryPlotter:
         )
         self.add_arc_button.pack(side="left", padx=5, pady=5)
 
+        self.undo_button = ttk.Button(self.button_frame, text="Undo", style="TButton", command=self.undo)
+        self.undo_button.pack(side="left", padx=5, pady=5)
+        self.redo_button = ttk.Button(self.button_frame, text="Redo", style="TButton", command=self.redo)
+        self.redo_button.pack(side="left", padx=5, pady=5)
+        self.master.bind("<Control-z>", lambda event: self.undo())
+        self.master.bind("<Control-y>", lambda event: self.redo())
+        self.master.bind("<Control-Z>", lambda event: self.redo())
+        self.master.bind("<Configure>", self.on_window_configure, add="+")
+
         self.marker_options = ttk.Combobox(
             self.button_frame,
             values=list(self.available_markers.keys()),
@@ -163,14 +627,51 @@ class StoryPlotter:
         )
         self.load_button.pack(side="right", padx=5, pady=5)
 
+        self.export_button = ttk.Button(
+            self.button_frame,
+            text="Export All", style="TButton",
+            command=self.export_all_arcs
+        )
+        self.export_button.pack(side="right", padx=5, pady=5)
+
+        # --- Load / Export Progress (shown while a project is loading or being exported) ---
+        self.progress_label = tk.Label(self.button_frame, font=("Arial", 11), bg="#f0f0f0")
+        self.progress_bar = ttk.Progressbar(self.button_frame, mode="determinate", length=150)
+        self.cancel_export_button = ttk.Button(self.button_frame, text="Cancel", style="TButton",
+                                               command=self.cancel_export)
+
         self.quit_button = ttk.Button(
             self.button_frame,
             text="Quit", style="TButton",
-            command=self.master.destroy
+            command=self.quit
         )
         self.quit_button.pack(side="right", padx=5, pady=5)
+
+        # --- Tracing Overlay (only while tracing) ---
+        if tracer.enabled:
+            self.trace_overlay = tk.Label(self.master, font=("Courier", 9), justify="left", anchor="nw",
+                                          bg="#ffffe0", relief="solid", borderwidth=1)
+            self.trace_overlay.place(relx=1.0, rely=0.0, anchor="ne")
+            self.master.bind("<F12>", lambda event: self.export_trace())
+            self.update_trace_overlay()
+
+    def update_trace_overlay(self):
+        tracer.sample_counters()
+        self.trace_overlay.configure(text=tracer.summary() or "Tracing: no spans yet\nF12 exports a trace")
+        self.trace_overlay.lift()
+        self.master.after(TRACE_OVERLAY_MS, self.update_trace_overlay)
+
+    def export_trace(self):
+        """Saves the collected spans as Chrome trace-event JSON."""
+        file_path = filedialog.asksaveasfilename(
+            title="Export Trace",
+            defaultextension=".json",
+            filetypes=[("Trace files", "*.json")]
+        )
+        if file_path:
+            tracer.export_chrome_trace(file_path)
 # In add_new_arc, when creating a tab, create and store the plot elements
-    def add_new_arc(self, arc_title=None, data=None):
+    def add_new_arc(self, arc_title=None, data=None, select=True):
         if arc_title is None:
             arc_title = simpledialog.askstring("New Arc", "Enter arc title:", parent=self.master)
         if arc_title:
@@ -178,59 +679,152 @@ class StoryPlotter:
                 messagebox.showerror("Error", f"Arc with title '{arc_title}' already exists!")
                 return
 
-            # If data is provided, use it; otherwise, create empty data
+            # If data is provided (a loaded arc, already in memory form), use it; otherwise, create empty data
             if data:
                 self.arcs[arc_title] = data
+                self.search_index.defer_arc(arc_title, self.arcs[arc_title])
             else:
-                self.arcs[arc_title] = {
-                    'main_plot': [],
-                    'side_plots': {},
-                    'side_plot_counts': {},
-                    'subplot_colors': {},
-                    'marker_style': self.marker_style,
-                    'background_image_path': None,
-                    'x_axis_labels': {}
-                }
-
-            # --- Create a new tab ---
-            frame = tk.Frame(self.notebook)
-            self.notebook.add(frame, text=arc_title)
+                self.foreign_arcs.discard(arc_title)  # A new arc belongs to the open project
+                self.apply_op({'op': 'add_arc', 'arc': arc_title, 'data': new_arc_data(self.marker_style)})
+
+            self._add_arc_tab(arc_title)
+
+            if select:
+                self.select_arc(arc_title)
+
+    def _add_arc_tab(self, arc_title):
+        # --- Create a new tab ---
+        # The figure and canvas are only created once the tab is shown (see ensure_figure)
+        frame = tk.Frame(self.notebook)
+        self.notebook.add(frame, text=arc_title)
+        self.arcs[arc_title]['frame'] = frame
+
+    def select_arc(self, arc_title):
+        """Switches to the tab of an arc and draws it."""
+        self.current_arc = arc_title
+        self.notebook.select(self.arcs[arc_title]['frame'])
+        self.update_plot()
+        self.update_treeview()
+
+    def ensure_figure(self, arc_title):
+        """Creates the figure and canvas of an arc the first time it is shown and
+        marks it as most recently used, releasing the least recently used
+        canvases beyond max_live_canvases."""
+        arc_data = self.arcs[arc_title]
+        if 'fig' not in arc_data:
+            frame = arc_data['frame']
 
             # --- Create plot elements within the tab ---
-            fig, ax = plt.subplots(figsize=(8, 6), facecolor="#e6e6e6")
-            fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.spines['bottom'].set_visible(False)
-            ax.spines['left'].set_visible(False)
-
-            canvas = FigureCanvasTkAgg(fig, master=frame)
+            fig = create_arc_figure(arc_data)
+
+            canvas = TracedCanvas(fig, master=frame)
             canvas_widget = canvas.get_tk_widget()
             canvas_widget.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
             canvas.mpl_connect('button_press_event',
                                lambda event, a=arc_title: self.on_plot_click(event, a))
+            if self.render_worker:
+                canvas.render_elsewhere = lambda a=arc_title: self.request_render(a)
+                canvas.prepare_print = lambda a=arc_title: self.draw_artists(a)
 
             toolbar = NavigationToolbar2Tk(canvas, frame, pack_toolbar=False)
             toolbar.update()
             toolbar.pack(side=tk.TOP, fill=tk.X)
 
             # --- Store references in arc data ---
-            self.arcs[arc_title]['fig'] = fig
-            self.arcs[arc_title]['ax'] = ax
-            self.arcs[arc_title]['canvas'] = canvas
-            self.arcs[arc_title]['toolbar'] = toolbar
-
-            self.current_arc = arc_title
-            self.notebook.select(len(self.notebook.tabs()) - 1)  # Switch to the new tab
+            arc_data['canvas'] = canvas
+            arc_data['toolbar'] = toolbar
+
+        self.live_canvases[arc_title] = None
+        self.live_canvases.move_to_end(arc_title)
+        while len(self.live_canvases) > self.max_live_canvases:
+            self.release_figure(next(iter(self.live_canvases)))
+
+    def release_figure(self, arc_title):
+        """Destroys the canvas of an arc and drops its figure, keeping the plain data."""
+        preview = self.previews.pop(arc_title, None)
+        if preview:
+            preview.destroy()
+        if arc_title in self.cache_writes:
+            # Cached now, while the canvas is there to size it
+            self.master.after_cancel(self.cache_writes[arc_title])
+            self.write_cache(arc_title)
+        self.live_canvases.pop(arc_title, None)
+        if self.render_worker:
+            self.render_worker.forget(arc_title)
+        arc_data = self.arcs.get(arc_title)
+        if arc_data is None or 'fig' not in arc_data:
+            return
+        arc_data['toolbar'].destroy()
+        arc_data['canvas'].get_tk_widget().destroy()
+        arc_data['fig'].clear()
+        for key in FIGURE_KEYS:
+            arc_data.pop(key, None)
+
+    def show_preview(self, arc_title):
+        """Shows the cached raster of an arc that has no figure, if it has one,
+        and schedules building the live figure. Returns whether it did."""
+        if arc_title in self.previews:
+            self.master.after(PREVIEW_LIVE_MS, self.build_live_figure, arc_title, True)
+            return True
+        if not self.render_cache:
+            return False
+        arc_data = self.arcs[arc_title]
+        with tracer.span("render_cache.get"):
+            cached = self.render_cache.get(serialize_arc_data(arc_data), self.side_plot_render_mode)
+        if not cached:
+            return False
+        try:
+            image = tk.PhotoImage(file=cached[0])
+        except tk.TclError:
+            return False
+        preview = tk.Label(arc_data['frame'], image=image, bd=0)
+        preview.image = image  # Tk does not keep a reference to it
+        preview.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        # Any click on it builds the live figure straight away
+        preview.bind("<Button>", lambda event, a=arc_title: self.build_live_figure(a))
+        self.previews[arc_title] = preview
+        tracer.count('cached_previews')
+        self.master.after(PREVIEW_LIVE_MS, self.build_live_figure, arc_title, True)
+        return True
+
+    def build_live_figure(self, arc_title, when_shown=False):
+        """Replaces the cached raster of an arc with its live figure. With
+        when_shown set, this waits until the arc's tab is shown."""
+        if arc_title not in self.previews or (when_shown and arc_title != self.current_arc):
+            return
+        self.previews.pop(arc_title).destroy()
+        self.ensure_figure(arc_title)
+        if arc_title == self.current_arc:
             self.update_plot()
-            self.update_treeview()
+
+    def schedule_cache_write(self, arc_title):
+        """Caches the raster of an arc once it has been left unchanged for CACHE_WRITE_DELAY_MS."""
+        if self.render_cache:
+            if arc_title in self.cache_writes:
+                self.master.after_cancel(self.cache_writes[arc_title])
+            self.cache_writes[arc_title] = self.master.after(CACHE_WRITE_DELAY_MS, self.write_cache, arc_title)
+
+    def write_cache(self, arc_title):
+        """Has the render cache render an arc at the size of its canvas."""
+        self.cache_writes.pop(arc_title, None)
+        arc_data = self.arcs.get(arc_title)
+        if not self.render_cache or not arc_data or 'canvas' not in arc_data:
+            return
+        width, height = arc_data['canvas'].get_width_height(physical=True)
+        self.render_cache.put(snapshot_arc_data(arc_data), (width, height, arc_data['fig'].dpi),
+                              self.side_plot_render_mode)
 
     def on_tab_changed(self, event):
         # Update current_arc and relevant data when the tab changes
+        if not self.notebook.select():
+            return  # The last tab was closed
         current_tab_index = self.notebook.index(self.notebook.select())
         self.current_arc = self.notebook.tab(current_tab_index, "text")
-        self.marker_style = self.arcs[self.current_arc]['marker_style']
-        self.background_image_path = self.arcs[self.current_arc]['background_image_path']
+        arc_data = self.get_current_arc_data()
+        self.marker_style = arc_data['marker_style']
+        self.background_image_path = arc_data['background_image_path']
+        if self.background_image_path != self.window_background_path:
+            self.set_window_background(self.background_image_path)
 
         for name, style in self.available_markers.items():
             if style == self.marker_style:
@@ -243,32 +837,12 @@ class StoryPlotter:
     def get_current_arc_data(self):
         # Helper function to get data for the currently active arc
         if self.current_arc:
-            return self.arcs[self.current_arc]
+            return self.ensure_arc_loaded(self.current_arc)
         else:
             return None
 
     def update_xlabels(self):
-        # Make sure to update the plot before calling this function
-        arc_data = self.get_current_arc_data()
-        if arc_data:
-            ax = arc_data['ax']
-            x_axis_labels = arc_data['x_axis_labels']
-            main_plot = arc_data['main_plot']
-            canvas = arc_data['canvas']
-
-            # Remove the old x-axis labels
-            for text in ax.texts:
-                if text.get_text() in x_axis_labels.values():
-                    text.remove()
-
-            # Add new x-axis labels
-            for i, (title, _, label) in enumerate(main_plot):
-                text = ax.text(i, 0.5, label, ha='center', va='bottom', fontsize=12, color='black',
-                                   bbox=dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.5'),
-                                   transform=ax.transData, zorder=10)  # Ensure labels are above other elements
-                text.set_clip_on(True)
-
-            canvas.draw()
+        self.schedule_redraw('labels')
 
     def set_background(self, image_path=None, startup=False):
         arc_data = self.get_current_arc_data()
@@ -282,80 +856,101 @@ class StoryPlotter:
                 )
             if file_path:
                 self.background_image_path = file_path
-                arc_data['background_image_path'] = file_path
+                self.apply_op({'op': 'set_background', 'arc': self.current_arc, 'path': file_path})
+                # The plot's background is transparent (see draw_arc), so the window background shows
                 self.update_plot()
-
-                # Set the plot's background to transparent to allow window background
-                # to show, after drawing canvas
-                arc_data['ax'].patch.set_alpha(0.0)
-                arc_data['canvas'].draw()
-
-                try:
-                    self.set_window_background(file_path)
-                except Exception as e:
-                    messagebox.showerror("Error", f"Could not set background: {e}")
+                self.background_error = None  # Chosen just now, so a failure is reported again
+                self.set_window_background(file_path)
 
     def set_window_background(self, image_path):
-        try:
-            # Open the image using PIL
-            pil_image = Image.open(image_path)
-
-            # Resize the image to fit the window
-            window_width = self.master.winfo_width()
-            window_height = self.master.winfo_height()
-            resized_image = pil_image.resize((window_width, window_height), Image.Resampling.LANCZOS)
-
-            # Convert the PIL image to a Tkinter PhotoImage
-            self.background_image = ImageTk.PhotoImage(resized_image)
-
-            # Create a label to display the background image
-            if not hasattr(self, 'background_label'):
-                self.background_label = tk.Label(self.master)
-                self.background_label.place(x=0, y=0, relwidth=1, relheight=1)
-
-            self.background_label.configure(image=self.background_image)
-            self.background_label.lower()  # Put the label at the bottom of the stacking order
-
-            # Adjust the weights of the grid to ensure the label expands
+        """Shows image_path behind the window, or no image if it is None. The
+        image is decoded and resized by the background resizer; until it is
+        done, the previous background stays."""
+        self.window_background_path = image_path
+        if not hasattr(self, 'background_label'):
+            # A label at the bottom of the stacking order, covering the window
+            self.background_label = tk.Label(self.master)
+            self.background_label.place(x=0, y=0, relwidth=1, relheight=1)
+            self.background_label.lower()
             self.master.grid_rowconfigure(0, weight=1)
             self.master.grid_columnconfigure(0, weight=1)
+        if image_path is None:
+            self.background_label.configure(image="")
+            self.background_image = None
+        else:
+            self.resize_window_background()
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Could not set background: {e}")
+    def on_window_configure(self, event):
+        # Every widget's <Configure> reaches the bindings of the window, only its own matter here
+        if event.widget is not self.master or not self.window_background_path:
+            return
+        shown = self.background_image
+        if shown and (shown.width(), shown.height()) == (event.width, event.height):
+            return  # Moved, not resized
+        if self.background_resize is not None:
+            self.master.after_cancel(self.background_resize)
+        self.background_resize = self.master.after(BACKGROUND_DEBOUNCE_MS, self.resize_window_background)
+
+    def resize_window_background(self):
+        """Has the background resizer fit the window background to the window."""
+        self.background_resize = None
+        width, height = self.master.winfo_width(), self.master.winfo_height()
+        if not self.window_background_path or width < 2 or height < 2:
+            return  # Not shown yet; resized on the first <Configure>
+        if self.background_resizer is None:
+            self.background_resizer = BackgroundResizer()
+        self.background_resizer.submit(self.window_background_path, width, height)
+        if self.background_poll is None:
+            self.background_poll = self.master.after(BACKGROUND_POLL_MS, self._poll_window_background)
+
+    def _poll_window_background(self):
+        """Shows the newest finished resize, unless a newer one was requested since."""
+        self.background_poll = None
+        latest = None
+        while True:
+            try:
+                result = self.background_resizer.results.get_nowait()
+            except queue.Empty:
+                break
+            if self.background_resizer.is_current(result[0]):
+                latest = result
+        if latest is None:
+            self.background_poll = self.master.after(BACKGROUND_POLL_MS, self._poll_window_background)
+            return
+
+        _, image_path, image = latest
+        if image_path != self.window_background_path:
+            return  # Switched to another arc meanwhile, which requested its own resize
+        if isinstance(image, Exception):
+            if image_path != self.background_error:
+                self.background_error = image_path
+                messagebox.showerror("Error", f"Could not set background: {image}")
+            return
+        shown = self.background_image
+        with tracer.span("window_background"):
+            if shown and (shown.width(), shown.height()) == image.size:
+                shown.paste(image)  # Same size, so the PhotoImage is reused
+            else:
+                self.background_image = ImageTk.PhotoImage(image)
+                self.background_label.configure(image=self.background_image)
 
     def on_marker_change(self, event=None):
         self.marker_style = self.available_markers[self.marker_options.get()]
         arc_data = self.get_current_arc_data()
         if arc_data:
-            arc_data['marker_style'] = self.marker_style
+            self.apply_op({'op': 'set_marker', 'arc': self.current_arc, 'marker_style': self.marker_style})
             self.update_plot()
 
     def save_plot_data(self):
         file_path = filedialog.asksaveasfilename(
             title="Save Plot Data",
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json")]
+            filetypes=[("JSON files", "*.json"), ("SQLite projects", "*.sqlite *.db")]
         )
         if file_path:
             print(f"File path to save: {file_path}")
-
-            # Prepare a serializable dictionary
-            serializable_data = {}
-            for arc_title, arc_data in self.arcs.items():
-                serializable_data[arc_title] = {
-                    'main_plot': arc_data['main_plot'],
-                    'side_plots': arc_data['side_plots'],
-                    'side_plot_counts': arc_data['side_plot_counts'],
-                    'subplot_colors': arc_data['subplot_colors'],
-                    'marker_style': arc_data['marker_style'],
-                    'background_image_path': arc_data['background_image_path'],
-                    'x_axis_labels': arc_data['x_axis_labels']
-                    # Exclude non-serializable objects like 'fig', 'ax', 'canvas'
-                }
-
             try:
-                with open(file_path, 'w') as f:
-                    json.dump(serializable_data, f)  # Save the serializable data
+                self.write_plot_data(file_path)
                 messagebox.showinfo("Save Successful", f"Plot data saved to {file_path}")
             except PermissionError as e:
                 messagebox.showerror("Save Failed", f"Permission Error: {e}")
@@ -364,6 +959,118 @@ class StoryPlotter:
                 messagebox.showerror("Save Failed", f"Error saving file: {e}")
                 print(f"General Exception details: {e}")
 
+    @traced("save_plot_data")
+    def write_plot_data(self, file_path):
+        """Writes every arc to file_path, as a SQLite project if its extension says so."""
+        # Prepare a serializable dictionary, excluding runtime objects like 'fig', 'ax', 'canvas'
+        self.load_all_arcs()
+        serializable_data = {arc_title: serialize_arc_data(arc_data) for arc_title, arc_data in self.arcs.items()}
+
+        foreign_arcs, self.foreign_arcs, self.hidden_arcs = self.foreign_arcs, set(), {}
+        if is_store_path(file_path):
+            if not (self.store and os.path.abspath(self.store.path) == os.path.abspath(file_path)):
+                self.open_store(ProjectStore.create(file_path, serializable_data))
+                return
+            # Edits to the open SQLite project are already written as they are made, except to arcs from elsewhere
+            for arc_title in foreign_arcs & set(self.arcs):
+                if arc_title in self.store:
+                    self.store.apply_op({'op': 'delete_arc', 'arc': arc_title})
+                self.store.apply_op({'op': 'add_arc', 'arc': arc_title, 'data': serializable_data[arc_title]})
+            return
+
+        text = json.dumps(serializable_data)
+        with open(file_path, 'w') as f:
+            f.write(text)  # Save the serializable data
+        # Further edits are journaled against the saved file
+        self.open_journal(file_path, hashlib.sha1(text.encode()).hexdigest(), restart=True)
+
+    def export_all_arcs(self):
+        """Asks where to export every arc to and renders them off the Tk thread:
+        a .pdf file gets one page per arc, while for PNG and SVG a folder named
+        like the chosen file gets one image per arc."""
+        if self.export_cancel or self.loading:
+            return
+        file_path = filedialog.asksaveasfilename(
+            title="Export All Arcs",
+            defaultextension=".pdf",
+            filetypes=[("PDF, one page per arc", "*.pdf"), ("PNG images, one per arc", "*.png"),
+                       ("SVG images, one per arc", "*.svg")]
+        )
+        if not file_path:
+            return
+        stem, extension = os.path.splitext(file_path)
+        file_format = extension.lower().lstrip('.')
+        if file_format != 'pdf' and file_format not in EXPORT_FORMATS:
+            messagebox.showerror("Export Failed", f"Cannot export to {extension or 'files without an extension'}; "
+                                                  f"choose a .pdf, .png or .svg file.")
+            return
+
+        # Snapshots are taken here, so edits made while exporting do not change the images
+        self.load_all_arcs()
+        snapshots = {arc_title: snapshot_arc_data(arc_data) for arc_title, arc_data in self.arcs.items()}
+        if file_format == 'pdf':
+            options = {'pdf_path': file_path}
+            target = file_path
+        else:
+            options = {'output_dir': stem, 'formats': (file_format,)}
+            target = stem
+        events = queue.Queue()
+        self.export_cancel = cancel = threading.Event()
+
+        def export():
+            try:
+                written, failures = export_arcs(
+                    snapshots, progress=lambda done, total, path: events.put(('progress', done, total)),
+                    cancel=cancel, **options)
+                events.put(('done', written, failures))
+            except Exception as e:
+                events.put(('error', e))
+
+        self.export_button.state(['disabled'])
+        self.show_progress(f"Exporting {len(snapshots)} arcs...", mode="determinate")
+        self.cancel_export_button.pack(side="left", padx=5, pady=5)
+        threading.Thread(target=export, name="ExportArcs", daemon=True).start()
+        self.master.after(EXPORT_POLL_MS, self._poll_export, target, events)
+
+    def cancel_export(self):
+        if self.export_cancel:
+            self.export_cancel.set()
+            self.progress_label.configure(text="Cancelling export...")
+
+    def _poll_export(self, target, events):
+        result = None
+        try:
+            while True:
+                event = events.get_nowait()
+                if event[0] == 'progress':
+                    _, done, total = event
+                    self.progress_bar['value'] = 100 * done / total
+                else:
+                    result = event
+        except queue.Empty:
+            pass
+        if result is None:
+            self.master.after(EXPORT_POLL_MS, self._poll_export, target, events)
+            return
+
+        cancelled = self.export_cancel.is_set()
+        self.export_cancel = None
+        self.export_button.state(['!disabled'])
+        self.cancel_export_button.pack_forget()
+        self.hide_progress()
+        if result[0] == 'error':
+            messagebox.showerror("Export Failed", f"Error exporting arcs: {result[1]}")
+            print(f"General Exception details: {result[1]}")
+            return
+        _, written, failures = result
+        if failures:
+            details = "\n".join(f"{path}: {error}" for path, error in failures[:10])
+            messagebox.showerror("Export Failed", f"{len(failures)} exports failed:\n{details}")
+        elif cancelled:
+            messagebox.showinfo("Export Cancelled", f"Export cancelled; {len(written)} file(s) were written to {target}")
+        else:
+            messagebox.showinfo("Export Successful", f"All arcs exported to {target}")
+
     def load_presets(self):
         """Loads presets from presets.json (relative path)."""
         try:
@@ -376,6 +1083,15 @@ class StoryPlotter:
             # Get preset values, handling potential KeyErrors
             self.load_data_path_preset = presets.get("load_data_path")
             self.auto_load_preset = presets.get("auto_load", False)
+            self.side_plot_render_mode = presets.get("side_plot_render_mode", self.side_plot_render_mode)
+            self.max_live_canvases = max(1, presets.get("max_live_canvases", self.max_live_canvases))
+            self.undo_depth = max(1, presets.get("undo_depth", self.undo_depth))
+            self.undo_memory_mb = presets.get("undo_memory_mb", self.undo_memory_mb)
+            self.trace_enabled = presets.get("trace", self.trace_enabled)
+            self.trace_path = presets.get("trace_path", self.trace_path)
+            self.render_in_background = presets.get("render_in_background", self.render_in_background)
+            self.watch_project = presets.get("watch_project", self.watch_project)
+            self.render_cache_mb = presets.get("render_cache_mb", self.render_cache_mb)
 
         except FileNotFoundError:
             print(f"Warning: presets.json not found at {presets_file_path}. Using default settings.")
@@ -393,24 +1109,125 @@ class StoryPlotter:
             load_path = filedialog.askopenfilename(
                 title="Load Plot Data",
                 defaultextension=".json",
-                filetypes=[("JSON files", "*.json")]
+                filetypes=[("JSON files", "*.json"), ("SQLite projects", "*.sqlite *.db")]
             )
-        if load_path:
-            try:
-                with open(load_path, 'r') as f:
-                    loaded_data = json.load(f)
+        if load_path and is_store_path(load_path):
+            self.load_store(load_path)
+        elif load_path:
+            # Parse the file (and replay its journal) off the Tk thread
+            self.load_button.state(['disabled'])
+            self.show_progress(f"Loading {os.path.basename(load_path)}...", mode="indeterminate")
+            results = queue.Queue()
+
+            def parse():
+                try:
+                    # Reopening replays the edits journaled since the file was last written
+                    with tracer.span("load_plot_data.parse"):
+                        results.put((True, replay_project(load_path)))
+                except Exception as e:
+                    results.put((False, e))
 
-                # Create tabs for each arc, along with their data
-                for arc_title, data in loaded_data.items():
-                    self.add_new_arc(arc_title, data)
+            threading.Thread(target=parse, name="LoadProject", daemon=True).start()
+            self.master.after(LOAD_POLL_MS, self._poll_load, load_path, results)
 
-                self.update_plot()
-                self.update_treeview()
-                messagebox.showinfo("Load Successful", f"Plot data loaded from {load_path}")
+    @traced("load_plot_data.open_store")
+    def load_store(self, load_path):
+        """Opens a SQLite project. Only the arc titles are read here; each arc
+        is read when its tab is first shown (see ensure_arc_loaded)."""
+        try:
+            store = ProjectStore(load_path)
+        except Exception as e:
+            messagebox.showerror("Load Failed", f"Error loading file {e}")
+            print(f"General Exception details: {e}")
+            return
 
-            except Exception as e:
-                messagebox.showerror("Load Failed", f"Error loading file {e}")
-                print(f"General Exception details: {e}")
+        self.open_store(store)
+        # Arcs that are already open stay out of the project until it is saved, and
+        # keep their titles; the project's arcs with the same titles are left in it as they are
+        self.foreign_arcs, self.hidden_arcs = set(self.arcs), {}
+        self.loading = True
+        self.load_button.state(['disabled'])
+        self.show_progress(f"Loading {os.path.basename(load_path)}...", mode="determinate")
+        titles = store.arc_titles()
+        items = [(arc_title, None) for arc_title in titles if arc_title not in self.arcs]
+        self._add_loaded_arcs(load_path, items, 0, False, len(titles) - len(items))
+
+    def _poll_load(self, load_path, results):
+        try:
+            parsed, result = results.get_nowait()
+        except queue.Empty:
+            self.master.after(LOAD_POLL_MS, self._poll_load, load_path, results)
+            return
+
+        if not parsed:
+            self._finish_load()
+            messagebox.showerror("Load Failed", f"Error loading file {result}")
+            print(f"General Exception details: {result}")
+            return
+
+        loaded_data, base, replayed_ops = result
+        # Arcs that are already open stay out of the project until it is saved, and
+        # keep their titles; the project's arcs with the same titles are kept aside
+        self.foreign_arcs = set(self.arcs)
+        self.hidden_arcs = {arc_title: serialize_arc_data(data) for arc_title, data in loaded_data.items()
+                            if arc_title in self.arcs}
+        self.loading = True
+        self.open_journal(load_path, base)
+        self.show_progress(f"Loading {os.path.basename(load_path)}...", mode="determinate")
+        items = [(arc_title, data) for arc_title, data in loaded_data.items() if arc_title not in self.arcs]
+        # Nothing is compacted until every arc of the file has been added, and
+        # then only to fold in the journaled edits that were replayed
+        self._add_loaded_arcs(load_path, items, 0, replayed_ops > 0, len(self.hidden_arcs))
+
+    @traced("load_plot_data.add_tabs")
+    def _add_loaded_arcs(self, load_path, items, start, needs_compaction, hidden=0):
+        """Adds the tabs of a loaded project a chunk at a time, so the window
+        stays responsive. Tabs are not drawn until they are shown. hidden is
+        the number of the project's arcs not shown, as open arcs have their titles."""
+        end = min(start + LOAD_CHUNK_ARCS, len(items))
+        for arc_title, data in items[start:end]:
+            if data is None:
+                # An arc of a SQLite project, read when it is first shown
+                self.arcs[arc_title] = {'lazy': True}
+                self._add_arc_tab(arc_title)
+            else:
+                self.add_new_arc(arc_title, data, select=False)
+        self.progress_bar['value'] = 100 * end / len(items) if items else 100
+
+        if end < len(items):
+            self.master.after(1, self._add_loaded_arcs, load_path, items, end, needs_compaction, hidden)
+            return
+
+        self._finish_load()
+        if needs_compaction:
+            self.compact_journal()
+        message = f"Plot data loaded from {load_path}"
+        if hidden:
+            message += (f"\n\n{hidden} arc(s) of it were not opened, as arcs with the same titles are open. "
+                        "Open arcs are not saved to it until you save.")
+        elif self.foreign_arcs:
+            message += "\n\nArcs that were already open are not saved to it until you save."
+        messagebox.showinfo("Load Successful", message)
+
+    def _finish_load(self):
+        self.loading = False
+        self.load_button.state(['!disabled'])
+        self.hide_progress()
+
+    def show_progress(self, text, mode="determinate"):
+        self.progress_label.configure(text=text)
+        self.progress_bar.configure(mode=mode, value=0)
+        self.progress_label.pack(side="left", padx=5, pady=5)
+        self.progress_bar.pack(side="left", padx=5, pady=5)
+        if mode == "indeterminate":
+            self.progress_bar.start(15)
+        else:
+            self.progress_bar.stop()
+
+    def hide_progress(self):
+        self.progress_bar.stop()
+        self.progress_bar.pack_forget()
+        self.progress_label.pack_forget()
 
     def add_main_plot_point(self):
         arc_data = self.get_current_arc_data()
@@ -422,7 +1239,8 @@ class StoryPlotter:
             if title and description:
                 if not label:
                     label = f"Label {len(arc_data['main_plot'])}"
-                arc_data['main_plot'].append((title, description, label))
+                self.apply_op({'op': 'insert_main', 'arc': self.current_arc, 'index': len(arc_data['main_plot']),
+                               'point': [title, description, label]})
                 self.update_plot()
                 self.update_treeview()
 
@@ -435,24 +1253,8 @@ class StoryPlotter:
             if title and description:
                 if not label:
                     label = f"Label {index}"
-                arc_data['main_plot'].insert(index, (title, description, label))
-
-                # Shift side_plots, side_plot_counts, and subplot_colors
-                new_side_plots = {}
-                new_side_plot_counts = {}
-                new_subplot_colors = {}
-                for key, value in arc_data['side_plots'].items():
-                    new_key = key + 1 if key >= index else key
-                    new_side_plots[new_key] = value
-                    if key in arc_data['side_plot_counts']:
-                        new_side_plot_counts[new_key] = arc_data['side_plot_counts'][key]
-                    if key in arc_data['subplot_colors']:
-                        new_subplot_colors[new_key] = arc_data['subplot_colors'][key]
-
-                arc_data['side_plots'] = new_side_plots
-                arc_data['side_plot_counts'] = new_side_plot_counts
-                arc_data['subplot_colors'] = new_subplot_colors
-
+                self.apply_op({'op': 'insert_main', 'arc': self.current_arc, 'index': index,
+                               'point': [title, description, label]})
                 self.update_plot()
                 self.update_treeview()
 
@@ -463,8 +1265,9 @@ class StoryPlotter:
             editor.wait_window()
             title, description, _ = editor.result  # Ignore label for side plots
             if title and description:
-                if main_index in arc_data['side_plots'] and side_plot_index in arc_data['side_plots'][main_index]:
-                    arc_data['side_plots'][main_index][side_plot_index].insert(index, (title, description))
+                if side_plot_index in side_plots_of(arc_data, main_index):
+                    self.apply_op({'op': 'insert_side', 'arc': self.current_arc, 'main_index': main_index,
+                                   'side_plot_index': side_plot_index, 'index': index, 'point': [title, description]})
                     self.update_plot()
                     self.update_treeview()
                 else:
@@ -477,20 +1280,10 @@ class StoryPlotter:
             editor.wait_window()
             title, description, _ = editor.result  # Ignore label for side plots
             if title and description:
-                if main_plot_index not in arc_data['side_plots']:
-                    arc_data['side_plots'][main_plot_index] = {}
-                    arc_data['side_plot_counts'][main_plot_index] = 0
-
-                if main_plot_index not in arc_data['subplot_colors']:
-                    arc_data['subplot_colors'][main_plot_index] = self._get_random_color()
-
-                arc_data['side_plot_counts'][main_plot_index] += 1
-                side_plot_index = arc_data['side_plot_counts'][main_plot_index]
-
-                if side_plot_index not in arc_data['side_plots'][main_plot_index]:
-                    arc_data['side_plots'][main_plot_index][side_plot_index] = []
-
-                arc_data['side_plots'][main_plot_index][side_plot_index].append((title, description))
+                main_id = arc_data['main_plot'].id_at(main_plot_index)
+                color = arc_data['subplot_colors'].get(main_id) or self._get_random_color()
+                self.apply_op({'op': 'add_side_plot', 'arc': self.current_arc, 'main_index': main_plot_index,
+                               'point': [title, description], 'color': color})
                 self.update_plot()
                 self.update_treeview()
 
@@ -498,44 +1291,37 @@ class StoryPlotter:
         if self.current_arc != arc_title:
             return  # Ignore clicks on inactive arcs
 
+        self.flush_redraw()  # Hit testing needs the current point positions
         arc_data = self.get_current_arc_data()
         if arc_data:
             ax = arc_data['ax']
             if event.inaxes == ax:
+                point_index = arc_data['point_index']
                 if event.button is MouseButton.LEFT:
-                    # Open Plot Point Editor (Main Plot)
-                    for i, ((title, description, label), line) in enumerate(
-                            zip(arc_data['main_plot'], arc_data['main_plot_lines'])):
-                        contains, _ = line.contains(event)
-                        if contains:
-                            self.open_plot_point_editor(i, 0, 'main')
-                            return
-
-                    # Open Plot Point Editor (Side Plot)
-                    for main_index, side_plot_data in arc_data['side_plots'].items():
-                        for side_plot_index, points in side_plot_data.items():
-                            for i, ((title, description), line) in enumerate(
-                                    zip(points, arc_data['side_plot_lines'][main_index][side_plot_index])):
-                                contains, _ = line.contains(event)
-                                if contains:
-                                    self.open_plot_point_editor(main_index, side_plot_index, 'side', side_x_index=i)
-                                    return
+                    # Open Plot Point Editor for the point within the pick radius
+                    with tracer.span("on_plot_click"):
+                        x_per_pixel, y_per_pixel = abs(ax.transData.inverted().transform((1, 1))
+                                                       - ax.transData.inverted().transform((0, 0)))
+                        hit = point_index.nearest(event.xdata, event.ydata,
+                                                  PICK_RADIUS_PIXELS * x_per_pixel, PICK_RADIUS_PIXELS * y_per_pixel)
+                    if hit:
+                        main_id, side_plot_index, side_x_index = hit
+                        main_index = arc_data['main_plot'].index_of(main_id)
+                        if side_plot_index == 0:
+                            self.open_plot_point_editor(main_index, 0, 'main')
+                        else:
+                            self.open_plot_point_editor(main_index, side_plot_index, 'side', side_x_index=side_x_index)
 
                 elif event.button is MouseButton.RIGHT:
-                    x, y = int(round(event.xdata)), int(round(event.ydata))
-                    # Check if it's a main plot point
-                    if y == 0 and 0 <= x < len(arc_data['main_plot']):
-                        self.show_context_menu(x, 0, 'main')
-                    else:
-                        # Check if it's a side plot point
-                        for main_index, side_plot_data in arc_data['side_plots'].items():
-                            for side_plot_index, points in side_plot_data.items():
-                                if x >= main_index and x < main_index + len(
-                                        points) and y == -side_plot_index - self.get_offset(main_index,
-                                                                                              side_plot_index):
-                                    adjusted_x = x - main_index
-                                    self.show_context_menu(main_index, side_plot_index, 'side', adjusted_x)
-                                    return
+                    with tracer.span("on_plot_click"):
+                        hit = point_index.at(event.xdata, event.ydata)
+                    if hit:
+                        main_id, side_plot_index, side_x_index = hit
+                        main_index = arc_data['main_plot'].index_of(main_id)
+                        if side_plot_index == 0:
+                            self.show_context_menu(main_index, 0, 'main')
+                        else:
+                            self.show_context_menu(main_index, side_plot_index, 'side', side_x_index)
 
     def create_text_editor_window(self, title, initial_title, initial_description, initial_label):
         editor = TextEditorWindow(self.master, title, initial_title, initial_description, initial_label)
@@ -553,26 +1339,25 @@ class StoryPlotter:
                 if new_title is not None and new_description is not None:
                     if not new_label:
                         new_label = f"Label {x_index}"
-                    arc_data['main_plot'][x_index] = (new_title, new_description, new_label)
+                    self.apply_op({'op': 'edit_main', 'arc': self.current_arc, 'index': x_index,
+                                   'point': [new_title, new_description, new_label]})
 
             elif plot_type == 'side':
-                current_title, current_description = arc_data['side_plots'][x_index][y_index][side_x_index]
+                current_title, current_description = side_plots_of(arc_data, x_index)[y_index][side_x_index]
                 editor = self.create_text_editor_window("Edit Side Plot Point", current_title, current_description, "")
                 editor.wait_window()
                 new_title, new_description, _ = editor.result  # Ignore label for side plots
                 if new_title is not None and new_description is not None:
-                    arc_data['side_plots'][x_index][y_index][side_x_index] = (new_title, new_description)
+                    self.apply_op({'op': 'edit_side', 'arc': self.current_arc, 'main_index': x_index,
+                                   'side_plot_index': y_index, 'index': side_x_index,
+                                   'point': [new_title, new_description]})
             self.update_plot()
             self.update_treeview()
 
     def get_offset(self, main_index, side_plot_index):
         arc_data = self.get_current_arc_data()
         if arc_data:
-            offset = 0
-            for i in range(main_index):
-                if i in arc_data['side_plot_counts']:
-                    offset += arc_data['side_plot_counts'][i]
-            return offset
+            return get_layout(arc_data).offset(main_index)
 
     def show_context_menu(self, x_index, y_index, plot_type, side_x_index=None):
         context_menu = tk.Menu(self.master, tearoff=0)
@@ -629,7 +1414,9 @@ class StoryPlotter:
             editor.wait_window()
             title, description, _ = editor.result
             if title and description:
-                arc_data['side_plots'][x_index][y_index].append((title, description))
+                self.apply_op({'op': 'insert_side', 'arc': self.current_arc, 'main_index': x_index,
+                               'side_plot_index': y_index, 'index': len(side_plots_of(arc_data, x_index)[y_index]),
+                               'point': [title, description]})
                 self.update_plot()
                 self.update_treeview()
 
@@ -640,46 +1427,11 @@ class StoryPlotter:
                 if messagebox.askyesno("Delete",
                                        "Are you sure you want to delete this main plot point and all associated side plots?"):
 
-                    del arc_data['main_plot'][x_index]
-                    if x_index in arc_data['side_plots']:
-                        del arc_data['side_plots'][x_index]
-                        del arc_data['side_plot_counts'][x_index]
-                        del arc_data['subplot_colors'][x_index]
-                    # Rebuild side_plots and side_plot_counts to adjust for removed main plot point
-                    new_side_plots = {}
-                    new_side_plot_counts = {}
-                    new_subplot_colors = {}
-                    for key, value in arc_data['side_plots'].items():
-                        new_key = key if key < x_index else key - 1
-                        new_side_plots[new_key] = value
-                        new_side_plot_counts[new_key] = arc_data['side_plot_counts'][key]
-
-                    for key, value in arc_data['subplot_colors'].items():
-                        new_key = key if key < x_index else key - 1
-                        new_subplot_colors[new_key] = value
-
-                    arc_data['side_plots'] = new_side_plots
-                    arc_data['side_plot_counts'] = new_side_plot_counts
-                    arc_data['subplot_colors'] = new_subplot_colors
+                    self.apply_op({'op': 'delete_main', 'arc': self.current_arc, 'index': x_index})
             elif plot_type == 'side':
                 if messagebox.askyesno("Delete", "Are you sure you want to delete this side plot point?"):
-                    del arc_data['side_plots'][x_index][y_index][side_x_index]
-                    # Check if side plot is now empty and delete it if so
-                    if not arc_data['side_plots'][x_index][y_index]:
-                        del arc_data['side_plots'][x_index][y_index]
-                        arc_data['side_plot_counts'][x_index] -= 1
-                        # Reorganize side plot indexes if necessary
-                        if arc_data['side_plot_counts'][x_index] == 0:
-                            del arc_data['side_plot_counts'][x_index]
-                            del arc_data['side_plots'][x_index]
-                            if x_index in arc_data['subplot_colors']:
-                                del arc_data['subplot_colors'][x_index]
-                        else:
-                            new_side_plot = {}
-                            for key, value in arc_data['side_plots'][x_index].items():
-                                new_key = key if key < y_index else key - 1
-                                new_side_plot[new_key] = value
-                            arc_data['side_plots'][x_index] = new_side_plot
+                    self.apply_op({'op': 'delete_side', 'arc': self.current_arc, 'main_index': x_index,
+                                   'side_plot_index': y_index, 'index': side_x_index})
             self.update_plot()
             self.update_treeview()
 
@@ -692,179 +1444,292 @@ class StoryPlotter:
                     return color
 
     def update_treeview(self):
-        # Clear existing items
-        for item in self.treeview.get_children():
-            self.treeview.delete(item)
+        self.schedule_redraw('tree')
 
+    def _sync_treeview(self):
         arc_data = self.get_current_arc_data()
+
+        # Start over when switching arcs, restoring the rows the user had expanded
+        if self.tree_arc != self.current_arc:
+            self.treeview.delete(*self.treeview.get_children())
+            self.tree_texts = {}
+            self.tree_children = {}
+            self.tree_arc = self.current_arc
+            if arc_data:
+                self._sync_tree_children("", self._main_tree_rows(arc_data))
+                for main_iid in arc_data.setdefault('tree_open_rows', set()):
+                    if main_iid in self.tree_texts:
+                        self.treeview.item(main_iid, open=True)
+
         if arc_data:
             # Add main plot points
-            for i, (title, _, _) in enumerate(arc_data['main_plot']):
-                main_id = self.treeview.insert("", "end", text=f"Main {i}: {title}")
+            self._sync_tree_children("", self._main_tree_rows(arc_data))
+
+            # Add side plots, for expanded main plot points only
+            for main_id in arc_data['main_plot'].ids():
+                self._sync_main_tree_children(arc_data, main_id)
+
+    def on_search(self):
+        """Lists the points matching the search box across all arcs."""
+        query = self.search_var.get()
+        self.search_hits = self.search_index.search(query, limit=MAX_SEARCH_RESULTS)
+        if self.store:
+            # Arcs of a SQLite project not read yet are searched in the database, leaving them unloaded
+            lazy_arcs = [arc_title for arc_title, arc_data in self.arcs.items() if arc_data.get('lazy')]
+            self.search_hits += self.store.search(query, lazy_arcs, limit=MAX_SEARCH_RESULTS)
+            self.search_hits.sort(key=lambda hit: (hit[0], hit[1], hit[2] or 0, hit[3] or 0))
+            del self.search_hits[MAX_SEARCH_RESULTS:]
+
+        self.search_results.delete(0, tk.END)
+        for arc_title, main_index, side_plot_index, side_x_index, title in self.search_hits:
+            if side_plot_index is None:
+                location = f"Main {main_index}"
+            else:
+                location = f"Main {main_index}, Side Plot {side_plot_index}, Point {side_x_index}"
+            self.search_results.insert(tk.END, f"{arc_title} / {location}: {title}")
+
+        if query.strip():
+            self.search_results.pack(side="top", fill="x", padx=5, pady=(0, 5), before=self.treeview)
+        else:
+            self.search_results.pack_forget()
+
+    def on_search_result_select(self, event):
+        """Switches to the arc of a search hit and selects the point in the tree,
+        which highlights it on the plot."""
+        selection = self.search_results.curselection()
+        if not selection:
+            return
+        arc_title, main_index, side_plot_index, side_x_index, _ = self.search_hits[selection[0]]
+        if arc_title not in self.arcs:
+            self.on_search()  # The hit is out of date
+            return
+        if arc_title != self.current_arc:
+            self.select_arc(arc_title)
+        self.flush_redraw()  # The tree rows of the arc must exist
 
-                # Add side plots for this main plot point
-                if i in arc_data['side_plots']:
-                    for side_plot_index, points in arc_data['side_plots'][i].items():
-                        side_id = self.treeview.insert(main_id, "end", text=f"Side Plot {side_plot_index}")
-                        for j, (side_title, _) in enumerate(points):
-                            self.treeview.insert(side_id, "end", text=f"Point {j}: {side_title}")
+        arc_data = self.get_current_arc_data()
+        if main_index >= len(arc_data['main_plot']):
+            self.on_search()
+            return
+        main_id = arc_data['main_plot'].id_at(main_index)
+        main_iid = f"main:{main_id}"
+        if main_iid not in self.tree_texts:
+            self.on_search()
+            return
+        if side_plot_index is None:
+            iid = main_iid
+        else:
+            # Expand the main plot point so the row of the side plot point exists
+            arc_data.setdefault('tree_open_rows', set()).add(main_iid)
+            self._sync_main_tree_children(arc_data, main_id)
+            self.treeview.item(main_iid, open=True)
+            iid = f"point:{main_id}:{side_plot_index}:{side_x_index}"
+            if iid not in self.tree_texts:
+                self.on_search()
+                return
+        self.treeview.selection_set(iid)
+        self.treeview.see(iid)
+
+    def _main_tree_rows(self, arc_data):
+        return [(f"main:{main_id}", f"Main {i}: {title}")
+                for i, (main_id, (title, _, _)) in enumerate(arc_data['main_plot'].items())]
+
+    def _sync_main_tree_children(self, arc_data, main_id):
+        """Fills in the side plots of an expanded main plot point, or leaves a
+        placeholder so a collapsed one still shows as expandable."""
+        main_iid = f"main:{main_id}"
+        side_plot_data = arc_data['side_plots'].get(main_id, {})
+        if not side_plot_data:
+            self._sync_tree_children(main_iid, [])
+        elif main_iid not in arc_data.setdefault('tree_open_rows', set()):
+            self._sync_tree_children(main_iid, [(f"pending:{main_id}", "")])
+        else:
+            self._sync_tree_children(main_iid, [
+                (f"side:{main_id}:{side_plot_index}", f"Side Plot {side_plot_index}")
+                for side_plot_index in side_plot_data
+            ])
+            for side_plot_index, points in side_plot_data.items():
+                self._sync_tree_children(f"side:{main_id}:{side_plot_index}", [
+                    (f"point:{main_id}:{side_plot_index}:{j}", f"Point {j}: {side_title}")
+                    for j, (side_title, _) in enumerate(points)
+                ])
+
+    def _sync_tree_children(self, parent, rows):
+        """Makes the children of a tree item match rows ([(iid, text)]),
+        inserting, deleting or relabeling only the rows that differ."""
+        wanted = {iid for iid, _ in rows}
+        for iid in self.tree_children.get(parent, []):
+            if iid not in wanted:
+                self.treeview.delete(iid)
+                self._forget_tree_item(iid)
+
+        for position, (iid, text) in enumerate(rows):
+            if iid not in self.tree_texts:
+                self.treeview.insert(parent, position, iid=iid, text=text)
+                self.tree_texts[iid] = text
+            elif self.tree_texts[iid] != text:
+                self.treeview.item(iid, text=text)
+                self.tree_texts[iid] = text
+        self.tree_children[parent] = [iid for iid, _ in rows]
+
+    def _forget_tree_item(self, iid):
+        """Drops a deleted item and its descendants from the tree mirror."""
+        del self.tree_texts[iid]
+        for child in self.tree_children.pop(iid, []):
+            self._forget_tree_item(child)
+
+    def on_treeview_open(self, event):
+        arc_data = self.get_current_arc_data()
+        iid = self.treeview.focus()
+        if arc_data and iid.startswith("main:"):
+            arc_data.setdefault('tree_open_rows', set()).add(iid)
+            self._sync_main_tree_children(arc_data, int(iid.split(":")[1]))
+
+    def on_treeview_close(self, event):
+        arc_data = self.get_current_arc_data()
+        if arc_data:
+            arc_data.setdefault('tree_open_rows', set()).discard(self.treeview.focus())
 
     def on_treeview_select(self, event):
         arc_data = self.get_current_arc_data()
         if not arc_data:
             return
+        self.build_live_figure(self.current_arc)
+        self.flush_redraw()  # The artists to highlight must be current
 
         try:
             selected_id = self.treeview.selection()[0]
-            item_text = self.treeview.item(selected_id, "text")
-
-            # Reset linewidth of all lines
-            for line in arc_data['main_plot_lines']:
-                line.set_linewidth(3)
-            for main_index, side_plot_data in arc_data['side_plot_lines'].items():
-                for side_plot_index, lines in side_plot_data.items():
-                    for line in lines:
-                        line.set_linewidth(3)
-
-            # Check if it's a main plot point
-            if item_text.startswith("Main"):
-                main_index = int(item_text.split(":")[0].split(" ")[1])
-                # Highlight the point on the plot
-                if main_index < len(arc_data['main_plot_lines']):
-                    line = arc_data['main_plot_lines'][main_index]
-                    line.set_linewidth(6)  # Make it thicker
-                    arc_data['canvas'].draw()
-
-            # Check if it's a side plot point
-            elif item_text.startswith("Point"):
-                parent_id = self.treeview.parent(selected_id)
-                grandparent_id = self.treeview.parent(parent_id)
-                main_index = int(self.treeview.item(grandparent_id, "text").split(":")[0].split(" ")[1])
-                side_plot_index = int(self.treeview.item(parent_id, "text").split(" ")[2])
-                side_x_index = int(item_text.split(":")[0].split(" ")[1])
-
-                line = arc_data['side_plot_lines'][main_index][side_plot_index][side_x_index]
-                line.set_linewidth(6)
-                arc_data['canvas'].draw()
-
         except IndexError:
-            pass  # Ignore if nothing is selected
+            return  # Ignore if nothing is selected
+        item_kind, *item_ids = selected_id.split(":")
+
+        # Main plot points and side plot points are highlighted on the plot
+        arc_data['highlight'] = (item_kind, *map(int, item_ids)) if item_kind in ("main", "point") else None
+        draw_highlight(arc_data)
+        self.schedule_redraw('canvas')
 
     def update_plot(self):
+        self.schedule_redraw('plot')
+
+    def schedule_redraw(self, part):
+        """Marks part ('plot', 'labels', 'tree' or 'canvas') of the current arc as
+        out of date. Everything marked until the next idle turn is redrawn once."""
+        self.dirty.add(part)
+        if part != 'tree':  # Only requests that redraw the canvas count against the redraws done
+            self.redraw_requests += 1
+            tracer.count('redraw_requests')
+        if self.redraw_callback is None:
+            self.redraw_callback = self.master.after_idle(self._redraw)
+
+    def flush_redraw(self):
+        """Does a pending redraw right away, for code that needs the artists or
+        tree rows to be current."""
+        if self.redraw_callback is not None:
+            self.master.after_cancel(self.redraw_callback)
+            self._redraw()
+
+    def _redraw(self):
+        dirty, self.dirty = self.dirty, set()
+        self.redraw_callback = None
+        if 'tree' in dirty:
+            with tracer.span("update_treeview"):
+                self._sync_treeview()
+
         arc_data = self.get_current_arc_data()
         if not arc_data:
             return
-
-        ax = arc_data['ax']
-        canvas = arc_data['canvas']
-        main_plot = arc_data['main_plot']
-        side_plots = arc_data['side_plots']
-        side_plot_counts = arc_data['side_plot_counts']
-        subplot_colors = arc_data['subplot_colors']
-        marker_style = arc_data['marker_style']
-
-        ax.clear()
-
-        # --- Adjust Figure and Axes ---
-        arc_data['fig'].subplots_adjust(left=0.01, right=0.99, top=0.99, bottom=0.01)  # Reduce figure margins
-
-        # --- Set Axis Limits ---
-        ax.set_xlim(-1, len(main_plot) + 1 if main_plot else 1)
-
-        # Calculate the maximum y-value needed for side plots
-        max_y = 0
-        for main_index in range(len(main_plot)):
-            if main_index in side_plot_counts:
-                max_y = max(max_y, self.get_offset(main_index, 0) + side_plot_counts[main_index])
-
-        ax.set_ylim(-max_y - 1, 1)
-        ax.set_xticks([])
-        ax.set_yticks([])
-
-        # --- Draw Main Plot ---
-        main_x = range(len(main_plot))
-        main_y = [0] * len(main_plot)
-        arc_data['main_plot_lines'] = []
-        if main_x:
-            line, = ax.plot(main_x, main_y, marker=marker_style, linestyle="-", color="#3498db",
-                                 markersize=15, linewidth=3, picker=5)
-            arc_data['main_plot_lines'].append(line)
-
-            # Annotate main plot points
-            for i, (title, _, _) in enumerate(main_plot):
-                ax.annotate(
-                    title,
-                    (i, 0),
-                    textcoords="offset points",
-                    xytext=(0, 10),
-                    ha="center",
-                    fontsize=12,
-                    bbox=dict(boxstyle="round,pad=0.3", facecolor="white", alpha=0.8)
-                )
-
-        # --- Draw Side Plots ---
-        arc_data['side_plot_lines'] = {}
-        for main_index, side_plot_data in side_plots.items():
-            if main_index not in arc_data['side_plot_lines']:
-                arc_data['side_plot_lines'][main_index] = {}
-            for side_plot_index, points in side_plot_data.items():
-                x_start = main_index
-                y = -side_plot_index - self.get_offset(main_index, side_plot_index)
-                if side_plot_index not in arc_data['side_plot_lines'][main_index]:
-                    arc_data['side_plot_lines'][main_index][side_plot_index] = []
-                # Draw initial vertical line from main plot point
-                color = subplot_colors.get(main_index, "red")
-                line, = ax.plot([x_start, x_start], [0, y], linestyle=":", color=color,
-                                     markersize=10, linewidth=3, picker=5)
-                arc_data['side_plot_lines'][main_index][side_plot_index].append(line)
-
-                for i, (title, _) in enumerate(points):
-                    x = x_start + i
-                    if i == 0:
-                        # First point, annotate on the vertical line
-                        line, = ax.plot(x, y, marker=marker_style, linestyle="", color=color,
-                                             markersize=10, picker=5)
-                        arc_data['side_plot_lines'][main_index][side_plot_index].append(line)
-                        ax.annotate(
-                            f"SP {side_plot_index}\n{title}",
-                            (x, y),
-                            textcoords="offset points",
-                            xytext=(-20, 0),
-                            ha="right",
-                            fontsize=10,
-                            bbox=dict(boxstyle="round,pad=0.3", facecolor="white", alpha=0.7)
-                        )
-                    else:
-                        # Subsequent points, extend horizontally
-                        line, = ax.plot([x - 1, x], [y, y], marker=marker_style, linestyle="-",
-                                             color=color, markersize=10, linewidth=3, picker=5)
-                        arc_data['side_plot_lines'][main_index][side_plot_index].append(line)
-                        ax.annotate(
-                            f"{title}",
-                            (x, y),
-                            textcoords="offset points",
-                            xytext=(0, 5),
-                            ha="center",
-                            fontsize=10,
-                            bbox=dict(boxstyle="round,pad=0.3", facecolor="white", alpha=0.7)
-                        )
-
-        if self.background_image_path:
+        if dirty & {'plot', 'labels'}:
+            arc_data.pop('render_snapshot', None)  # The data changed since the last background render
+        if 'plot' in dirty and 'fig' not in arc_data and self.show_preview(self.current_arc):
+            dirty.clear()  # Drawn once the live figure is built
+        if 'plot' in dirty:
+            self.schedule_cache_write(self.current_arc)
+            with tracer.span("update_plot"):
+                self.ensure_figure(self.current_arc)
+                if self.render_worker:
+                    # Just the limits and hit-testing index, the worker draws the rest
+                    draw_arc(arc_data, self.side_plot_render_mode, artists=False)
+                else:
+                    draw_arc(arc_data, self.side_plot_render_mode)
+                    try:
+                        draw_background(arc_data, self.background_image_path)
+                    except Exception as e:
+                        messagebox.showerror("Error", f"Could not load background image: {e}")
+        if dirty & {'plot', 'labels'} and 'fig' in arc_data and not self.render_worker:
+            with tracer.span("update_xlabels"):
+                draw_x_labels(arc_data)
+        if dirty & {'plot', 'labels', 'canvas'} and 'canvas' in arc_data:
+            arc_data['canvas'].draw_idle()
+            self.redraws += 1
+            tracer.count('redraws')
+        tracer.sample_counters()
+
+    def request_render(self, arc_title):
+        """Hands the figure of an arc to the render worker, in place of drawing
+        it on the Tk thread (see TracedCanvas.render_elsewhere)."""
+        arc_data = self.arcs.get(arc_title)
+        if not arc_data or 'fig' not in arc_data:
+            return
+        if 'render_snapshot' not in arc_data:
+            with tracer.span("render_snapshot"):
+                arc_data['render_snapshot'] = snapshot_arc_data(arc_data)
+        highlight = arc_data.get('highlight')
+        if highlight and highlight[1] in arc_data['main_plot'].nodes:
+            highlight = (highlight[0], arc_data['main_plot'].index_of(highlight[1]), *highlight[2:])
+        else:
+            highlight = None
+        fig, ax = arc_data['fig'], arc_data['ax']
+        self.render_worker.submit(arc_title, arc_data['render_snapshot'], tuple(fig.get_size_inches()), fig.dpi,
+                                  ax.get_xlim(), ax.get_ylim(), self.side_plot_render_mode,
+                                  self.background_image_path, highlight)
+        if self.render_poll is None:
+            self.render_poll = self.master.after(RENDER_POLL_MS, self._poll_render)
+
+    def _poll_render(self):
+        """Shows the newest finished render, unless a newer one was requested since."""
+        self.render_poll = None
+        latest = None
+        while True:
             try:
-                img = mpimg.imread(self.background_image_path)
-                # Ensure the image is displayed behind other plot elements
-                ax.imshow(img, extent=[ax.get_xlim()[0], ax.get_xlim()[1],
-                                             ax.get_ylim()[0], ax.get_ylim()[1]], aspect='auto', zorder=-1)
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not load background image: {e}")
-
-        # Set the facecolor of the plot to transparent after plotting data.
-        ax.set_facecolor((0, 0, 0, 0))  # Set transparent background.
-        arc_data['fig'].patch.set_alpha(0.0)  # Ensure figure background is also transparent.
-
-        self.update_xlabels()
-
-        canvas.draw()
+                result = self.render_worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if self.render_worker.is_current(result[0]):
+                latest = result
+        if latest:
+            self._show_render(*latest)
+        if not self.render_worker.idle() or not self.render_worker.results.empty():
+            self.render_poll = self.master.after(RENDER_POLL_MS, self._poll_render)
+
+    def _show_render(self, generation, arc_title, pixels):
+        if isinstance(pixels, Exception):
+            if str(pixels) != self.render_error:
+                self.render_error = str(pixels)
+                messagebox.showerror("Error", f"Could not render the plot: {pixels}")
+            return
+        self.render_error = None
+        arc_data = self.arcs.get(arc_title)
+        if not arc_data or 'canvas' not in arc_data:
+            return  # The arc or its canvas went away meanwhile
+        canvas = arc_data['canvas']
+        width, height = canvas.get_width_height(physical=True)
+        if pixels.shape[:2] != (height, width):
+            return  # Resized meanwhile, which requested another render
+        with tracer.span("render_blit"):
+            canvas.show_pixels(pixels)
+
+    def draw_artists(self, arc_title):
+        """Puts the artists on the figure of an arc, which background rendering
+        leaves without them, so the figure can be saved."""
+        arc_data = self.arcs[arc_title]
+        draw_arc(arc_data, self.side_plot_render_mode)
+        draw_background(arc_data, self.background_image_path)
+        draw_x_labels(arc_data)
+        draw_highlight(arc_data)
+
+    def redraw_report(self):
+        saved = self.redraw_requests - self.redraws
+        return f"Redraws: {self.redraws} done for {self.redraw_requests} requested, {saved} coalesced away"
 
 class TextEditorWindow(tk.Toplevel):
     def __init__(self, master, title, initial_title, initial_description, initial_label):
@@ -0,0 +1,106 @@
+"""Window background images, resized off the Tk thread.
+
+An image is decoded once into a mipmap pyramid: the full image, then each
+level half the size of the one before, down to MIN_LEVEL_PIXELS. A resize
+to the window size starts from the smallest level still at least that big,
+so a LANCZOS resize of a large photo to a small window reads a fraction of
+its pixels. A BackgroundResizer does the decoding and resizing on its own
+thread, keeping the pyramids of the most recently shown images, and the GUI
+only turns the finished image into a PhotoImage (see
+StoryPlotter.set_window_background). Nothing here touches Tk.
+"""
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+# Pyramids stop at the first level whose shorter side is below this
+MIN_LEVEL_PIXELS = 256
+
+# Pyramids of this many images are kept, so switching between arcs does not decode again
+MAX_PYRAMIDS = 4
+
+
+def build_pyramid(image):
+    """Returns [image, image at half size, at a quarter, ...] as RGB images."""
+    levels = [image.convert('RGB')]
+    while min(levels[-1].size) // 2 >= MIN_LEVEL_PIXELS:
+        levels.append(levels[-1].reduce(2))
+    return levels
+
+
+def pyramid_level(levels, width, height):
+    """Returns the smallest level of a pyramid at least width x height, or the full image if none is."""
+    for level in reversed(levels):
+        if level.width >= width and level.height >= height:
+            return level
+    return levels[0]
+
+
+class BackgroundResizer:
+    """Resizes window backgrounds on a background thread.
+
+    Only the newest request matters: submitting replaces a request that has
+    not started yet. Results are put on the results queue as (generation,
+    path, image), with image a PIL image of the requested size, or the
+    exception that stopped the resize.
+    """
+
+    def __init__(self, max_pyramids=MAX_PYRAMIDS):
+        self.max_pyramids = max_pyramids
+        self.results = queue.Queue()
+        self.generation = 0
+        self.pending = None  # (generation, path, size) not started yet
+        self.condition = threading.Condition()
+        self.pyramids = OrderedDict()  # {(path, modification time): levels}, most recently used last
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="BackgroundResizer", daemon=True)
+        self.thread.start()
+
+    def submit(self, path, width, height):
+        """Requests the image at path resized to width x height pixels. Returns
+        the generation of the request."""
+        with self.condition:
+            self.generation += 1
+            self.pending = (self.generation, path, (width, height))
+            self.condition.notify()
+            return self.generation
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                (generation, path, size), self.pending = self.pending, None
+            try:
+                image = self._resize(path, size)
+            except Exception as e:
+                image = e
+            self.results.put((generation, path, image))
+
+    def _resize(self, path, size):
+        key = (path, os.path.getmtime(path))
+        levels = self.pyramids.pop(key, None)
+        if levels is None:
+            with Image.open(path) as image:
+                levels = build_pyramid(image)
+        self.pyramids[key] = levels
+        while len(self.pyramids) > self.max_pyramids:
+            self.pyramids.popitem(last=False)
+
+        level = pyramid_level(levels, *size)
+        if level.size == size:
+            return level.copy()
+        return level.resize(size, Image.Resampling.LANCZOS)
@@ -0,0 +1,178 @@
+"""Cache of rendered arcs, kept in a directory next to a project file.
+
+Reopening a project would otherwise draw every arc it shows from nothing. The
+cache holds a raster of each arc as it was last drawn, so an unchanged arc is
+shown at once while its live figure is built (see StoryPlotter.show_preview).
+
+Entries are keyed by the SHA-1 of everything the picture depends on: the
+arc's saved data (which includes its marker style and background image path),
+the modification time and size of the background image, the pixel size and
+dpi of the figure and the side plot rendering mode. An arc changed in any of
+these misses the cache rather than showing a stale raster. Each entry is
+"<key>.png", the raster, and "<key>.json", the view it was drawn with (axis
+limits and pixel size). Entries are rendered by a background thread from
+snapshots (see story_core.snapshot_arc_data); once the directory holds more
+than max_bytes, the least recently used entries are deleted.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+
+from story_core import normalize_arc_data, render_arc
+
+CACHE_SUFFIX = '.cache'
+
+# Size cap of a cache directory, unless the "render_cache_mb" preset says otherwise
+DEFAULT_CACHE_MB = 200
+
+# Records the figure size entries were last rendered at, which lookups use
+FIGURE_SIZE_FILE = 'figure_size.json'
+
+
+def cache_dir_for(project_path):
+    return project_path + CACHE_SUFFIX
+
+
+def cache_key(snapshot, figure_size, side_plot_render_mode):
+    """Returns the key of an arc's entry. snapshot is the arc's saved data (see
+    story_core.serialize_arc_data) and figure_size is (width, height, dpi),
+    with width and height in pixels."""
+    background = snapshot.get('background_image_path')
+    try:
+        stat = os.stat(background) if background else None
+    except OSError:
+        stat = None
+    stamp = (stat.st_mtime_ns, stat.st_size) if stat else None
+    text = json.dumps([snapshot, stamp, list(figure_size), side_plot_render_mode])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class RenderCache:
+    """Cache directory of one project, written by a background thread.
+
+    get() only reads an entry's view, so it is cheap to call from the Tk thread;
+    put() queues a render."""
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = {}  # {key: (last use, bytes)}
+        self.size_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in os.listdir(cache_dir):
+            key, extension = os.path.splitext(name)
+            if extension == '.png':
+                try:
+                    stats = [os.stat(self._path(key, suffix)) for suffix in ('.png', '.json')]
+                except OSError:
+                    continue  # A render interrupted before its view was written
+                self._add(key, stats[0].st_mtime, sum(stat.st_size for stat in stats))
+
+        try:
+            with open(os.path.join(cache_dir, FIGURE_SIZE_FILE), 'r') as f:
+                self.figure_size = tuple(json.load(f))
+        except (OSError, ValueError):
+            self.figure_size = None  # (width, height, dpi) entries were last rendered at
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="RenderCache", daemon=True)
+        self.thread.start()
+
+    def get(self, snapshot, side_plot_render_mode):
+        """Returns (raster path, view) of an arc at the figure size entries were
+        last rendered at, or None if it is not cached."""
+        if self.figure_size is None:
+            return None
+        key = cache_key(snapshot, self.figure_size, side_plot_render_mode)
+        with self.lock:
+            if key not in self.entries:
+                return None
+            path = self._path(key, '.png')
+            try:
+                with open(self._path(key, '.json'), 'r') as f:
+                    view = json.load(f)
+                os.utime(path)  # Marks it as recently used for eviction, also across sessions
+            except (OSError, ValueError):
+                self._remove(key)
+                return None
+            self.entries[key] = (os.stat(path).st_mtime, self.entries[key][1])
+        return path, view
+
+    def put(self, snapshot, figure_size, side_plot_render_mode):
+        """Queues a render of an arc, unless it is already cached. snapshot must
+        not change afterwards; figure_size is (width, height, dpi)."""
+        self.queue.put((snapshot, tuple(figure_size), side_plot_render_mode))
+
+    def close(self):
+        """Stops the background thread, dropping the renders not started yet.
+
+        Waits for a render in progress only, so closing a project or quitting
+        does not draw every queued arc first; the dropped arcs are cached the
+        next time they are shown."""
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.queue.put(None)
+        self.thread.join()
+
+    def _path(self, key, extension):
+        return os.path.join(self.cache_dir, key + extension)
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            try:
+                self._write(*job)
+            except Exception as e:
+                print(f"Caching a render in {self.cache_dir} failed: {e}")
+
+    def _write(self, snapshot, figure_size, side_plot_render_mode):
+        key = cache_key(snapshot, figure_size, side_plot_render_mode)
+        if figure_size != self.figure_size:
+            with open(os.path.join(self.cache_dir, FIGURE_SIZE_FILE), 'w') as f:
+                json.dump(figure_size, f)
+            self.figure_size = figure_size
+        with self.lock:
+            if key in self.entries:
+                return
+
+        width, height, dpi = figure_size
+        path = self._path(key, '.png')
+        # Written under a temporary name, so an entry is never a partial file
+        # Drawn with level of detail, as the live figure that replaces it is
+        view = render_arc(normalize_arc_data(dict(snapshot)), f"{path}.tmp", side_plot_render_mode,
+                          figsize=(width / dpi, height / dpi), dpi=dpi, file_format='png', level_of_detail=True)
+        view['size'] = [width, height]
+        with open(self._path(key, '.json'), 'w') as f:
+            json.dump(view, f)
+        os.replace(f"{path}.tmp", path)
+
+        with self.lock:
+            self._add(key, os.stat(path).st_mtime,
+                      os.path.getsize(path) + os.path.getsize(self._path(key, '.json')))
+            # Least recently used first, keeping the entry just written
+            for old_key in sorted(self.entries, key=lambda k: self.entries[k][0]):
+                if self.size_bytes <= self.max_bytes:
+                    break
+                if old_key != key:
+                    self._remove(old_key)
+
+    def _add(self, key, last_use, size):
+        self.entries[key] = (last_use, size)
+        self.size_bytes += size
+
+    def _remove(self, key):
+        _, size = self.entries.pop(key)
+        self.size_bytes -= size
+        for suffix in ('.png', '.json'):
+            try:
+                os.remove(self._path(key, suffix))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,320 @@
+"""Compact in-memory form of an arc, for very large stories.
+
+The usual in-memory arc (see story_core.normalize_arc_data) holds every plot
+point as a tuple of strings inside lists nested in dicts, and every main plot
+point as a node of the MainPlot tree. At 100k+ points that per-object overhead
+outweighs the text itself. CompactArc instead keeps each field in its own
+column: arrays of indexes into a StringPool, which holds the text of all
+strings back to back in one buffer, and per main plot point a slot holding its
+side plots (arrays again) and the index of their color. Text searches run over
+that buffer directly (see CompactArc.find), without building a string per point.
+
+A CompactArc supports the edit operations of story_core.apply_op and the point
+lookups the GUI needs, and converts losslessly to and from the saved form of
+project files (to_saved and from_saved). benchmarks/memory_benchmark.py
+compares its memory use and scan speed with the usual form.
+"""
+import bisect
+import json
+from array import array
+
+# Column type of string pool indexes (unsigned 32-bit)
+INDEX_TYPE = 'I'
+
+# Color column entry of main plot points without a side plot color
+NO_COLOR = -1
+
+# Strings up to this long (labels, colors, empty descriptions) tend to repeat, so each is stored once
+SHARED_MAX_LENGTH = 16
+
+
+class StringPool:
+    """Stores strings as UTF-8, back to back in one buffer; columns refer to
+    them by index. Short strings are stored once however often they are added.
+    Strings are never removed, so edits leave unused text behind until the arc
+    is converted anew."""
+
+    __slots__ = ('buffer', 'offsets', 'shared')
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array('Q', [0])  # String i is buffer[offsets[i]:offsets[i + 1]]
+        self.shared = {}  # {short string: index}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].decode()
+
+    def add(self, string):
+        """Returns the index of string, adding it if it is new or not short."""
+        shared = len(string) <= SHARED_MAX_LENGTH
+        if shared:
+            index = self.shared.get(string)
+            if index is not None:
+                return index
+        index = len(self.offsets) - 1
+        self.buffer += string.encode()
+        self.offsets.append(len(self.buffer))
+        if shared:
+            self.shared[string] = index
+        return index
+
+    def find(self, text):
+        """Returns the set of indexes of the strings containing text."""
+        needle = text.encode()
+        if not needle:
+            return set(range(len(self)))
+        buffer, offsets = self.buffer, self.offsets
+        hits = set()
+        start = buffer.find(needle)
+        while start != -1:
+            index = bisect.bisect_right(offsets, start) - 1
+            end = offsets[index + 1]
+            if start + len(needle) <= end:
+                hits.add(index)
+                start = buffer.find(needle, end)  # The rest of this string does not matter
+            else:
+                start = buffer.find(needle, start + 1)  # The match ran into the next string
+        return hits
+
+
+class _SidePlot:
+    """The points of one side plot, as title and description columns."""
+
+    __slots__ = ('titles', 'descriptions')
+
+    def __init__(self):
+        self.titles = array(INDEX_TYPE)
+        self.descriptions = array(INDEX_TYPE)
+
+    def __len__(self):
+        return len(self.titles)
+
+
+class CompactArc:
+    """An arc stored column by column. Main and side plot points are addressed
+    by position, like in the edit operations and project files."""
+
+    def __init__(self, marker_style='o', background_image_path=None):
+        self.pool = StringPool()
+        # Main plot columns, one entry per main plot point
+        self.titles = array(INDEX_TYPE)
+        self.descriptions = array(INDEX_TYPE)
+        self.labels = array(INDEX_TYPE)
+        self.colors = array('i')  # Pool index of the side plot color, or NO_COLOR
+        self.side_plots = []  # None, or the point's [_SidePlot] in side plot order
+        self.marker_style = marker_style
+        self.background_image_path = background_image_path
+        self.x_axis_labels = {}
+
+    # --- Conversion ---
+
+    @classmethod
+    def from_saved(cls, data):
+        """Builds a compact arc from its saved form, as in project files (side
+        plots keyed by main plot position, as strings if loaded from JSON)."""
+        arc = cls(data.get('marker_style', 'o'), data.get('background_image_path'))
+        arc.x_axis_labels = dict(data.get('x_axis_labels', {}))
+        add = arc.pool.add
+        main_plot = data.get('main_plot', [])
+        arc.titles.extend(add(title) for title, _, _ in main_plot)
+        arc.descriptions.extend(add(description) for _, description, _ in main_plot)
+        arc.labels.extend(add(label) for _, _, label in main_plot)
+        arc.colors.extend([NO_COLOR] * len(main_plot))
+        arc.side_plots = [None] * len(main_plot)
+        for main_index, color in data.get('subplot_colors', {}).items():
+            arc.colors[int(main_index)] = NO_COLOR if color is None else add(color)
+        for main_index, side_plot_data in data.get('side_plots', {}).items():
+            side_plots = arc.side_plots[int(main_index)] = []
+            for _, points in sorted(side_plot_data.items(), key=lambda item: int(item[0])):
+                side_plot = _SidePlot()
+                side_plot.titles.extend(add(title) for title, _ in points)
+                side_plot.descriptions.extend(add(description) for _, description in points)
+                side_plots.append(side_plot)
+        return arc
+
+    def to_saved(self):
+        """Returns the saved form of the arc (see story_core.serialize_arc_data)."""
+        strings = self.pool
+        data = {
+            'main_plot': [[strings[title], strings[description], strings[label]]
+                          for title, description, label in zip(self.titles, self.descriptions, self.labels)],
+            'side_plots': {},
+            'side_plot_counts': {},
+            'subplot_colors': {main_index: strings[color] for main_index, color in enumerate(self.colors)
+                               if color != NO_COLOR},
+            'marker_style': self.marker_style,
+            'background_image_path': self.background_image_path,
+            'x_axis_labels': dict(self.x_axis_labels),
+        }
+        for main_index, side_plots in enumerate(self.side_plots):
+            if side_plots:
+                data['side_plots'][main_index] = {
+                    side_plot_index: [[strings[title], strings[description]]
+                                      for title, description in zip(side_plot.titles, side_plot.descriptions)]
+                    for side_plot_index, side_plot in enumerate(side_plots, start=1)
+                }
+                data['side_plot_counts'][main_index] = len(side_plots)
+        return data
+
+    # --- Lookups ---
+
+    def __len__(self):
+        return len(self.titles)
+
+    def main_point(self, main_index):
+        """Returns (title, description, label) of a main plot point."""
+        strings = self.pool
+        return (strings[self.titles[main_index]], strings[self.descriptions[main_index]],
+                strings[self.labels[main_index]])
+
+    def main_points(self):
+        """Yields every main plot point as (title, description, label), in plot order."""
+        strings = self.pool
+        for title, description, label in zip(self.titles, self.descriptions, self.labels):
+            yield strings[title], strings[description], strings[label]
+
+    def side_plot_count(self, main_index):
+        return len(self.side_plots[main_index] or ())
+
+    def side_plot_color(self, main_index):
+        color = self.colors[main_index]
+        return None if color == NO_COLOR else self.pool[color]
+
+    def side_plot(self, main_index, side_plot_index):
+        """Returns the points of a side plot as [(title, description)]."""
+        side_plot = self.side_plots[main_index][side_plot_index - 1]
+        strings = self.pool
+        return [(strings[title], strings[description])
+                for title, description in zip(side_plot.titles, side_plot.descriptions)]
+
+    def side_point(self, main_index, side_plot_index, index):
+        side_plot = self.side_plots[main_index][side_plot_index - 1]
+        return self.pool[side_plot.titles[index]], self.pool[side_plot.descriptions[index]]
+
+    def points(self):
+        """Yields every point as (main_index, side_plot_index, side_x_index, title,
+        description), with None side indexes for main plot points, in plot order."""
+        strings = self.pool
+        for main_index, (title, description) in enumerate(zip(self.titles, self.descriptions)):
+            yield main_index, None, None, strings[title], strings[description]
+            for side_plot_index, side_plot in enumerate(self.side_plots[main_index] or (), start=1):
+                for side_x_index, (title, description) in enumerate(zip(side_plot.titles, side_plot.descriptions)):
+                    yield main_index, side_plot_index, side_x_index, strings[title], strings[description]
+
+    def find(self, text):
+        """Returns the positions (main_index, side_plot_index, side_x_index) of the
+        points whose title, description or label contains text (case-sensitive),
+        in plot order, with None side indexes for main plot points."""
+        hits = self.pool.find(text)
+        if not hits:
+            return []
+        found = [(main_index, None, None) for column in (self.titles, self.descriptions, self.labels)
+                 for main_index, string in enumerate(column) if string in hits]
+        for main_index, side_plots in enumerate(self.side_plots):
+            for side_plot_index, side_plot in enumerate(side_plots or (), start=1):
+                for column in (side_plot.titles, side_plot.descriptions):
+                    if not hits.isdisjoint(column):
+                        found.extend((main_index, side_plot_index, side_x_index)
+                                     for side_x_index, string in enumerate(column) if string in hits)
+        return sorted(set(found), key=lambda position: (position[0], position[1] or 0, position[2] or 0))
+
+    # --- Edit Operations ---
+
+    def insert_main(self, main_index, point):
+        title, description, label = point
+        self.titles.insert(main_index, self.pool.add(title))
+        self.descriptions.insert(main_index, self.pool.add(description))
+        self.labels.insert(main_index, self.pool.add(label))
+        self.colors.insert(main_index, NO_COLOR)
+        self.side_plots.insert(main_index, None)
+
+    def edit_main(self, main_index, point):
+        title, description, label = point
+        self.titles[main_index] = self.pool.add(title)
+        self.descriptions[main_index] = self.pool.add(description)
+        self.labels[main_index] = self.pool.add(label)
+
+    def delete_main(self, main_index):
+        """Deletes a main plot point and all its side plots."""
+        for column in (self.titles, self.descriptions, self.labels, self.colors, self.side_plots):
+            del column[main_index]
+
+    def add_side_plot(self, main_index, point, color=None):
+        """Starts a new side plot after the others of a main plot point and returns its index."""
+        side_plot_index = self.side_plot_count(main_index) + 1
+        self.insert_side_plot(main_index, side_plot_index, point, color)
+        return side_plot_index
+
+    def insert_side_plot(self, main_index, side_plot_index, point, color=None):
+        """Starts a new side plot at side_plot_index, moving the ones from there on up.
+        color is used if the main plot point has no side plot color yet."""
+        if self.side_plots[main_index] is None:
+            self.side_plots[main_index] = []
+        if self.colors[main_index] == NO_COLOR:
+            self.colors[main_index] = self.pool.add(color or "red")
+        side_plot = _SidePlot()
+        self.side_plots[main_index].insert(side_plot_index - 1, side_plot)
+        self._insert_side(side_plot, 0, point)
+
+    def insert_side(self, main_index, side_plot_index, index, point):
+        self._insert_side(self.side_plots[main_index][side_plot_index - 1], index, point)
+
+    def edit_side(self, main_index, side_plot_index, index, point):
+        title, description = point
+        side_plot = self.side_plots[main_index][side_plot_index - 1]
+        side_plot.titles[index] = self.pool.add(title)
+        side_plot.descriptions[index] = self.pool.add(description)
+
+    def delete_side(self, main_index, side_plot_index, index):
+        """Deletes a side plot point, and the side plot if it becomes empty."""
+        side_plots = self.side_plots[main_index]
+        side_plot = side_plots[side_plot_index - 1]
+        del side_plot.titles[index]
+        del side_plot.descriptions[index]
+        if not side_plot:
+            del side_plots[side_plot_index - 1]
+            if not side_plots:
+                self.side_plots[main_index] = None
+                self.colors[main_index] = NO_COLOR
+
+    def apply_op(self, op):
+        """Performs an edit operation on this arc (see story_core.apply_op;
+        add_arc and delete_arc concern the arcs around it)."""
+        kind = op['op']
+        if kind == 'insert_main':
+            self.insert_main(op['index'], op['point'])
+        elif kind == 'edit_main':
+            self.edit_main(op['index'], op['point'])
+        elif kind == 'delete_main':
+            self.delete_main(op['index'])
+        elif kind == 'add_side_plot':
+            self.add_side_plot(op['main_index'], op['point'], op.get('color'))
+        elif kind == 'insert_side_plot':
+            self.insert_side_plot(op['main_index'], op['side_plot_index'], op['point'], op.get('color'))
+        elif kind == 'insert_side':
+            self.insert_side(op['main_index'], op['side_plot_index'], op['index'], op['point'])
+        elif kind == 'edit_side':
+            self.edit_side(op['main_index'], op['side_plot_index'], op['index'], op['point'])
+        elif kind == 'delete_side':
+            self.delete_side(op['main_index'], op['side_plot_index'], op['index'])
+        elif kind == 'set_marker':
+            self.marker_style = op['marker_style']
+        elif kind == 'set_background':
+            self.background_image_path = op['path']
+        else:
+            raise ValueError(f"Unknown operation: {kind}")
+
+    def _insert_side(self, side_plot, index, point):
+        title, description = point
+        side_plot.titles.insert(index, self.pool.add(title))
+        side_plot.descriptions.insert(index, self.pool.add(description))
+
+
+def load_compact_story(path):
+    """Reads a project file and returns its arcs ({arc_title: CompactArc})."""
+    with open(path, 'r') as f:
+        loaded_data = json.load(f)
+    return {arc_title: CompactArc.from_saved(data) for arc_title, data in loaded_data.items()}
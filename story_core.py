@@ -0,0 +1,1342 @@
+"""Headless story model, layout and rendering for StoryLined.
+
+Nothing in this module touches Tk: arcs are dicts much like the JSON project
+files, except that the main plot is a MainPlot and everything hanging off a
+main plot point is keyed by the point's stable id instead of its position (see
+normalize_arc_data and serialize_arc_data). They are laid out with ArcLayout
+and drawn onto a matplotlib Figure by ArcRenderer. The GUI in main.py attaches a Tk canvas to those figures, while
+batch_render.py renders them straight to files with the Agg canvas.
+"""
+import bisect
+import difflib
+import json
+import math
+import os
+import queue
+import random
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from PIL import Image
+
+from story_trace import tracer
+
+# Arc data entries written to project files; everything else is runtime state
+SERIALIZED_KEYS = ('main_plot', 'side_plots', 'side_plot_counts', 'subplot_colors',
+                   'marker_style', 'background_image_path', 'x_axis_labels')
+
+# Arc data entries that belong to a live figure and are dropped when it is released
+FIGURE_KEYS = ('fig', 'ax', 'canvas', 'toolbar', 'renderer', 'point_index',
+               'main_plot_lines', 'side_plot_lines', 'side_plot_collections',
+               'label_entries', 'x_label_entries', 'render_snapshot', 'level_of_detail')
+
+# --- Level of Detail ---
+# Labels are only drawn for points inside the visible part of the axes. When
+# neighbouring main plot points are closer than LABEL_MIN_PIXELS_PER_POINT, or
+# more than MAX_VISIBLE_LABELS labels would be visible, the labels collapse into
+# one marker per LABEL_CLUSTER_PIXELS square showing how many points it holds.
+# Rendering to files (render_arc) always draws every label.
+LABEL_MIN_PIXELS_PER_POINT = 12
+MAX_VISIBLE_LABELS = 200
+LABEL_CLUSTER_PIXELS = 60
+
+# --- Artist Styles ---
+# Static keyword arguments for every kind of artist drawn on an arc. Values that
+# vary per point (positions, text, color, marker) are carried in the artist specs.
+ARTIST_STYLES = {
+    'main_line': dict(linestyle="-", color="#3498db", markersize=15, linewidth=3, picker=5),
+    'main_annotation': dict(textcoords="offset points", xytext=(0, 10), ha="center", fontsize=12,
+                            bbox=dict(boxstyle="round,pad=0.3", facecolor="white", alpha=0.8)),
+    'side_connector': dict(linestyle=":", markersize=10, linewidth=3, picker=5),
+    'side_first_point': dict(linestyle="", markersize=10, picker=5),
+    'side_segment': dict(linestyle="-", markersize=10, linewidth=3, picker=5),
+    'side_first_annotation': dict(textcoords="offset points", xytext=(-20, 0), ha="right", fontsize=10,
+                                  bbox=dict(boxstyle="round,pad=0.3", facecolor="white", alpha=0.7)),
+    'side_annotation': dict(textcoords="offset points", xytext=(0, 5), ha="center", fontsize=10,
+                            bbox=dict(boxstyle="round,pad=0.3", facecolor="white", alpha=0.7)),
+    # Batched side plot artists used by the 'collections' rendering mode
+    'side_segments': dict(linewidths=3, picker=5, zorder=2),
+    'side_markers': dict(s=10 ** 2, picker=5, zorder=2),
+    'x_label': dict(ha='center', va='bottom', fontsize=12, color='black',
+                    bbox=dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.5'),
+                    zorder=10, clip_on=True),
+    'label_cluster': dict(ha='center', va='center', fontsize=9, color='white',
+                          bbox=dict(boxstyle='circle,pad=0.4', facecolor='#34495e', alpha=0.8),
+                          zorder=5, clip_on=True),
+}
+
+
+class ArcRenderer:
+    """Keeps the artists of one arc keyed by plot element, so a redraw only adds,
+    removes or updates the artists whose spec changed instead of clearing the axes.
+
+    A spec is a plain tuple describing an artist:
+        ('line', style, xs, ys, overrides)  -> Line2D, overrides is a tuple of (property, value)
+        ('annotation', style, text, xy)     -> Annotation
+        ('text', style, text, xy)           -> Text in data coordinates
+        ('image', image_key, extent)        -> AxesImage, image_key as built by BackgroundImageCache.key
+        ('segments', style, segments, colors, linestyles) -> LineCollection
+        ('markers', style, offsets, colors, marker)       -> PathCollection
+    """
+
+    def __init__(self, ax):
+        self.ax = ax
+        self.groups = {}  # {group: {key: (spec, artist)}}
+
+    def sync(self, group, specs):
+        """Brings the artists of a group in line with specs ({key: spec}) and
+        returns {key: artist} for the whole group."""
+        current = self.groups.setdefault(group, {})
+        created = updated = 0
+
+        # Remove artists whose element no longer exists
+        removed = [key for key in current if key not in specs]
+        for key in removed:
+            _, artist = current.pop(key)
+            artist.remove()
+
+        # Add new artists and update the ones whose spec changed
+        for key, spec in specs.items():
+            entry = current.get(key)
+            if entry is None:
+                current[key] = (spec, self._create(spec))
+                created += 1
+            elif entry[0] != spec:
+                old_spec, artist = entry
+                if not self._update(artist, old_spec, spec):
+                    artist.remove()
+                    artist = self._create(spec)
+                    created += 1
+                current[key] = (spec, artist)
+                updated += 1
+
+        if tracer.enabled:
+            tracer.count('artists_created', created)
+            tracer.count('artists_updated', updated)
+            tracer.count('artists_removed', len(removed))
+        return {key: artist for key, (_, artist) in current.items()}
+
+    def clear(self):
+        """Removes every artist managed by the renderer."""
+        for entries in self.groups.values():
+            for _, artist in entries.values():
+                artist.remove()
+        self.groups = {}
+
+    def _create(self, spec):
+        kind = spec[0]
+        if kind == 'line':
+            _, style, xs, ys, overrides = spec
+            line, = self.ax.plot(xs, ys, **ARTIST_STYLES[style], **dict(overrides))
+            return line
+        if kind == 'annotation':
+            _, style, text, xy = spec
+            return self.ax.annotate(text, xy, **ARTIST_STYLES[style])
+        if kind == 'text':
+            _, style, text, (x, y) = spec
+            return self.ax.text(x, y, text, transform=self.ax.transData, **ARTIST_STYLES[style])
+        if kind == 'image':
+            _, image_key, extent = spec
+            img = background_image_cache.get(image_key)
+            # Ensure the image is displayed behind other plot elements
+            return self.ax.imshow(img, extent=extent, aspect='auto', zorder=-1)
+        if kind == 'segments':
+            _, style, segments, colors, linestyles = spec
+            collection = LineCollection(segments, colors=colors, linestyles=linestyles, **ARTIST_STYLES[style])
+            self.ax.add_collection(collection, autolim=False)
+            return collection
+        if kind == 'markers':
+            _, style, offsets, colors, marker = spec
+            xs, ys = zip(*offsets)
+            return self.ax.scatter(xs, ys, color=colors, marker=marker, **ARTIST_STYLES[style])
+        raise ValueError(f"Unknown artist kind: {kind}")
+
+    def _update(self, artist, old_spec, spec):
+        """Updates an artist in place. Returns False if it has to be re-created."""
+        kind = spec[0]
+        if kind != old_spec[0]:
+            return False
+        if kind == 'line':
+            if spec[1] != old_spec[1]:
+                return False
+            artist.set_data(spec[2], spec[3])
+            if spec[4] != old_spec[4]:
+                artist.set(**dict(spec[4]))
+            return True
+        if kind == 'annotation':
+            if spec[1] != old_spec[1]:
+                return False
+            artist.set_text(spec[2])
+            artist.xy = spec[3]
+            return True
+        if kind == 'text':
+            if spec[1] != old_spec[1]:
+                return False
+            artist.set_text(spec[2])
+            artist.set_position(spec[3])
+            return True
+        if kind == 'image':
+            # Keep the one AxesImage, swapping in new pixels only if the file or size changed
+            if spec[1] != old_spec[1]:
+                artist.set_data(background_image_cache.get(spec[1]))
+            artist.set_extent(spec[2])
+            return True
+        if kind == 'segments':
+            if spec[1] != old_spec[1]:
+                return False
+            artist.set_segments(spec[2])
+            artist.set_color(spec[3])
+            artist.set_linestyle(spec[4])
+            return True
+        if kind == 'markers':
+            if spec[1] != old_spec[1] or spec[4] != old_spec[4]:
+                return False  # The marker path is baked into the collection
+            artist.set_offsets(spec[2])
+            artist.set_color(spec[3])
+            return True
+        return False
+
+
+class BackgroundImageCache:
+    """Decoded background images, downsampled to the pixel size they are shown at.
+
+    Entries are keyed by (path, mtime, width, height), so an image is decoded
+    again only when the file changes or the figure is resized. The least
+    recently used images are evicted once the cache holds more than max_bytes.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()  # {key: RGBA array}
+        self.size_bytes = 0
+        self.lock = threading.Lock()  # Also used from the RenderWorker thread
+
+    @staticmethod
+    def key(path, width, height):
+        return (path, os.path.getmtime(path), int(width), int(height))
+
+    def get(self, key):
+        with self.lock:
+            return self._get(key)
+
+    def _get(self, key):
+        if key in self.images:
+            self.images.move_to_end(key)
+            return self.images[key]
+
+        path, _, width, height = key
+        with Image.open(path) as img:
+            img.draft('RGB', (width, height))  # Lets JPEG decode straight at a reduced scale
+            if img.width > width or img.height > height:
+                img = img.resize((min(img.width, width), min(img.height, height)), Image.Resampling.LANCZOS)
+            array = np.asarray(img.convert('RGBA'))
+
+        self.images[key] = array
+        self.size_bytes += array.nbytes
+        while self.size_bytes > self.max_bytes and len(self.images) > 1:
+            _, evicted = self.images.popitem(last=False)
+            self.size_bytes -= evicted.nbytes
+        return array
+
+
+# Shared by all arcs, so arcs with the same background decode it once
+background_image_cache = BackgroundImageCache()
+
+
+class _MainPlotNode:
+    """A main plot point in the order tree of MainPlot."""
+
+    __slots__ = ('id', 'point', 'priority', 'size', 'rows', 'total_rows', 'left', 'right', 'parent')
+
+    def __init__(self, point_id, point):
+        self.id = point_id
+        self.point = point
+        self.priority = random.random()
+        self.size = 1  # Points in the subtree
+        self.rows = 0  # Side plots of this point
+        self.total_rows = 0  # Side plots of the subtree
+        self.left = self.right = self.parent = None
+
+    def update(self):
+        left, right = self.left, self.right
+        self.size = 1 + (left.size if left else 0) + (right.size if right else 0)
+        self.total_rows = self.rows + (left.total_rows if left else 0) + (right.total_rows if right else 0)
+
+
+class MainPlot:
+    """The main plot points of an arc, a sequence of (title, description, label)
+    in plot order.
+
+    Every point also has an id that stays the same while points are inserted
+    and deleted around it. Side plots, colors, tree rows and artists are keyed
+    by these ids, so a structural edit does not renumber everything after it.
+    The order is kept in a treap indexed by position, which finds the point at
+    an index, the index of an id, and inserts or deletes in O(log n). The tree
+    also sums the side plot count of each point (its rows, set by set_rows)
+    for ArcLayout.
+    """
+
+    def __init__(self, points=()):
+        self.nodes = {}  # {point id: node}
+        self.root = None
+        self.next_id = 0
+
+        # Built left to right along the right spine, in O(n)
+        spine = []
+        for point in points:
+            node = self._new_node(point)
+            last = None
+            while spine and spine[-1].priority < node.priority:
+                last = spine.pop()
+                last.update()
+            node.left = last
+            if last:
+                last.parent = node
+            if spine:
+                spine[-1].right = node
+                node.parent = spine[-1]
+            else:
+                self.root = node
+            spine.append(node)
+        while spine:
+            spine.pop().update()
+
+    def __len__(self):
+        return self.root.size if self.root else 0
+
+    def __getitem__(self, index):
+        return self._node_at(index).point
+
+    def __setitem__(self, index, point):
+        self._node_at(index).point = point
+
+    def __delitem__(self, index):
+        self.delete(index)
+
+    def __iter__(self):
+        for _, point in self.items():
+            yield point
+
+    def __repr__(self):
+        return f"MainPlot({list(self)!r})"
+
+    def items(self):
+        """Yields (point id, point) in plot order."""
+        stack = []
+        node = self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.id, node.point
+            node = node.right
+
+    def ids(self):
+        for point_id, _ in self.items():
+            yield point_id
+
+    def get(self, point_id):
+        return self.nodes[point_id].point
+
+    def id_at(self, index):
+        return self._node_at(index).id
+
+    def index_of(self, point_id):
+        node = self.nodes[point_id]
+        index = node.left.size if node.left else 0
+        while node.parent:
+            if node is node.parent.right:
+                index += 1 + (node.parent.left.size if node.parent.left else 0)
+            node = node.parent
+        return index
+
+    def insert(self, index, point):
+        """Inserts point before index and returns its id."""
+        node = self._new_node(point)
+        if self.root is None:
+            self.root = node
+            return node.id
+        index = max(0, min(index, len(self)))
+        parent = self.root
+        while True:
+            parent.size += 1
+            left_size = parent.left.size if parent.left else 0
+            if index <= left_size:
+                if parent.left is None:
+                    parent.left = node
+                    break
+                parent = parent.left
+            else:
+                index -= left_size + 1
+                if parent.right is None:
+                    parent.right = node
+                    break
+                parent = parent.right
+        node.parent = parent
+        while node.parent and node.priority > node.parent.priority:
+            self._rotate_up(node)
+        return node.id
+
+    def append(self, point):
+        return self.insert(len(self), point)
+
+    def delete(self, index):
+        """Deletes the point at index and returns its id."""
+        node = self._node_at(index)
+        # Rotate the node down until it has at most one child, then splice it out
+        while node.left and node.right:
+            self._rotate_up(node.left if node.left.priority > node.right.priority else node.right)
+        child = node.left or node.right
+        parent = node.parent
+        if child:
+            child.parent = parent
+        if parent is None:
+            self.root = child
+        elif parent.left is node:
+            parent.left = child
+        else:
+            parent.right = child
+        while parent:
+            parent.size -= 1
+            parent.total_rows -= node.rows
+            parent = parent.parent
+        del self.nodes[node.id]
+        return node.id
+
+    @property
+    def total_rows(self):
+        return self.root.total_rows if self.root else 0
+
+    def set_rows(self, point_id, rows):
+        """Sets the number of side plots of a point."""
+        node = self.nodes[point_id]
+        delta = rows - node.rows
+        node.rows = rows
+        while node:
+            node.total_rows += delta
+            node = node.parent
+
+    def rows_before(self, index):
+        """Returns the number of side plots of the points before index."""
+        rows = 0
+        node = self.root
+        while node:
+            left_size = node.left.size if node.left else 0
+            if index <= left_size:
+                node = node.left
+            else:
+                rows += node.rows + (node.left.total_rows if node.left else 0)
+                index -= left_size + 1
+                node = node.right
+        return rows
+
+    def _new_node(self, point):
+        node = _MainPlotNode(self.next_id, point)
+        self.nodes[node.id] = node
+        self.next_id += 1
+        return node
+
+    def _node_at(self, index):
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("main plot index out of range")
+        node = self.root
+        while True:
+            left_size = node.left.size if node.left else 0
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node
+            else:
+                index -= left_size + 1
+                node = node.right
+
+    def _rotate_up(self, node):
+        """Rotates node above its parent, keeping the order of the points."""
+        parent = node.parent
+        grandparent = parent.parent
+        if parent.left is node:
+            parent.left = node.right
+            if node.right:
+                node.right.parent = parent
+            node.right = parent
+        else:
+            parent.right = node.left
+            if node.left:
+                node.left.parent = parent
+            node.left = parent
+        parent.parent = node
+        node.parent = grandparent
+        if grandparent is None:
+            self.root = node
+        elif grandparent.left is parent:
+            grandparent.left = node
+        else:
+            grandparent.right = node
+        parent.update()
+        node.update()
+
+
+class ArcLayout:
+    """Vertical layout of an arc's side plots.
+
+    Side plots are stacked in rows below the main plot, so the row offset of a
+    main point is the number of side plots of all points before it. Those
+    counts are summed in the order tree of the MainPlot, so an offset takes
+    O(log n) and an edit never has to shift the offsets of later points.
+    """
+
+    def __init__(self, main_plot):
+        self.main_plot = main_plot
+
+    @property
+    def max_y(self):
+        return self.main_plot.total_rows
+
+    def offset(self, main_index):
+        return self.main_plot.rows_before(main_index)
+
+    def side_plot_y(self, main_index, side_plot_index):
+        return -side_plot_index - self.offset(main_index)
+
+
+class PointIndex:
+    """Grid bucket index over the data coordinates of an arc's plot points.
+
+    Hits are (main_id, side_plot_index, side_x_index) tuples, with main_id
+    the id of the main plot point in the MainPlot, and side_plot_index 0 and
+    side_x_index None for main plot points. Plot points
+    sit on integer coordinates, so one bucket per unit cell keeps lookups
+    constant time regardless of arc size.
+    """
+
+    def __init__(self):
+        self.positions = {}  # {hit: (x, y)}
+        self.buckets = {}  # {(cell_x, cell_y): [hit, ...]}
+
+    def sync(self, positions):
+        """Updates the index to positions ({hit: (x, y)}), touching only the
+        hits that were added, removed or moved."""
+        for hit in [hit for hit in self.positions if hit not in positions]:
+            self._remove(hit)
+        for hit, position in positions.items():
+            old_position = self.positions.get(hit)
+            if old_position != position:
+                if old_position is not None:
+                    self._remove(hit)
+                self._add(hit, position)
+
+    def at(self, x, y):
+        """Returns the hit in the cell containing (x, y), or None."""
+        hits = self.buckets.get((round(x), round(y)))
+        return hits[0] if hits else None
+
+    def nearest(self, x, y, radius_x, radius_y):
+        """Returns the hit closest to (x, y) within an ellipse of the given data
+        radii, or None."""
+        best, best_distance = None, 1.0
+        for cell_x in range(math.floor(x - radius_x), math.ceil(x + radius_x) + 1):
+            for cell_y in range(math.floor(y - radius_y), math.ceil(y + radius_y) + 1):
+                for hit in self.buckets.get((cell_x, cell_y), ()):
+                    hit_x, hit_y = self.positions[hit]
+                    distance = ((hit_x - x) / radius_x) ** 2 + ((hit_y - y) / radius_y) ** 2
+                    if distance <= best_distance:
+                        best, best_distance = hit, distance
+        return best
+
+    def _add(self, hit, position):
+        self.positions[hit] = position
+        self.buckets.setdefault((round(position[0]), round(position[1])), []).append(hit)
+
+    def _remove(self, hit):
+        position = self.positions.pop(hit)
+        cell = (round(position[0]), round(position[1]))
+        self.buckets[cell].remove(hit)
+        if not self.buckets[cell]:
+            del self.buckets[cell]
+
+
+def new_arc_data(marker_style='o'):
+    """Returns the data of an empty arc, as saved in project files."""
+    return {
+        'main_plot': [],
+        'side_plots': {},
+        'side_plot_counts': {},
+        'subplot_colors': {},
+        'marker_style': marker_style,
+        'background_image_path': None,
+        'x_axis_labels': {}
+    }
+
+
+def normalize_arc_data(data):
+    """Turns arc data as saved in project files (side plots keyed by the position
+    of their main plot point, as strings if loaded from JSON) into the in-memory
+    form, with a MainPlot and everything else keyed by main plot point id."""
+    main_plot = MainPlot(data.get('main_plot', []))
+    # A freshly built MainPlot numbers its points by position
+    data['main_plot'] = main_plot
+    data['side_plots'] = {
+        int(main_index): {int(side_plot_index): points for side_plot_index, points in side_plot_data.items()}
+        for main_index, side_plot_data in data.get('side_plots', {}).items()
+    }
+    data['side_plot_counts'] = {int(key): value for key, value in data.get('side_plot_counts', {}).items()}
+    data['subplot_colors'] = {int(key): value for key, value in data.get('subplot_colors', {}).items()}
+    data['x_axis_labels'] = data.get('x_axis_labels', {})
+    for main_id, count in data['side_plot_counts'].items():
+        if main_id in main_plot.nodes:
+            main_plot.set_rows(main_id, count)
+    return data
+
+
+def serialize_arc_data(arc_data):
+    """Returns the part of an arc that is saved to project files, with the side
+    plots keyed by the position of their main plot point again."""
+    data = {key: arc_data[key] for key in SERIALIZED_KEYS}
+    main_plot = arc_data['main_plot']
+    data['main_plot'] = list(main_plot)
+    data['side_plots'] = {}
+    data['side_plot_counts'] = {}
+    data['subplot_colors'] = {}
+    for main_index, main_id in enumerate(main_plot.ids()):
+        if main_id in arc_data['side_plots']:
+            data['side_plots'][main_index] = arc_data['side_plots'][main_id]
+            data['side_plot_counts'][main_index] = arc_data['side_plot_counts'][main_id]
+        if main_id in arc_data['subplot_colors']:
+            data['subplot_colors'][main_index] = arc_data['subplot_colors'][main_id]
+    return data
+
+
+def load_story(path):
+    """Reads a project file and returns its arcs ({arc_title: arc_data})."""
+    with open(path, 'r') as f:
+        loaded_data = json.load(f)
+    return {arc_title: normalize_arc_data(data) for arc_title, data in loaded_data.items()}
+
+
+def save_story(arcs, path):
+    """Writes arcs ({arc_title: arc_data}) to a project file."""
+    serializable_data = {arc_title: serialize_arc_data(arc_data) for arc_title, arc_data in arcs.items()}
+    with open(path, 'w') as f:
+        json.dump(serializable_data, f)
+
+
+def get_layout(arc_data):
+    """Returns the layout of an arc."""
+    return ArcLayout(arc_data['main_plot'])
+
+
+def side_plots_of(arc_data, main_index):
+    """Returns the side plots ({side_plot_index: [points]}) of the main plot point at main_index."""
+    return arc_data['side_plots'].get(arc_data['main_plot'].id_at(main_index), {})
+
+
+# --- Edit Operations ---
+# Every change to the story is expressed as an operation: a small JSON-serializable
+# dict naming the op and the arc it applies to. apply_op performs it on the arcs
+# dict, so the GUI, the journal replay and other tools share one code path.
+#
+#   {'op': 'add_arc', 'arc': title, 'data': serialized arc data}
+#   {'op': 'delete_arc', 'arc': title}
+#   {'op': 'insert_main', 'arc': title, 'index': i, 'point': [title, description, label]}
+#   {'op': 'edit_main', 'arc': title, 'index': i, 'point': [title, description, label]}
+#   {'op': 'delete_main', 'arc': title, 'index': i}
+#   {'op': 'add_side_plot', 'arc': title, 'main_index': i, 'point': [title, description], 'color': color}
+#   {'op': 'insert_side_plot', 'arc': title, 'main_index': i, 'side_plot_index': s, 'point': [...], 'color': color}
+#   {'op': 'insert_side', 'arc': title, 'main_index': i, 'side_plot_index': s, 'index': j, 'point': [...]}
+#   {'op': 'edit_side', 'arc': title, 'main_index': i, 'side_plot_index': s, 'index': j, 'point': [...]}
+#   {'op': 'delete_side', 'arc': title, 'main_index': i, 'side_plot_index': s, 'index': j}
+#   {'op': 'set_marker', 'arc': title, 'marker_style': marker}
+#   {'op': 'set_background', 'arc': title, 'path': path or None}
+
+def insert_main_point(arc_data, index, point):
+    """Inserts a main plot point and returns its id. The side plots of the
+    other points are keyed by id, so they stay as they are."""
+    return arc_data['main_plot'].insert(index, tuple(point))
+
+
+def delete_main_point(arc_data, index):
+    """Deletes a main plot point and all its side plots."""
+    main_id = arc_data['main_plot'].delete(index)
+    arc_data['side_plots'].pop(main_id, None)
+    arc_data['side_plot_counts'].pop(main_id, None)
+    arc_data['subplot_colors'].pop(main_id, None)
+
+
+def add_side_plot(arc_data, main_index, point, color=None):
+    """Starts a new side plot at a main plot point and returns its index.
+    color is used if the main plot point has no side plot color yet."""
+    main_id = arc_data['main_plot'].id_at(main_index)
+    side_plot_index = arc_data['side_plot_counts'].get(main_id, 0) + 1
+    insert_side_plot(arc_data, main_index, side_plot_index, point, color)
+    return side_plot_index
+
+
+def insert_side_plot(arc_data, main_index, side_plot_index, point, color=None):
+    """Starts a new side plot at side_plot_index of a main plot point, moving
+    the side plots from there on up one index."""
+    main_plot = arc_data['main_plot']
+    main_id = main_plot.id_at(main_index)
+    if main_id not in arc_data['side_plots']:
+        arc_data['side_plots'][main_id] = {}
+        arc_data['side_plot_counts'][main_id] = 0
+
+    if main_id not in arc_data['subplot_colors']:
+        arc_data['subplot_colors'][main_id] = color or "red"
+
+    arc_data['side_plot_counts'][main_id] += 1
+    main_plot.set_rows(main_id, arc_data['side_plot_counts'][main_id])
+
+    new_side_plot = {}
+    for key, value in arc_data['side_plots'][main_id].items():
+        new_key = key if key < side_plot_index else key + 1
+        new_side_plot[new_key] = value
+    new_side_plot[side_plot_index] = [tuple(point)]
+    arc_data['side_plots'][main_id] = dict(sorted(new_side_plot.items()))
+
+
+def delete_side_point(arc_data, main_index, side_plot_index, index):
+    """Deletes a side plot point, and the side plot if it becomes empty."""
+    main_plot = arc_data['main_plot']
+    main_id = main_plot.id_at(main_index)
+    side_plots = arc_data['side_plots']
+    del side_plots[main_id][side_plot_index][index]
+    # Check if side plot is now empty and delete it if so
+    if not side_plots[main_id][side_plot_index]:
+        del side_plots[main_id][side_plot_index]
+        arc_data['side_plot_counts'][main_id] -= 1
+        main_plot.set_rows(main_id, arc_data['side_plot_counts'][main_id])
+        # Reorganize side plot indexes if necessary
+        if arc_data['side_plot_counts'][main_id] == 0:
+            del arc_data['side_plot_counts'][main_id]
+            del side_plots[main_id]
+            arc_data['subplot_colors'].pop(main_id, None)
+        else:
+            new_side_plot = {}
+            for key, value in side_plots[main_id].items():
+                new_key = key if key < side_plot_index else key - 1
+                new_side_plot[new_key] = value
+            side_plots[main_id] = new_side_plot
+
+
+def apply_op(arcs, op):
+    """Performs an edit operation on arcs ({arc_title: arc_data})."""
+    kind = op['op']
+    if kind == 'add_arc':
+        arcs[op['arc']] = normalize_arc_data(json.loads(json.dumps(op['data'])))
+        return
+    if kind == 'delete_arc':
+        del arcs[op['arc']]
+        return
+
+    arc_data = arcs[op['arc']]
+    if kind == 'insert_main':
+        insert_main_point(arc_data, op['index'], op['point'])
+    elif kind == 'edit_main':
+        arc_data['main_plot'][op['index']] = tuple(op['point'])
+    elif kind == 'delete_main':
+        delete_main_point(arc_data, op['index'])
+    elif kind == 'add_side_plot':
+        add_side_plot(arc_data, op['main_index'], op['point'], op.get('color'))
+    elif kind == 'insert_side_plot':
+        insert_side_plot(arc_data, op['main_index'], op['side_plot_index'], op['point'], op.get('color'))
+    elif kind == 'insert_side':
+        side_plots_of(arc_data, op['main_index'])[op['side_plot_index']].insert(op['index'], tuple(op['point']))
+    elif kind == 'edit_side':
+        side_plots_of(arc_data, op['main_index'])[op['side_plot_index']][op['index']] = tuple(op['point'])
+    elif kind == 'delete_side':
+        delete_side_point(arc_data, op['main_index'], op['side_plot_index'], op['index'])
+    elif kind == 'set_marker':
+        arc_data['marker_style'] = op['marker_style']
+    elif kind == 'set_background':
+        arc_data['background_image_path'] = op['path']
+    else:
+        raise ValueError(f"Unknown operation: {kind}")
+
+
+def inverse_ops(arcs, op):
+    """Returns the operations that undo op, in the order to apply them.
+    Must be called before op is applied. The inverse only holds the data the
+    operation removes or overwrites, so it is as large as the edit itself."""
+    kind = op['op']
+    arc_title = op['arc']
+    if kind == 'add_arc':
+        return [{'op': 'delete_arc', 'arc': arc_title}]
+    arc_data = arcs[arc_title]
+    if kind == 'delete_arc':
+        # The deleted arc is not changed any more, so its lists can be shared
+        return [{'op': 'add_arc', 'arc': arc_title, 'data': serialize_arc_data(arc_data)}]
+    if kind == 'insert_main':
+        return [{'op': 'delete_main', 'arc': arc_title, 'index': op['index']}]
+    if kind == 'edit_main':
+        return [{'op': 'edit_main', 'arc': arc_title, 'index': op['index'],
+                 'point': list(arc_data['main_plot'][op['index']])}]
+    if kind == 'delete_main':
+        main_index = op['index']
+        main_id = arc_data['main_plot'].id_at(main_index)
+        inverse = [{'op': 'insert_main', 'arc': arc_title, 'index': main_index,
+                    'point': list(arc_data['main_plot'].get(main_id))}]
+        for side_plot_index, points in arc_data['side_plots'].get(main_id, {}).items():
+            inverse.append({'op': 'add_side_plot', 'arc': arc_title, 'main_index': main_index,
+                            'point': list(points[0]), 'color': arc_data['subplot_colors'].get(main_id)})
+            inverse.extend({'op': 'insert_side', 'arc': arc_title, 'main_index': main_index,
+                            'side_plot_index': side_plot_index, 'index': j, 'point': list(point)}
+                           for j, point in enumerate(points[1:], start=1))
+        return inverse
+    if kind in ('add_side_plot', 'insert_side_plot'):
+        main_id = arc_data['main_plot'].id_at(op['main_index'])
+        side_plot_index = op.get('side_plot_index', arc_data['side_plot_counts'].get(main_id, 0) + 1)
+        return [{'op': 'delete_side', 'arc': arc_title, 'main_index': op['main_index'],
+                 'side_plot_index': side_plot_index, 'index': 0}]
+    if kind == 'insert_side':
+        return [{'op': 'delete_side', 'arc': arc_title, 'main_index': op['main_index'],
+                 'side_plot_index': op['side_plot_index'], 'index': op['index']}]
+    if kind in ('edit_side', 'delete_side'):
+        main_id = arc_data['main_plot'].id_at(op['main_index'])
+        points = arc_data['side_plots'][main_id][op['side_plot_index']]
+        point = list(points[op['index']])
+        if kind == 'edit_side':
+            return [dict(op, point=point)]
+        if len(points) == 1:
+            # Deleting the last point removes the side plot, so it is recreated in its place
+            return [{'op': 'insert_side_plot', 'arc': arc_title, 'main_index': op['main_index'],
+                     'side_plot_index': op['side_plot_index'], 'point': point,
+                     'color': arc_data['subplot_colors'].get(main_id)}]
+        return [dict(op, op='insert_side', point=point)]
+    if kind == 'set_marker':
+        return [{'op': 'set_marker', 'arc': arc_title, 'marker_style': arc_data['marker_style']}]
+    if kind == 'set_background':
+        return [{'op': 'set_background', 'arc': arc_title, 'path': arc_data['background_image_path']}]
+    raise ValueError(f"Unknown operation: {kind}")
+
+
+def _diff_opcodes(old, new):
+    """Returns the difflib opcodes turning the sequence old into new, last
+    first, so applying them in that order leaves the indexes of the ones still
+    to apply valid. The unchanged ends are skipped before matching the rest."""
+    start = 0
+    while start < len(old) and start < len(new) and old[start] == new[start]:
+        start += 1
+    old_end, new_end = len(old), len(new)
+    while old_end > start and new_end > start and old[old_end - 1] == new[new_end - 1]:
+        old_end -= 1
+        new_end -= 1
+    opcodes = [('equal', 0, start, 0, start)] if start else []
+    # With autojunk, points repeated all over a long arc are not used as anchors, which keeps matching near linear
+    matcher = difflib.SequenceMatcher(None, old[start:old_end], new[start:new_end])
+    opcodes.extend((tag, i1 + start, i2 + start, j1 + start, j2 + start)
+                   for tag, i1, i2, j1, j2 in matcher.get_opcodes())
+    if old_end < len(old):
+        opcodes.append(('equal', old_end, len(old), new_end, len(new)))
+    return reversed(opcodes)
+
+
+def _diff_side_plot_ops(arc_title, main_index, old_side_plots, new_side_plots, new_color):
+    """Returns the operations turning the side plots of one main plot point
+    ({side_plot_index: [points]}) into new_side_plots."""
+    ops = []
+    old_count, new_count = len(old_side_plots), len(new_side_plots)
+    for side_plot_index in range(1, min(old_count, new_count) + 1):
+        old = [tuple(point) for point in old_side_plots[side_plot_index]]
+        new = [tuple(point) for point in new_side_plots[side_plot_index]]
+        if old == new:
+            continue
+        place = {'arc': arc_title, 'main_index': main_index, 'side_plot_index': side_plot_index}
+        for tag, i1, i2, j1, j2 in _diff_opcodes(old, new):
+            if tag == 'equal':
+                continue
+            # Points are edited in place first, so the side plot never runs empty
+            paired = min(i2 - i1, j2 - j1)
+            ops.extend(dict(place, op='edit_side', index=i1 + k, point=list(new[j1 + k])) for k in range(paired))
+            ops.extend(dict(place, op='insert_side', index=i1 + k, point=list(new[j1 + k]))
+                       for k in range(paired, j2 - j1))
+            ops.extend(dict(place, op='delete_side', index=i) for i in reversed(range(i1 + paired, i2)))
+    # Side plots beyond the new count are deleted a point at a time, the last one first
+    for side_plot_index in range(old_count, new_count, -1):
+        ops.extend({'op': 'delete_side', 'arc': arc_title, 'main_index': main_index,
+                    'side_plot_index': side_plot_index, 'index': j}
+                   for j in reversed(range(len(old_side_plots[side_plot_index]))))
+    for side_plot_index in range(old_count + 1, new_count + 1):
+        first, *rest = new_side_plots[side_plot_index]
+        ops.append({'op': 'add_side_plot', 'arc': arc_title, 'main_index': main_index, 'point': list(first),
+                    'color': new_color})
+        ops.extend({'op': 'insert_side', 'arc': arc_title, 'main_index': main_index,
+                    'side_plot_index': side_plot_index, 'index': j, 'point': list(point)}
+                   for j, point in enumerate(rest, start=1))
+    return ops
+
+
+def diff_arc_ops(arc_title, arc_data, new_arc_data):
+    """Returns the operations turning the arc arc_data into new_arc_data (both
+    in memory, see normalize_arc_data), point by point, so applying them only
+    touches what differs. Returns None if the difference cannot be expressed as
+    point operations (a side plot color or the x-axis labels changed)."""
+    if arc_data['x_axis_labels'] != new_arc_data['x_axis_labels']:
+        return None
+    for side_plot_data in new_arc_data['side_plots'].values():
+        # Side plots are numbered from 1 without gaps and never empty, as the edit operations keep them
+        if sorted(side_plot_data) != list(range(1, len(side_plot_data) + 1)) or not all(side_plot_data.values()):
+            return None
+
+    old_items, new_items = list(arc_data['main_plot'].items()), list(new_arc_data['main_plot'].items())
+    old_ids, new_ids = [main_id for main_id, _ in old_items], [main_id for main_id, _ in new_items]
+    old_points, new_points = [tuple(point) for _, point in old_items], [tuple(point) for _, point in new_items]
+    old_side_plot_data, new_side_plot_data = arc_data['side_plots'], new_arc_data['side_plots']
+    # Positions of the points that have side plots, the only ones whose side plots can differ
+    old_with_side_plots = [i for i, main_id in enumerate(old_ids) if main_id in old_side_plot_data]
+    new_with_side_plots = [j for j, main_id in enumerate(new_ids) if main_id in new_side_plot_data]
+
+    def with_side_plots(positions, start, end):
+        return positions[bisect.bisect_left(positions, start):bisect.bisect_left(positions, end)]
+
+    def side_plot_ops(main_index, old_id, new_id):
+        old_side_plots = old_side_plot_data.get(old_id, {})
+        new_side_plots = new_side_plot_data.get(new_id, {})
+        if not old_side_plots and not new_side_plots:
+            return []
+        new_color = new_arc_data['subplot_colors'].get(new_id)
+        if old_side_plots and new_side_plots and arc_data['subplot_colors'].get(old_id) != new_color:
+            return None
+        return _diff_side_plot_ops(arc_title, main_index, old_side_plots, new_side_plots, new_color)
+
+    ops = []
+    for tag, i1, i2, j1, j2 in _diff_opcodes(old_points, new_points):
+        # Main plot points are edited in place as far as both sides have them
+        paired = min(i2 - i1, j2 - j1) if tag != 'equal' else i2 - i1
+        if tag != 'equal':
+            ops.extend({'op': 'edit_main', 'arc': arc_title, 'index': i1 + k, 'point': list(new_points[j1 + k])}
+                       for k in range(paired))
+        offsets = {i - i1 for i in with_side_plots(old_with_side_plots, i1, i1 + paired)}
+        offsets.update(j - j1 for j in with_side_plots(new_with_side_plots, j1, j1 + paired))
+        for k in sorted(offsets):
+            side_ops = side_plot_ops(i1 + k, old_ids[i1 + k], new_ids[j1 + k])
+            if side_ops is None:
+                return None
+            ops.extend(side_ops)
+        ops.extend({'op': 'delete_main', 'arc': arc_title, 'index': i} for i in reversed(range(i1 + paired, i2)))
+        for k in range(paired, j2 - j1):
+            ops.append({'op': 'insert_main', 'arc': arc_title, 'index': i1 + k, 'point': list(new_points[j1 + k])})
+            ops.extend(side_plot_ops(i1 + k, None, new_ids[j1 + k]))
+
+    if arc_data['marker_style'] != new_arc_data['marker_style']:
+        ops.append({'op': 'set_marker', 'arc': arc_title, 'marker_style': new_arc_data['marker_style']})
+    if arc_data['background_image_path'] != new_arc_data['background_image_path']:
+        ops.append({'op': 'set_background', 'arc': arc_title, 'path': new_arc_data['background_image_path']})
+    return ops
+
+
+def create_arc_figure(arc_data, figsize=(8, 6), level_of_detail=True):
+    """Creates the figure of an arc and the renderer and point index drawing on it.
+    Without level_of_detail, labels never collapse into cluster markers."""
+    # A plain Figure is not tracked by pyplot, so it is freed once unreferenced
+    fig = Figure(figsize=figsize, facecolor="#e6e6e6")
+    ax = fig.add_subplot()
+    fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.spines['bottom'].set_visible(False)
+    ax.spines['left'].set_visible(False)
+
+    arc_data['fig'] = fig
+    arc_data['ax'] = ax
+    arc_data['renderer'] = ArcRenderer(ax)
+    arc_data['point_index'] = PointIndex()
+    arc_data['level_of_detail'] = level_of_detail
+
+    # Labels follow the visible part of the axes when zooming and panning
+    ax.callbacks.connect('xlim_changed', lambda ax: draw_labels(arc_data))
+    ax.callbacks.connect('ylim_changed', lambda ax: draw_labels(arc_data))
+    return fig
+
+
+def draw_arc(arc_data, side_plot_render_mode='lines', artists=True):
+    """Brings the main and side plot artists of an arc up to date with its data.
+    With artists false only the axis limits and the point index are updated,
+    for a figure whose pixels are rendered elsewhere (see RenderWorker)."""
+    ax = arc_data['ax']
+    renderer = arc_data['renderer']
+    main_plot = arc_data['main_plot']
+    side_plots = arc_data['side_plots']
+    side_plot_counts = arc_data['side_plot_counts']
+    subplot_colors = arc_data['subplot_colors']
+    marker_style = arc_data['marker_style']
+
+    # --- Adjust Figure and Axes ---
+    arc_data['fig'].subplots_adjust(left=0.01, right=0.99, top=0.99, bottom=0.01)  # Reduce figure margins
+
+    # --- Set Axis Limits ---
+    # Without emitting, as the labels are drawn once at the end
+    ax.set_xlim(-1, len(main_plot) + 1 if main_plot else 1, emit=False)
+
+    # The maximum y-value needed for side plots is the total number of side plot rows
+    ax.set_ylim(-main_plot.total_rows - 1, 1, emit=False)
+    ax.set_xticks([])
+    ax.set_yticks([])
+
+    # --- Draw Main Plot ---
+    # Artists, labels and hits are keyed by main plot point id, so inserting or
+    # deleting a point keeps the keys of the others
+    main_specs = {}
+    label_specs = {}  # Annotations, drawn by draw_labels for the visible points only
+    point_positions = {}
+    side_plot_rows = []  # [(main_id, x, row offset)] of the points with side plots, in plot order
+    row_offset = 0
+    for i, (main_id, (title, _, _)) in enumerate(main_plot.items()):
+        point_positions[(main_id, 0, None)] = (i, 0)
+        label_specs[('annotation', main_id)] = ('annotation', 'main_annotation', title, (i, 0))
+        if main_id in side_plots:
+            side_plot_rows.append((main_id, i, row_offset))
+            row_offset += side_plot_counts.get(main_id, 0)
+    if main_plot:
+        main_specs['line'] = ('line', 'main_line', tuple(range(len(main_plot))), (0,) * len(main_plot),
+                              (('marker', marker_style),))
+
+    # --- Draw Side Plots ---
+    collection_mode = side_plot_render_mode == 'collections'
+    side_specs = {}
+    segments, segment_colors, segment_styles, segment_keys = [], [], [], []
+    marker_offsets, marker_colors, marker_keys = [], [], []
+    for main_id, x_start, row_offset in side_plot_rows:
+        color = subplot_colors.get(main_id, "red")
+        for side_plot_index, points in side_plots[main_id].items():
+            y = -side_plot_index - row_offset
+            # Initial vertical line from main plot point
+            if collection_mode:
+                segments.append(((x_start, 0), (x_start, y)))
+                segment_colors.append(color)
+                segment_styles.append(':')
+                segment_keys.append((main_id, side_plot_index, 0))
+            else:
+                side_specs[('connector', main_id, side_plot_index)] = (
+                    'line', 'side_connector', (x_start, x_start), (0, y), (('color', color),))
+
+            for i, (title, _) in enumerate(points):
+                x = x_start + i
+                point_positions[(main_id, side_plot_index, i)] = (x, y)
+                if collection_mode:
+                    marker_offsets.append((x, y))
+                    marker_colors.append(color)
+                    marker_keys.append((main_id, side_plot_index, i))
+                    if i > 0:
+                        segments.append(((x - 1, y), (x, y)))
+                        segment_colors.append(color)
+                        segment_styles.append('-')
+                        segment_keys.append((main_id, side_plot_index, i))
+                point_overrides = (('color', color), ('marker', marker_style))
+                if i == 0:
+                    # First point, annotate on the vertical line
+                    if not collection_mode:
+                        side_specs[('point', main_id, side_plot_index, i)] = (
+                            'line', 'side_first_point', (x,), (y,), point_overrides)
+                    label_specs[('annotation', main_id, side_plot_index, i)] = (
+                        'annotation', 'side_first_annotation', f"SP {side_plot_index}\n{title}", (x, y))
+                else:
+                    # Subsequent points, extend horizontally
+                    if not collection_mode:
+                        side_specs[('point', main_id, side_plot_index, i)] = (
+                            'line', 'side_segment', (x - 1, x), (y, y), point_overrides)
+                    label_specs[('annotation', main_id, side_plot_index, i)] = (
+                        'annotation', 'side_annotation', f"{title}", (x, y))
+
+    if segments:
+        side_specs['segments'] = ('segments', 'side_segments', tuple(segments), tuple(segment_colors),
+                                  tuple(segment_styles))
+    if marker_offsets:
+        side_specs['markers'] = ('markers', 'side_markers', tuple(marker_offsets), tuple(marker_colors),
+                                 marker_style)
+
+    arc_data['point_index'].sync(point_positions)
+    if not artists:
+        return
+
+    main_artists = renderer.sync('main', main_specs)
+    arc_data['main_plot_lines'] = [main_artists['line']] if main_plot else []
+    side_artists = renderer.sync('side', side_specs)
+
+    # Keep the artists used for picking and highlighting. In collection mode the
+    # keys map an element index in the collection back to (main id, side plot, point).
+    arc_data['side_plot_lines'] = {}
+    arc_data['side_plot_collections'] = {}
+    if collection_mode:
+        if segments:
+            arc_data['side_plot_collections']['segments'] = (side_artists['segments'], segment_keys)
+        if marker_offsets:
+            arc_data['side_plot_collections']['markers'] = (side_artists['markers'], marker_keys)
+    else:
+        for main_id, side_plot_data in side_plots.items():
+            arc_data['side_plot_lines'][main_id] = {}
+            for side_plot_index, points in side_plot_data.items():
+                lines = [side_artists[('connector', main_id, side_plot_index)]]
+                lines.extend(side_artists[('point', main_id, side_plot_index, i)] for i in range(len(points)))
+                arc_data['side_plot_lines'][main_id][side_plot_index] = lines
+
+    arc_data['label_entries'] = _label_entries(label_specs)
+    draw_labels(arc_data)
+
+    # Set the facecolor of the plot to transparent after plotting data.
+    ax.set_facecolor((0, 0, 0, 0))  # Set transparent background.
+    arc_data['fig'].patch.set_alpha(0.0)  # Ensure figure background is also transparent.
+
+
+def draw_background(arc_data, image_path):
+    """Shows image_path (or nothing, if None) behind the plot of an arc.
+    Raises if the image cannot be read."""
+    ax = arc_data['ax']
+    background_specs = {}
+    if image_path:
+        width, height = arc_data['fig'].get_size_inches() * arc_data['fig'].dpi
+        image_key = BackgroundImageCache.key(image_path, width, height)
+        background_specs['image'] = ('image', image_key, (ax.get_xlim()[0], ax.get_xlim()[1],
+                                                          ax.get_ylim()[0], ax.get_ylim()[1]))
+    arc_data['renderer'].sync('background', background_specs)
+
+
+def draw_x_labels(arc_data):
+    """Brings the x-axis labels, one per main plot point, up to date."""
+    label_specs = {
+        main_id: ('text', 'x_label', label, (i, 0.5))
+        for i, (main_id, (_, _, label)) in enumerate(arc_data['main_plot'].items())
+    }
+    arc_data['x_label_entries'] = _label_entries(label_specs)
+    draw_labels(arc_data)
+
+
+def _label_entries(label_specs):
+    """Returns (keys, positions, specs) for label specs ({key: spec with xy last}),
+    with positions as an array for fast viewport tests."""
+    keys = list(label_specs)
+    specs = list(label_specs.values())
+    positions = np.array([spec[-1] for spec in specs], dtype=float).reshape(-1, 2)
+    return keys, positions, specs
+
+
+def draw_labels(arc_data):
+    """Shows the annotations and x-axis labels of the points inside the visible
+    part of the axes, or one count marker per cluster of points when zoomed out
+    too far for the labels to be readable (see LABEL_MIN_PIXELS_PER_POINT)."""
+    ax = arc_data.get('ax')
+    if ax is None or 'label_entries' not in arc_data:
+        return
+    x0, x1 = sorted(ax.get_xlim())
+    y0, y1 = sorted(ax.get_ylim())
+    width, height = max(ax.bbox.width, 1), max(ax.bbox.height, 1)
+
+    def visible(positions):
+        # Half a point of margin keeps labels of points at the edges
+        return np.flatnonzero((positions[:, 0] >= x0 - 0.5) & (positions[:, 0] <= x1 + 0.5) &
+                              (positions[:, 1] >= y0 - 0.5) & (positions[:, 1] <= y1 + 0.5))
+
+    keys, positions, specs = arc_data['label_entries']
+    shown = visible(positions)
+    label_specs = {}
+    x_label_specs = {}
+    if not arc_data.get('level_of_detail', True) or (
+            len(shown) <= MAX_VISIBLE_LABELS and width / max(x1 - x0, 1e-9) >= LABEL_MIN_PIXELS_PER_POINT):
+        label_specs = {keys[i]: specs[i] for i in shown}
+        x_keys, x_positions, x_specs = arc_data.get('x_label_entries', ((), np.empty((0, 2)), ()))
+        x_label_specs = {x_keys[i]: x_specs[i] for i in visible(x_positions)}
+    elif len(shown):
+        # Cells are a power of two in data units, so they stay put while panning
+        cell = np.array([2.0 ** math.ceil(math.log2(LABEL_CLUSTER_PIXELS * (x1 - x0) / width)),
+                         2.0 ** math.ceil(math.log2(LABEL_CLUSTER_PIXELS * (y1 - y0) / height))])
+        cells, cell_of_point, counts = np.unique(np.floor(positions[shown] / cell).astype(np.int64), axis=0,
+                                                 return_inverse=True, return_counts=True)
+        centers = np.zeros((len(cells), 2))
+        np.add.at(centers, cell_of_point.ravel(), positions[shown])
+        centers /= counts[:, None]
+        for (cell_x, cell_y), (x, y), count in zip(cells.tolist(), centers.tolist(), counts.tolist()):
+            label_specs[('cluster', cell_x, cell_y)] = ('text', 'label_cluster', str(count), (x, y))
+
+    arc_data['renderer'].sync('labels', label_specs)
+    arc_data['renderer'].sync('x_labels', x_label_specs)
+
+
+def draw_highlight(arc_data):
+    """Widens the artists of the highlighted point, arc_data['highlight'], and
+    resets all others. The highlight is ('main', main_id), ('point', main_id,
+    side_plot_index, side_x_index) or None."""
+    highlight = arc_data.get('highlight')
+
+    # Reset linewidth of all lines
+    for line in arc_data.get('main_plot_lines', []):
+        line.set_linewidth(3)
+    for side_plot_data in arc_data.get('side_plot_lines', {}).values():
+        for lines in side_plot_data.values():
+            for line in lines:
+                line.set_linewidth(3)
+    side_plot_collections = arc_data.get('side_plot_collections', {})
+    if 'segments' in side_plot_collections:
+        side_plot_collections['segments'][0].set_linewidth(3)
+
+    if highlight is None or highlight[1] not in arc_data['main_plot'].nodes:
+        return
+    if highlight[0] == 'main':
+        main_index = arc_data['main_plot'].index_of(highlight[1])
+        if main_index < len(arc_data.get('main_plot_lines', [])):
+            arc_data['main_plot_lines'][main_index].set_linewidth(6)  # Make it thicker
+    elif 'segments' in side_plot_collections:
+        # Widen only the segment leading to the point, by index into the collection
+        segments, segment_keys = side_plot_collections['segments']
+        segments.set_linewidth([6 if key == highlight[1:] else 3 for key in segment_keys])
+    else:
+        _, main_id, side_plot_index, side_x_index = highlight
+        lines = arc_data.get('side_plot_lines', {}).get(main_id, {}).get(side_plot_index, [])
+        if side_x_index < len(lines):
+            lines[side_x_index].set_linewidth(6)
+
+
+def render_arc(arc_data, path, side_plot_render_mode='collections', figsize=(8, 6), dpi=100, file_format=None,
+               level_of_detail=False):
+    """Renders an arc headless to an image file; the format follows the file
+    extension unless file_format is given. path may also be an open
+    matplotlib PdfPages (with file_format 'pdf'), which gets the arc as a new page.
+    Every label is drawn, unless level_of_detail is set to draw them as the GUI does.
+    Returns the view it was drawn with, {'xlim': [x0, x1], 'ylim': [y0, y1]}."""
+    fig = create_arc_figure(arc_data, figsize=figsize, level_of_detail=level_of_detail)
+    FigureCanvasAgg(fig)
+    try:
+        draw_arc(arc_data, side_plot_render_mode)
+        draw_background(arc_data, arc_data.get('background_image_path'))
+        draw_x_labels(arc_data)
+        fig.savefig(path, dpi=dpi, format=file_format)
+        ax = arc_data['ax']
+        return {'xlim': [float(x) for x in ax.get_xlim()], 'ylim': [float(y) for y in ax.get_ylim()]}
+    finally:
+        for key in FIGURE_KEYS:
+            arc_data.pop(key, None)
+
+
+# --- Background Rendering ---
+
+def snapshot_arc_data(arc_data):
+    """Returns the saved part of an arc (see serialize_arc_data) with its own
+    containers, so it can be rendered on another thread while the arc is edited."""
+    snapshot = serialize_arc_data(arc_data)
+    snapshot['side_plots'] = {
+        main_index: {side_plot_index: list(points) for side_plot_index, points in side_plot_data.items()}
+        for main_index, side_plot_data in snapshot['side_plots'].items()
+    }
+    snapshot['x_axis_labels'] = dict(snapshot['x_axis_labels'])
+    return snapshot
+
+
+class RenderWorker:
+    """Renders arc snapshots to RGBA pixels on a background thread.
+
+    Only the newest request matters: submitting replaces a request that has not
+    started yet, and a render that a newer request overtakes is dropped before
+    it rasterizes. The worker keeps a figure per arc (up to max_figures), so a
+    render only updates the artists that changed since the previous one.
+    Results are put on the results queue as (generation, arc_title, pixels),
+    with pixels an (height, width, 4) uint8 array, or the exception that
+    stopped the render.
+    """
+
+    def __init__(self, max_figures=4):
+        self.max_figures = max_figures
+        self.results = queue.Queue()
+        self.generation = 0
+        self.pending = None  # (generation, arc_title, job) not started yet
+        self.condition = threading.Condition()
+        self.arcs = OrderedDict()  # {arc_title: arc_data with a figure}, most recently used last
+        self.rendering = False
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="RenderWorker", daemon=True)
+        self.thread.start()
+
+    def submit(self, arc_title, snapshot, figsize, dpi, xlim, ylim, side_plot_render_mode='lines',
+               background_image_path=None, highlight=None):
+        """Requests a render of snapshot (see snapshot_arc_data) at figsize inches
+        and dpi, showing xlim and ylim. highlight is as for draw_highlight, but
+        with the position of the main plot point in place of its id, as that is
+        the id it gets in the normalized snapshot. Returns the generation of the request."""
+        with self.condition:
+            self.generation += 1
+            if self.pending:
+                tracer.count('renders_cancelled')
+            self.pending = (self.generation, arc_title, dict(
+                snapshot=snapshot, figsize=figsize, dpi=dpi, xlim=xlim, ylim=ylim,
+                side_plot_render_mode=side_plot_render_mode, background_image_path=background_image_path,
+                highlight=highlight))
+            self.condition.notify()
+            return self.generation
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def idle(self):
+        """Whether no render is waiting or running (its result may still be queued)."""
+        with self.condition:
+            return self.pending is None and not self.rendering
+
+    def forget(self, arc_title):
+        """Drops the figure kept for an arc. The next render of it starts over."""
+        with self.condition:
+            if self.pending and self.pending[1] == arc_title:
+                self.pending = None
+            self.arcs.pop(arc_title, None)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                (generation, arc_title, job), self.pending = self.pending, None
+                self.rendering = True
+                arc_data = self.arcs.pop(arc_title, None)
+                if arc_data is None:
+                    arc_data = {}
+                self.arcs[arc_title] = arc_data
+                while len(self.arcs) > self.max_figures:
+                    self.arcs.popitem(last=False)
+            try:
+                with tracer.span("render_worker"):
+                    pixels = self._render(generation, arc_data, job)
+            except Exception as e:
+                # Reported in place of the pixels. The figure may be half
+                # updated, so the arc starts over next time.
+                self.forget(arc_title)
+                pixels = e
+            if pixels is not None:
+                self.results.put((generation, arc_title, pixels))
+            with self.condition:
+                self.rendering = False
+
+    def _render(self, generation, arc_data, job):
+        snapshot = dict(job['snapshot'])  # Normalizing replaces entries, the snapshot stays as it is
+        arc_data.update(normalize_arc_data(snapshot))
+        arc_data['highlight'] = job['highlight']
+        if 'fig' not in arc_data:
+            FigureCanvasAgg(create_arc_figure(arc_data, figsize=job['figsize']))
+        fig = arc_data['fig']
+        if tuple(fig.get_size_inches()) != tuple(job['figsize']) or fig.dpi != job['dpi']:
+            fig.set_dpi(job['dpi'])
+            fig.set_size_inches(job['figsize'], forward=False)
+
+        draw_arc(arc_data, job['side_plot_render_mode'])
+        draw_background(arc_data, job['background_image_path'])
+        draw_x_labels(arc_data)
+        arc_data['ax'].set_xlim(job['xlim'])
+        arc_data['ax'].set_ylim(job['ylim'])  # Emits, so the labels follow the view
+        draw_highlight(arc_data)
+        if not self.is_current(generation):
+            tracer.count('renders_cancelled')
+            return None
+
+        canvas = fig.canvas
+        canvas.draw()
+        return np.array(canvas.buffer_rgba())  # A copy, as the canvas reuses its buffer
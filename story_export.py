@@ -0,0 +1,139 @@
+"""Exports every arc of a project to image files, without a display.
+
+export_arcs renders one PNG or SVG file per arc and format in parallel worker
+processes, and can stream all arcs into one multi-page PDF, drawing a single
+figure at a time so memory stays flat however many arcs there are. It reports
+progress through a callback and stops early once its cancel event is set, so
+the GUI runs it on a thread and keeps the Tk loop free.
+
+Arcs are passed in their saved form (see story_core.serialize_arc_data), which
+can be sent to worker processes and is not changed by edits made meanwhile.
+"""
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+from story_core import normalize_arc_data, render_arc
+from story_trace import tracer
+
+# Formats written as one file per arc; PDF is written as one file for all arcs
+EXPORT_FORMATS = ('png', 'svg')
+
+# How often the renders in the worker processes are checked for cancellation
+CANCEL_POLL_SECONDS = 0.1
+
+
+def safe_file_name(title):
+    """Turns an arc title into something usable as a file name."""
+    return re.sub(r'[^\w\- ]+', '_', title).strip() or 'arc'
+
+
+def arc_file_names(arc_titles):
+    """Returns {arc_title: file name without extension}, numbering titles
+    that would otherwise end up with the same file name."""
+    names = {}
+    used = set()
+    for arc_title in arc_titles:
+        name = base = safe_file_name(arc_title)
+        number = 2
+        while name.lower() in used:
+            name = f"{base} ({number})"
+            number += 1
+        used.add(name.lower())
+        names[arc_title] = name
+    return names
+
+
+def render_arc_file(data, path, side_plot_render_mode, dpi):
+    """Renders one saved arc to path. Runs in a worker process.
+
+    Returns (path, seconds, error), with error None on success.
+    """
+    start = time.perf_counter()
+    try:
+        render_arc(normalize_arc_data(data), path, side_plot_render_mode=side_plot_render_mode, dpi=dpi)
+        return path, time.perf_counter() - start, None
+    except Exception as e:
+        return path, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def export_arcs(arcs, output_dir=None, formats=('png',), pdf_path=None, workers=None,
+                side_plot_render_mode='collections', dpi=100, progress=None, cancel=None):
+    """Renders saved arcs ({arc_title: data}) to <output_dir>/<arc title>.<format>
+    for every format in formats and, if pdf_path is given, to one PDF with a
+    page per arc in the order of arcs.
+
+    progress(done, total, path) is called on the calling thread after every file
+    and PDF page. Once cancel (a threading.Event) is set, no further files or
+    pages are started; renders already running in a worker still finish.
+    Returns (written paths, [(path, error)] of the ones that failed).
+    """
+    file_names = arc_file_names(arcs)
+    jobs = [(arc_title, os.path.join(output_dir, f"{file_names[arc_title]}.{file_format}"))
+            for arc_title in arcs for file_format in formats] if output_dir else []
+    total = len(jobs) + (len(arcs) if pdf_path else 0)
+    done = 0
+    written = []
+    failures = []
+
+    def finished(path, error=None):
+        nonlocal done
+        done += 1
+        if error:
+            failures.append((path, error))
+        if progress:
+            progress(done, total, path)
+
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    with tracer.span("export_arcs"):
+        executor = None
+        pending = set()
+        if jobs:
+            os.makedirs(output_dir, exist_ok=True)
+            # Workers are spawned, not forked: forking a process running Tk and other threads is unsafe
+            executor = ProcessPoolExecutor(max_workers=max(1, min(workers or os.cpu_count() or 1, len(jobs))),
+                                           mp_context=multiprocessing.get_context('spawn'))
+            pending = {executor.submit(render_arc_file, arcs[arc_title], path, side_plot_render_mode, dpi)
+                       for arc_title, path in jobs}
+        try:
+            # The PDF is written here, one page at a time, while the workers render the other formats
+            if pdf_path and not cancelled():
+                from matplotlib.backends.backend_pdf import PdfPages  # Slow to import, and only needed here
+                pages = 0
+                with PdfPages(pdf_path) as pdf:
+                    for arc_title, data in arcs.items():
+                        if cancelled():
+                            break
+                        try:
+                            render_arc(normalize_arc_data(data), pdf, side_plot_render_mode=side_plot_render_mode,
+                                       dpi=dpi, file_format='pdf')
+                            pages += 1
+                            finished(pdf_path)
+                        except Exception as e:
+                            finished(pdf_path, f"{arc_title}: {type(e).__name__}: {e}")
+                if pages:
+                    written.append(pdf_path)
+
+            while pending and not cancelled():
+                completed, pending = wait(pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    path, _, error = future.result()
+                    if not error:
+                        written.append(path)
+                    finished(path, error)
+        finally:
+            if executor:
+                executor.shutdown(wait=True, cancel_futures=True)
+        # Renders that were already running when the export was cancelled
+        for future in pending:
+            if not future.cancelled():
+                path, _, error = future.result()
+                if not error:
+                    written.append(path)
+                finished(path, error)
+    return written, failures
@@ -0,0 +1,47 @@
+"""Undo and redo of edit operations.
+
+Each history entry holds the operations of one edit and their inverses (see
+story_core.inverse_ops) rather than a copy of the project, so it costs memory
+in proportion to the edit. The history is capped both in number of entries and
+in the total size of the operations it holds.
+"""
+import json
+from collections import deque
+
+
+class EditHistory:
+    """Undo and redo stacks of (ops, inverse ops) entries."""
+
+    def __init__(self, max_depth=100, max_bytes=50 * 1024 * 1024):
+        self.max_depth = max_depth
+        self.max_bytes = max_bytes
+        self.undo_stack = deque()  # [(ops, inverse, size)], oldest first
+        self.redo_stack = []
+        self.size = 0  # Approximate size of both stacks, in bytes of JSON
+
+    def record(self, ops, inverse):
+        """Adds an edit, given as its operations and the operations undoing them."""
+        size = len(json.dumps([ops, inverse]))
+        self.undo_stack.append((ops, inverse, size))
+        self.size += size
+        # A new edit makes the undone ones unreachable
+        self.size -= sum(entry[2] for entry in self.redo_stack)
+        self.redo_stack.clear()
+        while self.undo_stack and (len(self.undo_stack) > self.max_depth or self.size > self.max_bytes):
+            self.size -= self.undo_stack.popleft()[2]
+
+    def undo(self):
+        """Returns the operations that undo the last edit, or None if there is none."""
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        self.redo_stack.append(entry)
+        return entry[1]
+
+    def redo(self):
+        """Returns the operations of the last undone edit, or None if there is none."""
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        self.undo_stack.append(entry)
+        return entry[0]
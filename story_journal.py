@@ -0,0 +1,197 @@
+"""Append-only journal of edit operations, kept next to a project file.
+
+Every edit is appended as one JSON line to "<project>.journal" by a background
+thread, so saving an edit costs a line rather than a rewrite of the project.
+Compaction folds the journal back into the project file: the snapshot is
+written to a temporary file and renamed over the project, then the journal is
+restarted.
+
+A write that fails (disk full, no permission, file locked) does not stop the
+background thread: the error is put on the journal's errors queue for the GUI
+to report, and the lines are written again with the next batch.
+
+The first line of a journal records the SHA-1 of the project file it applies
+to. A journal whose base does not match the project on disk was already folded
+into it (compaction was interrupted before the journal was restarted) and is
+ignored on replay, so no edit is ever applied twice.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+from collections import deque
+
+from story_core import apply_op, normalize_arc_data
+
+JOURNAL_SUFFIX = '.journal'
+
+# How many of its own writes of the project file a journal recognizes (see ProjectJournal.wrote)
+RECENT_WRITES = 8
+
+
+def journal_path_for(project_path):
+    return project_path + JOURNAL_SUFFIX
+
+
+def replay_project(project_path):
+    """Loads a project file and applies its journal.
+
+    Returns (arcs, base, op_count): the arcs, the SHA-1 of the project file and
+    the number of journaled operations that were replayed.
+    """
+    with open(project_path, 'rb') as f:
+        snapshot = f.read()
+    base = hashlib.sha1(snapshot).hexdigest()
+    arcs = {arc_title: normalize_arc_data(data) for arc_title, data in json.loads(snapshot).items()}
+
+    op_count = 0
+    try:
+        with open(journal_path_for(project_path), 'r') as f:
+            header = json.loads(f.readline() or 'null')
+            if header and header.get('base') == base:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # A torn last line from a crash mid-write
+                    apply_op(arcs, op)
+                    op_count += 1
+    except FileNotFoundError:
+        pass
+    return arcs, base, op_count
+
+
+def write_atomically(path, text):
+    """Writes text to path through a temporary file, so readers see either the
+    old or the new contents, never a partial file."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class ProjectJournal:
+    """Journal of one project file, written by a background thread.
+
+    record() and compact() only queue work, so they are cheap to call from the
+    Tk thread. Operations are serialized at record time, which makes the
+    journal independent of later changes to the arcs.
+    """
+
+    def __init__(self, project_path, base, restart=False):
+        """base is the SHA-1 of the project file as it is on disk. Unless
+        restart is set, an existing journal for that base is appended to."""
+        self.project_path = project_path
+        self.journal_path = journal_path_for(project_path)
+        # SHA-1s of the project file as this journal wrote it, newest last; each is added before its write starts
+        self.written = deque([base], maxlen=RECENT_WRITES)
+        self.ops_since_compaction = 0
+        self.queue = queue.Queue()
+        self.errors = queue.Queue()  # OSErrors of failed writes, for the GUI to report
+        self.restart_base = None  # Base of a journal restart that failed, done again before the next append
+
+        if restart or not self._journal_matches(base):
+            self._restart_journal(base)
+        else:
+            self._trim_torn_tail()
+
+        self.thread = threading.Thread(target=self._run, name="ProjectJournal", daemon=True)
+        self.thread.start()
+
+    def record(self, op):
+        """Queues an operation to be appended to the journal."""
+        self.queue.put(('op', json.dumps(op)))
+        self.ops_since_compaction += 1
+
+    def compact(self, arcs_data):
+        """Queues a compaction. arcs_data is the serializable project
+        ({arc_title: serialized arc}) reflecting every operation recorded so far."""
+        self.queue.put(('snapshot', json.dumps(arcs_data)))
+        self.ops_since_compaction = 0
+
+    def wrote(self, digest):
+        """Returns True if the project file with SHA-1 digest was written (or
+        loaded) by this journal rather than changed by another program."""
+        return digest in self.written
+
+    def close(self):
+        """Writes everything still queued and stops the background thread."""
+        self.queue.put(('stop', None))
+        self.thread.join()
+
+    def _journal_matches(self, base):
+        try:
+            with open(self.journal_path, 'r') as f:
+                header = json.loads(f.readline() or 'null')
+            return bool(header) and header.get('base') == base
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+
+    def _trim_torn_tail(self):
+        """Cuts off a partial last line left by a crash, so appends start on a fresh line."""
+        with open(self.journal_path, 'rb+') as f:
+            data = f.read()
+            if not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def _restart_journal(self, base):
+        write_atomically(self.journal_path, json.dumps({'journal': 1, 'base': base}) + '\n')
+
+    def _run(self):
+        lines = []  # Not written yet, including lines whose write failed
+        while True:
+            batch = [self.queue.get()]
+            # Take whatever else is queued, so a burst of edits is written and synced once
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for kind, payload in batch:
+                if kind == 'op':
+                    lines.append(payload)
+                    continue
+                lines = self._append(lines)
+                if kind == 'snapshot':
+                    # Every op queued before the snapshot is in it, the ones after are not
+                    base = hashlib.sha1(payload.encode()).hexdigest()
+                    self.written.append(base)
+                    try:
+                        write_atomically(self.project_path, payload)
+                    except OSError as e:
+                        self.errors.put(e)  # The journal still holds every op, so nothing is lost
+                        continue
+                    lines = []
+                    self.restart_base = base
+                    self._append(lines)
+                elif kind == 'stop':
+                    return
+            lines = self._append(lines)
+
+    def _append(self, lines):
+        """Appends lines to the journal, restarting it first if a restart
+        failed. Returns the lines that could not be written."""
+        try:
+            if self.restart_base:
+                self._restart_journal(self.restart_base)
+                self.restart_base = None
+            if lines:
+                data = ('\n'.join(lines) + '\n').encode()
+                with open(self.journal_path, 'ab', buffering=0) as f:
+                    start = f.seek(0, os.SEEK_END)
+                    try:
+                        if f.write(data) != len(data):
+                            raise OSError(f"Short write to {self.journal_path}")
+                        os.fsync(f.fileno())
+                    except OSError:
+                        # Cut off what was written, so the retry does not leave a torn or repeated line
+                        f.truncate(start)
+                        raise
+        except OSError as e:
+            self.errors.put(e)
+            return lines
+        return []
@@ -0,0 +1,216 @@
+"""Full-text search over the plot points of all arcs.
+
+SearchIndex is an inverted index from words to plot points. It is kept up to
+date by feeding it the same edit operations as story_core.apply_op, so an edit
+only reindexes the points it touches.
+
+Points are indexed under internal ids rather than their positions, so inserts
+and deletes do not have to renumber the points after them. Positions are
+worked out again only for the hits a query returns.
+
+Arcs can also be handed over with defer_arc, which indexes them on the first
+search instead, so loading a project does not pay for indexing it.
+"""
+import bisect
+import heapq
+import itertools
+import re
+
+from story_core import normalize_arc_data
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return {word.lower() for word in WORD_PATTERN.findall(text or "")}
+
+
+def text_matcher(query):
+    """Returns a function telling whether texts (title, description and label,
+    any of which may be None) match query the way SearchIndex.search matches
+    points, or None if query has no words."""
+    words = WORD_PATTERN.findall(query.lower())
+    if not words:
+        return None
+    *whole_words, prefix = words
+
+    def matches(*texts):
+        found = set().union(*(tokenize(text) for text in texts))
+        return all(word in found for word in whole_words) and any(word.startswith(prefix) for word in found)
+    return matches
+
+
+class SearchIndex:
+    """Inverted index over the titles, descriptions and labels of plot points."""
+
+    def __init__(self):
+        self.postings = {}  # {word: set of point ids}
+        self.words = []  # Sorted vocabulary, for prefix matching
+        self.point_words = {}  # {point id: set of words}
+        self.point_owners = {}  # {point id: (arc_title, main point id, side plot list or None)}
+        self.point_texts = {}  # {point id: title}
+        self.main_points = {}  # {arc_title: [main point ids]}, in plot order
+        self.side_points = {}  # {main point id: [[side point ids] per side plot]}
+        self.main_positions = {}  # {arc_title: {main point id: index}}, rebuilt after structural edits
+        self.deferred_arcs = {}  # {arc_title: arc_data} to index on the next search
+        self.ids = itertools.count()
+
+    def defer_arc(self, arc_title, arc_data):
+        """Indexes an arc on the next search. Until then operations on it are
+        ignored, as arc_data is expected to be kept up to date by the caller."""
+        self.remove_arc(arc_title)
+        self.deferred_arcs[arc_title] = arc_data
+
+    def add_arc(self, arc_title, arc_data):
+        """Indexes every point of an arc, in its in-memory form (see story_core.normalize_arc_data)."""
+        self.main_points[arc_title] = []
+        for main_index, (arc_main_id, point) in enumerate(arc_data['main_plot'].items()):
+            main_id = self._insert_main(arc_title, main_index, point)
+            for side_plot_index, points in sorted(arc_data['side_plots'].get(arc_main_id, {}).items()):
+                side_plot = []
+                self.side_points[main_id].append(side_plot)
+                for side_point in points:
+                    side_plot.append(self._add_point(arc_title, main_id, side_plot, side_point))
+
+    def remove_arc(self, arc_title):
+        self.deferred_arcs.pop(arc_title, None)
+        for main_id in self.main_points.pop(arc_title, []):
+            self._remove_main(main_id)
+        self.main_positions.pop(arc_title, None)
+
+    def apply_op(self, op):
+        """Updates the index for an edit operation (see story_core.apply_op)."""
+        kind = op['op']
+        arc_title = op['arc']
+        if arc_title in self.deferred_arcs and kind not in ('add_arc', 'delete_arc'):
+            return
+        if kind == 'add_arc':
+            self.remove_arc(arc_title)
+            # A shallow copy, as normalizing replaces the entries it converts
+            self.add_arc(arc_title, normalize_arc_data(dict(op['data'])))
+        elif kind == 'delete_arc':
+            self.remove_arc(arc_title)
+        elif kind == 'insert_main':
+            self._insert_main(arc_title, op['index'], op['point'])
+        elif kind == 'edit_main':
+            self._reindex(self.main_points[arc_title][op['index']], op['point'])
+        elif kind == 'delete_main':
+            self._remove_main(self.main_points[arc_title].pop(op['index']))
+            self.main_positions.pop(arc_title, None)
+        elif kind in ('add_side_plot', 'insert_side_plot'):
+            main_id = self.main_points[arc_title][op['main_index']]
+            side_plot = []
+            side_plots = self.side_points[main_id]
+            side_plots.insert(op.get('side_plot_index', len(side_plots) + 1) - 1, side_plot)
+            side_plot.append(self._add_point(arc_title, main_id, side_plot, op['point']))
+        elif kind in ('insert_side', 'edit_side', 'delete_side'):
+            main_id = self.main_points[arc_title][op['main_index']]
+            side_plot = self.side_points[main_id][op['side_plot_index'] - 1]
+            if kind == 'insert_side':
+                side_plot.insert(op['index'], self._add_point(arc_title, main_id, side_plot, op['point']))
+            elif kind == 'edit_side':
+                self._reindex(side_plot[op['index']], op['point'])
+            else:
+                self._remove_point(side_plot.pop(op['index']))
+                if not side_plot:
+                    # Later side plots move down one index, like in story_core.delete_side_point
+                    del self.side_points[main_id][op['side_plot_index'] - 1]
+
+    def search(self, query, limit=100):
+        """Returns up to limit hits for the points matching every word of query,
+        as (arc_title, main_index, side_plot_index, side_x_index, title) with
+        side_plot_index and side_x_index None for main plot points. The last
+        word also matches as a prefix, so results follow typing."""
+        words = WORD_PATTERN.findall(query.lower())
+        if not words:
+            return []
+        while self.deferred_arcs:
+            self.add_arc(*self.deferred_arcs.popitem())
+
+        matches = [self.postings.get(word, set()) for word in words[:-1]]
+        matches.append(self._prefix_matches(words[-1]))
+        matches.sort(key=len)
+        point_ids = set(matches[0])
+        for match in matches[1:]:
+            point_ids &= match
+            if not point_ids:
+                return []
+
+        hits = [self._resolve(point_id) for point_id in heapq.nsmallest(limit, point_ids)]
+        hits.sort(key=lambda hit: (hit[0], hit[1], hit[2] or 0, hit[3] or 0))
+        return hits
+
+    # --- Points ---
+
+    def _prefix_matches(self, prefix):
+        point_ids = set()
+        for i in range(bisect.bisect_left(self.words, prefix), len(self.words)):
+            if not self.words[i].startswith(prefix):
+                break
+            point_ids |= self.postings[self.words[i]]
+        return point_ids
+
+    def _insert_main(self, arc_title, index, point):
+        main_id = self._add_point(arc_title, None, None, point)
+        main_points = self.main_points.setdefault(arc_title, [])
+        main_points.insert(index, main_id)
+        self.side_points[main_id] = []
+        positions = self.main_positions.get(arc_title)
+        if positions is not None and index == len(main_points) - 1:
+            positions[main_id] = index  # Appending leaves the other positions as they are
+        else:
+            self.main_positions.pop(arc_title, None)
+        return main_id
+
+    def _remove_main(self, main_id):
+        for side_plot in self.side_points.pop(main_id):
+            for point_id in side_plot:
+                self._remove_point(point_id)
+        self._remove_point(main_id)
+
+    def _add_point(self, arc_title, main_id, side_plot, point):
+        point_id = next(self.ids)
+        self.point_owners[point_id] = (arc_title, main_id, side_plot)
+        self.point_words[point_id] = set()
+        self._reindex(point_id, point)
+        return point_id
+
+    def _remove_point(self, point_id):
+        self._index_words(point_id, set())
+        del self.point_words[point_id]
+        del self.point_owners[point_id]
+        del self.point_texts[point_id]
+
+    def _reindex(self, point_id, point):
+        """Indexes a point under the words of point ((title, description[, label]))."""
+        self.point_texts[point_id] = point[0]
+        self._index_words(point_id, set().union(*(tokenize(text) for text in point)))
+
+    def _index_words(self, point_id, words):
+        old_words = self.point_words[point_id]
+        for word in old_words - words:
+            posting = self.postings[word]
+            posting.discard(point_id)
+            if not posting:
+                del self.postings[word]
+                del self.words[bisect.bisect_left(self.words, word)]
+        for word in words - old_words:
+            if word not in self.postings:
+                self.postings[word] = set()
+                bisect.insort(self.words, word)
+            self.postings[word].add(point_id)
+        self.point_words[point_id] = words
+
+    def _resolve(self, point_id):
+        """Works out the current position of a point."""
+        arc_title, main_id, side_plot = self.point_owners[point_id]
+        positions = self.main_positions.get(arc_title)
+        if positions is None:
+            positions = {main: i for i, main in enumerate(self.main_points[arc_title])}
+            self.main_positions[arc_title] = positions
+        if main_id is None:
+            return arc_title, positions[point_id], None, None, self.point_texts[point_id]
+        side_plots = self.side_points[main_id]
+        side_plot_index = next(s for s, points in enumerate(side_plots, start=1) if points is side_plot)
+        return (arc_title, positions[main_id], side_plot_index, side_plot.index(point_id),
+                self.point_texts[point_id])
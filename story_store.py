@@ -0,0 +1,345 @@
+"""SQLite project format for StoryLined.
+
+A project database holds one row per arc, main plot point and side plot point,
+so arcs can be loaded one at a time and every edit is written as a small
+transaction instead of rewriting the whole project.
+
+Rows are ordered by a REAL position column. Inserting between two points
+takes the midpoint of their positions, so a positional insert writes a single
+row; positions are only renumbered once midpoints run out of precision.
+Side plot colors are kept on the main plot point they branch off.
+
+Convert between formats from the command line:
+    python story_store.py import story.json story.sqlite
+    python story_store.py export story.sqlite story.json
+"""
+import json
+import os
+import sqlite3
+import sys
+
+from story_core import new_arc_data, normalize_arc_data, save_story
+from story_search import text_matcher
+
+SQLITE_EXTENSIONS = ('.sqlite', '.db')
+
+# Gap between the positions of consecutive rows when they are (re)numbered
+POSITION_STEP = 1024.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS arcs (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE,
+    position REAL NOT NULL,
+    marker_style TEXT NOT NULL DEFAULT 'o',
+    background_image_path TEXT,
+    x_axis_labels TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS main_points (
+    id INTEGER PRIMARY KEY,
+    arc_id INTEGER NOT NULL REFERENCES arcs(id) ON DELETE CASCADE,
+    position REAL NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    label TEXT,
+    side_plot_color TEXT
+);
+CREATE INDEX IF NOT EXISTS main_points_by_position ON main_points(arc_id, position);
+CREATE TABLE IF NOT EXISTS side_points (
+    id INTEGER PRIMARY KEY,
+    arc_id INTEGER NOT NULL REFERENCES arcs(id) ON DELETE CASCADE,
+    main_id INTEGER NOT NULL REFERENCES main_points(id) ON DELETE CASCADE,
+    side_plot_index INTEGER NOT NULL,
+    position REAL NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS side_points_by_arc ON side_points(arc_id);
+CREATE INDEX IF NOT EXISTS side_points_by_position ON side_points(main_id, side_plot_index, position);
+"""
+
+
+def is_store_path(path):
+    return path.lower().endswith(SQLITE_EXTENSIONS)
+
+
+class ProjectStore:
+    """A StoryLined project kept in a SQLite database."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.arc_ids = dict(self.connection.execute("SELECT title, id FROM arcs"))
+        self.main_rows = {}  # {arc_id: [[position, main_id], ...]} in order, for arcs that were touched
+
+    @classmethod
+    def create(cls, path, arcs):
+        """Creates a new database at path holding arcs ({arc_title: arc data as
+        saved in project files}, see story_core.serialize_arc_data)."""
+        for file_path in (path, path + '-wal', path + '-shm'):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        store = cls(path)
+        with store.connection:
+            for arc_title, arc_data in arcs.items():
+                store._insert_arc(arc_title, arc_data)
+        return store
+
+    def close(self):
+        self.connection.close()
+
+    def __contains__(self, arc_title):
+        return arc_title in self.arc_ids
+
+    def arc_titles(self):
+        return [title for title, in self.connection.execute("SELECT title FROM arcs ORDER BY position")]
+
+    def load_arc(self, arc_title):
+        """Reads one arc into the in-memory form used by the GUI (see story_core.normalize_arc_data)."""
+        arc_id = self.arc_ids[arc_title]
+        marker_style, background_image_path, x_axis_labels = self.connection.execute(
+            "SELECT marker_style, background_image_path, x_axis_labels FROM arcs WHERE id = ?", (arc_id,)).fetchone()
+        arc_data = new_arc_data(marker_style)
+        arc_data['background_image_path'] = background_image_path
+        arc_data['x_axis_labels'] = json.loads(x_axis_labels)
+
+        main_indexes = {}  # {main_id: main_index}
+        rows = []
+        for position, main_id, title, description, label, color in self.connection.execute(
+                "SELECT position, id, title, description, label, side_plot_color FROM main_points "
+                "WHERE arc_id = ? ORDER BY position", (arc_id,)):
+            main_indexes[main_id] = len(arc_data['main_plot'])
+            arc_data['main_plot'].append((title, description, label))
+            if color:
+                arc_data['subplot_colors'][main_indexes[main_id]] = color
+            rows.append([position, main_id])
+        self.main_rows[arc_id] = rows
+
+        for main_id, side_plot_index, title, description in self.connection.execute(
+                "SELECT main_id, side_plot_index, title, description FROM side_points "
+                "WHERE arc_id = ? ORDER BY main_id, side_plot_index, position", (arc_id,)):
+            side_plot_data = arc_data['side_plots'].setdefault(main_indexes[main_id], {})
+            side_plot_data.setdefault(side_plot_index, []).append((title, description))
+        for main_index, side_plot_data in arc_data['side_plots'].items():
+            arc_data['side_plots'][main_index] = dict(sorted(side_plot_data.items()))
+            arc_data['side_plot_counts'][main_index] = len(side_plot_data)
+        arc_data['subplot_colors'] = {main_index: color for main_index, color in arc_data['subplot_colors'].items()
+                                      if main_index in arc_data['side_plots']}
+        return normalize_arc_data(arc_data)
+
+    def load_all(self):
+        return {arc_title: self.load_arc(arc_title) for arc_title in self.arc_titles()}
+
+    def search(self, query, arc_titles, limit=100):
+        """Returns up to limit hits for query in the arcs arc_titles, in the form
+        of story_search.SearchIndex.search. Reads the rows straight from the
+        database, so arcs that are not loaded can be searched without loading them."""
+        matches = text_matcher(query)
+        arc_ids = [self.arc_ids[arc_title] for arc_title in arc_titles if arc_title in self.arc_ids]
+        if not matches or not arc_ids:
+            return []
+        placeholders = ', '.join('?' * len(arc_ids))
+        titles = {arc_id: arc_title for arc_title, arc_id in self.arc_ids.items()}
+        hits = []
+        main_indexes = {}  # {main_id: main_index}
+        arc_id = main_index = None
+        for main_arc_id, main_id, title, description, label in self.connection.execute(
+                f"SELECT arc_id, id, title, description, label FROM main_points "
+                f"WHERE arc_id IN ({placeholders}) ORDER BY arc_id, position", arc_ids):
+            main_index = main_index + 1 if main_arc_id == arc_id else 0
+            arc_id = main_arc_id
+            main_indexes[main_id] = main_index
+            if matches(title, description, label):
+                hits.append((titles[arc_id], main_index, None, None, title))
+        side_plot = side_x_index = None
+        for arc_id, main_id, side_plot_index, title, description in self.connection.execute(
+                f"SELECT arc_id, main_id, side_plot_index, title, description FROM side_points "
+                f"WHERE arc_id IN ({placeholders}) ORDER BY main_id, side_plot_index, position", arc_ids):
+            side_x_index = side_x_index + 1 if (main_id, side_plot_index) == side_plot else 0
+            side_plot = (main_id, side_plot_index)
+            if matches(title, description):
+                hits.append((titles[arc_id], main_indexes[main_id], side_plot_index, side_x_index, title))
+        hits.sort(key=lambda hit: (hit[0], hit[1], hit[2] or 0, hit[3] or 0))
+        return hits[:limit]
+
+    def apply_op(self, op):
+        """Writes an edit operation (see story_core.apply_op) in one transaction."""
+        kind = op['op']
+        with self.connection:
+            if kind == 'add_arc':
+                self._insert_arc(op['arc'], op['data'])
+                return
+            arc_id = self.arc_ids[op['arc']]
+            if kind == 'delete_arc':
+                self.connection.execute("DELETE FROM arcs WHERE id = ?", (arc_id,))
+                del self.arc_ids[op['arc']]
+                self.main_rows.pop(arc_id, None)
+            elif kind == 'insert_main':
+                self._insert_main(arc_id, op['index'], op['point'])
+            elif kind == 'edit_main':
+                title, description, label = op['point']
+                self.connection.execute("UPDATE main_points SET title = ?, description = ?, label = ? WHERE id = ?",
+                                        (title, description, label, self._main_id(arc_id, op['index'])))
+            elif kind == 'delete_main':
+                main_id = self._main_id(arc_id, op['index'])
+                self.connection.execute("DELETE FROM main_points WHERE id = ?", (main_id,))
+                del self._main_rows(arc_id)[op['index']]
+            elif kind in ('add_side_plot', 'insert_side_plot'):
+                main_id = self._main_id(arc_id, op['main_index'])
+                if kind == 'add_side_plot':
+                    side_plot_index, = self.connection.execute(
+                        "SELECT COALESCE(MAX(side_plot_index), 0) + 1 FROM side_points WHERE main_id = ?",
+                        (main_id,)).fetchone()
+                else:
+                    side_plot_index = op['side_plot_index']
+                    self.connection.execute("UPDATE side_points SET side_plot_index = side_plot_index + 1 "
+                                            "WHERE main_id = ? AND side_plot_index >= ?", (main_id, side_plot_index))
+                self.connection.execute("UPDATE main_points SET side_plot_color = COALESCE(side_plot_color, ?) "
+                                        "WHERE id = ?", (op.get('color') or "red", main_id))
+                self._insert_side(arc_id, main_id, side_plot_index, 0, op['point'])
+            elif kind == 'insert_side':
+                self._insert_side(arc_id, self._main_id(arc_id, op['main_index']), op['side_plot_index'],
+                                  op['index'], op['point'])
+            elif kind == 'edit_side':
+                main_id = self._main_id(arc_id, op['main_index'])
+                _, side_id = self._side_rows(main_id, op['side_plot_index'])[op['index']]
+                title, description = op['point']
+                self.connection.execute("UPDATE side_points SET title = ?, description = ? WHERE id = ?",
+                                        (title, description, side_id))
+            elif kind == 'delete_side':
+                self._delete_side(self._main_id(arc_id, op['main_index']), op['side_plot_index'], op['index'])
+            elif kind == 'set_marker':
+                self.connection.execute("UPDATE arcs SET marker_style = ? WHERE id = ?", (op['marker_style'], arc_id))
+            elif kind == 'set_background':
+                self.connection.execute("UPDATE arcs SET background_image_path = ? WHERE id = ?", (op['path'], arc_id))
+            else:
+                raise ValueError(f"Unknown operation: {kind}")
+
+    # --- Rows ---
+
+    def _insert_arc(self, arc_title, arc_data):
+        position, = self.connection.execute("SELECT COALESCE(MAX(position), 0) + ? FROM arcs",
+                                            (POSITION_STEP,)).fetchone()
+        cursor = self.connection.execute(
+            "INSERT INTO arcs (title, position, marker_style, background_image_path, x_axis_labels) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (arc_title, position, arc_data.get('marker_style', 'o'), arc_data.get('background_image_path'),
+             json.dumps(arc_data.get('x_axis_labels', {}))))
+        arc_id = cursor.lastrowid
+        self.arc_ids[arc_title] = arc_id
+
+        # Keys are ints in memory but strings in data that went through JSON
+        side_plots = {int(key): value for key, value in arc_data.get('side_plots', {}).items()}
+        subplot_colors = {int(key): value for key, value in arc_data.get('subplot_colors', {}).items()}
+        rows = []
+        for main_index, (title, description, label) in enumerate(arc_data.get('main_plot', [])):
+            position = (main_index + 1) * POSITION_STEP
+            main_id = self.connection.execute(
+                "INSERT INTO main_points (arc_id, position, title, description, label, side_plot_color) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (arc_id, position, title, description, label,
+                 subplot_colors.get(main_index) if main_index in side_plots else None)).lastrowid
+            rows.append([position, main_id])
+            self.connection.executemany(
+                "INSERT INTO side_points (arc_id, main_id, side_plot_index, position, title, description) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(arc_id, main_id, int(side_plot_index), (j + 1) * POSITION_STEP, side_title, side_description)
+                 for side_plot_index, points in side_plots.get(main_index, {}).items()
+                 for j, (side_title, side_description) in enumerate(points)])
+        self.main_rows[arc_id] = rows
+
+    def _main_rows(self, arc_id):
+        if arc_id not in self.main_rows:
+            self.main_rows[arc_id] = [list(row) for row in self.connection.execute(
+                "SELECT position, id FROM main_points WHERE arc_id = ? ORDER BY position", (arc_id,))]
+        return self.main_rows[arc_id]
+
+    def _main_id(self, arc_id, main_index):
+        return self._main_rows(arc_id)[main_index][1]
+
+    def _insert_main(self, arc_id, index, point):
+        rows = self._main_rows(arc_id)
+        position = self._position_at(rows, index)
+        if position is None:
+            self._renumber(rows, "main_points")
+            position = self._position_at(rows, index)
+        title, description, label = point
+        main_id = self.connection.execute(
+            "INSERT INTO main_points (arc_id, position, title, description, label) VALUES (?, ?, ?, ?, ?)",
+            (arc_id, position, title, description, label)).lastrowid
+        rows.insert(index, [position, main_id])
+
+    def _side_rows(self, main_id, side_plot_index):
+        return [list(row) for row in self.connection.execute(
+            "SELECT position, id FROM side_points WHERE main_id = ? AND side_plot_index = ? ORDER BY position",
+            (main_id, side_plot_index))]
+
+    def _insert_side(self, arc_id, main_id, side_plot_index, index, point):
+        rows = self._side_rows(main_id, side_plot_index)
+        position = self._position_at(rows, index)
+        if position is None:
+            self._renumber(rows, "side_points")
+            position = self._position_at(rows, index)
+        title, description = point
+        self.connection.execute(
+            "INSERT INTO side_points (arc_id, main_id, side_plot_index, position, title, description) "
+            "VALUES (?, ?, ?, ?, ?, ?)", (arc_id, main_id, side_plot_index, position, title, description))
+
+    def _delete_side(self, main_id, side_plot_index, index):
+        rows = self._side_rows(main_id, side_plot_index)
+        self.connection.execute("DELETE FROM side_points WHERE id = ?", (rows[index][1],))
+        if len(rows) > 1:
+            return
+        # The side plot is now empty: close the gap in the side plot indexes
+        self.connection.execute("UPDATE side_points SET side_plot_index = side_plot_index - 1 "
+                                "WHERE main_id = ? AND side_plot_index > ?", (main_id, side_plot_index))
+        remaining, = self.connection.execute("SELECT COUNT(*) FROM side_points WHERE main_id = ?",
+                                             (main_id,)).fetchone()
+        if not remaining:
+            self.connection.execute("UPDATE main_points SET side_plot_color = NULL WHERE id = ?", (main_id,))
+
+    @staticmethod
+    def _position_at(rows, index):
+        """Returns a position that sorts a new row at index among rows
+        ([[position, id], ...]), or None if the neighbours are too close."""
+        if not rows:
+            return POSITION_STEP
+        if index >= len(rows):
+            return rows[-1][0] + POSITION_STEP
+        if index == 0:
+            return rows[0][0] - POSITION_STEP
+        low, high = rows[index - 1][0], rows[index][0]
+        position = (low + high) / 2
+        return position if low < position < high else None
+
+    def _renumber(self, rows, table):
+        for i, row in enumerate(rows):
+            row[0] = (i + 1) * POSITION_STEP
+        self.connection.executemany(f"UPDATE {table} SET position = ? WHERE id = ?", rows)
+
+
+def import_json(json_path, store_path):
+    """Converts a JSON project file to a project database."""
+    with open(json_path, 'r') as f:
+        arcs = json.load(f)
+    ProjectStore.create(store_path, arcs).close()
+
+
+def export_json(store_path, json_path):
+    """Converts a project database to a JSON project file."""
+    store = ProjectStore(store_path)
+    try:
+        save_story(store.load_all(), json_path)
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] not in ('import', 'export'):
+        print("usage: python story_store.py import|export <source> <destination>")
+        sys.exit(2)
+    (import_json if sys.argv[1] == 'import' else export_json)(sys.argv[2], sys.argv[3])
@@ -0,0 +1,108 @@
+"""Optional timing instrumentation for StoryLined.
+
+Code on the hot paths wraps its work in tracer.span(name) and bumps counters
+with tracer.count(name). While the tracer is disabled (the default) both return
+at once. Once enabled, every span is kept as a Chrome trace event, so a trace
+can be exported with export_chrome_trace and opened in chrome://tracing or
+https://ui.perfetto.dev, and a summary of last and average timings is kept
+for the live overlay of the GUI.
+
+Tracing is turned on by setting the STORYLINED_TRACE environment variable (to
+1, or to the path the trace is written to on quit) or the "trace" key of
+presets.json.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_ENV = 'STORYLINED_TRACE'
+
+# Oldest events are dropped beyond this many, so a long session cannot use unbounded memory
+MAX_TRACE_EVENTS = 200000
+
+
+class Tracer:
+    """Collects timing spans and counters."""
+
+    def __init__(self, max_events=MAX_TRACE_EVENTS):
+        self.enabled = False
+        self.events = deque(maxlen=max_events)  # Chrome trace events
+        self.timings = {}  # {span name: [count, total seconds, last seconds]}
+        self.counters = {}  # {counter name: value}
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()  # Spans are also recorded from loader threads
+
+    @contextmanager
+    def span(self, name):
+        """Times the enclosed block under name."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, start, time.perf_counter())
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def sample_counters(self):
+        """Adds the current counter values to the trace, where viewers show them as graphs."""
+        if self.enabled and self.counters:
+            with self.lock:
+                self.events.append({'name': 'counters', 'ph': 'C', 'ts': self._timestamp(time.perf_counter()),
+                                    'pid': os.getpid(), 'tid': threading.get_ident(), 'args': dict(self.counters)})
+
+    def summary(self):
+        """Returns one line per span (last and average time) and per counter."""
+        with self.lock:
+            lines = [f"{name}: last {last * 1000:.1f} ms, avg {total / count * 1000:.1f} ms ({count}x)"
+                     for name, (count, total, last) in sorted(self.timings.items())]
+            lines.extend(f"{name}: {value}" for name, value in sorted(self.counters.items()))
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path):
+        """Writes the collected events as Chrome trace-event JSON."""
+        self.sample_counters()
+        with self.lock:
+            events = list(self.events)
+        thread_names = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread.ident,
+                         'args': {'name': thread.name}} for thread in threading.enumerate()]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': thread_names + events, 'displayTimeUnit': 'ms'}, f)
+
+    def _timestamp(self, seconds):
+        return (seconds - self.origin) * 1e6  # Microseconds, as trace events expect
+
+    def _record(self, name, start, end):
+        with self.lock:
+            self.events.append({'name': name, 'ph': 'X', 'ts': self._timestamp(start), 'dur': (end - start) * 1e6,
+                                'pid': os.getpid(), 'tid': threading.get_ident()})
+            timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += end - start
+            timing[2] = end - start
+
+
+def traced(name):
+    """Decorator timing every call of a function as a span."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Process-wide tracer, shared by the GUI and the headless core
+tracer = Tracer()
@@ -0,0 +1,85 @@
+"""Watches a JSON project file for changes made by other programs.
+
+A ProjectWatcher thread polls the file's modification time and size. When
+they change, it reads and parses the file and compares every arc with the
+version it read before, so only the arcs whose saved data differ are passed
+on, already normalized (see story_core.normalize_arc_data). The GUI then
+diffs those arcs point by point against its own (see story_core.diff_arc_ops).
+
+Polling is used rather than inotify and the like, as it needs nothing beyond
+the standard library and works the same on every platform; a stat call per
+interval costs next to nothing.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+
+from story_core import normalize_arc_data
+
+# How often the project file is checked for changes
+WATCH_INTERVAL_SECONDS = 1.0
+
+
+class ProjectWatcher:
+    """Reports changes to a project file on its changes queue as
+    (digest, {arc_title: arc data, or None if the arc was removed}), with
+    digest the SHA-1 of the file contents they were read from."""
+
+    def __init__(self, project_path, base, interval=WATCH_INTERVAL_SECONDS):
+        """base is the SHA-1 of the project file as it was loaded. If the file
+        on disk no longer matches it, every arc is reported once."""
+        self.project_path = project_path
+        self.interval = interval
+        self.changes = queue.Queue()
+        self.digest = base
+        self.arcs = None  # {arc_title: saved data} as last read, None until the first read
+        self.stat = None  # (modification time, size) as last read
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="ProjectWatcher", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                self._check()
+            except Exception as e:
+                print(f"Watching {self.project_path} failed: {e}")
+            if self.stopped.wait(self.interval):
+                return
+
+    def _check(self):
+        try:
+            stat = os.stat(self.project_path)
+            if (stat.st_mtime_ns, stat.st_size) == self.stat:
+                return
+            with open(self.project_path, 'rb') as f:
+                snapshot = f.read()
+        except OSError:
+            return  # Moved away or being replaced; checked again next time
+        self.stat = (stat.st_mtime_ns, stat.st_size)
+        digest = hashlib.sha1(snapshot).hexdigest()
+        if digest == self.digest and self.arcs is not None:
+            return
+        try:
+            loaded = json.loads(snapshot)
+        except ValueError:
+            return  # Still being written by the other program; picked up once it is done
+
+        if self.arcs is None:
+            # The first read only sets what later reads are compared with, unless the file already changed
+            changed = loaded if digest != self.digest else {}
+        else:
+            changed = {arc_title: data for arc_title, data in loaded.items() if self.arcs.get(arc_title) != data}
+        removed = [arc_title for arc_title in self.arcs or () if arc_title not in loaded]
+        self.digest, self.arcs = digest, loaded
+        if changed or removed:
+            # A shallow copy, as normalizing replaces the entries it converts and the parsed data is kept
+            update = {arc_title: normalize_arc_data(dict(data)) for arc_title, data in changed.items()}
+            update.update((arc_title, None) for arc_title in removed)
+            self.changes.put((digest, update))